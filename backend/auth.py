@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, NamedTuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
@@ -11,15 +11,33 @@ from dotenv import load_dotenv
 from database import get_db
 from models import models
 import crud
+from user_cache import user_cache
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Put the user's ID, role and name in the token so read-only endpoints skip the user lookup.
+# A role change or deletion then takes effect only when the user's current token expires.
+TOKEN_CLAIMS = os.getenv("AUTH_TOKEN_CLAIMS", "false").lower() == "true"
 
 security = HTTPBearer()
 
+class TokenUser(NamedTuple):
+    """The fields of the authenticated user that read-only endpoints need."""
+    id: str
+    email: str
+    role: str
+    name: str
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -30,34 +48,47 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+def token_data(user: models.User) -> dict:
+    """Claims for a user's access token: the subject, plus the user's fields if AUTH_TOKEN_CLAIMS is on."""
+    data = {"sub": user.email}
+    if TOKEN_CLAIMS:
+        data.update({"uid": user.id, "role": user.role, "name": user.name})
+    return data
+
+def decode_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return email
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+def verify_token(payload: dict = Depends(decode_token)) -> str:
+    return payload["sub"]
 
 def get_current_user(db: Session = Depends(get_db), email: str = Depends(verify_token)) -> models.User:
+    # A cached user is attached to this request's session without querying the database
+    cached = user_cache.get(email)
+    if cached is not None:
+        return db.merge(cached, load=False)
+    
     user = crud.get_user_by_email(db, email=email)
     if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception()
+    user_cache.put(user)
     return user
 
+def get_current_claims(db: Session = Depends(get_db), payload: dict = Depends(decode_token)) -> TokenUser:
+    """
+    The authenticated user for read-only endpoints. Taken from the token's signed claims
+    when it carries them, otherwise from the user cache or the database.
+    """
+    if TOKEN_CLAIMS and all(payload.get(claim) for claim in ("uid", "role", "name")):
+        return TokenUser(id=payload["uid"], email=payload["sub"], role=payload["role"], name=payload["name"])
+    user = get_current_user(db, payload["sub"])
+    return TokenUser(id=user.id, email=user.email, role=user.role, name=user.name)
+
 def get_current_seller(current_user: models.User = Depends(get_current_user)) -> models.User:
     if current_user.role != "seller":
         raise HTTPException(
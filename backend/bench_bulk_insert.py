@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark row-at-a-time vs single-transaction bulk inserts.
+
+Inserts a synthetic question upload and the chunk rows of a large processed document
+into a temporary database both ways and reports rows/s. No OpenAI calls are made.
+
+Usage:
+    python bench_bulk_insert.py --questions 1000 --chunks 5000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+# Add the backend directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+WORK_DIR = tempfile.mkdtemp(prefix="bench_bulk_insert_")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/bench.db"
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from database import SessionLocal, engine
+from models import models
+from services.question_processor import question_processor
+import crud
+
+
+def question_entries(count):
+    return [
+        {
+            "title": f"Question {i}",
+            "content": f"Please provide the signed lease agreement and rent roll for property number {i}.",
+            "priority": "medium",
+            "tags": ["legal", f"source:list-{i % 5}.xlsx"],
+            "duplicate_of_id": None,
+            "duplicate_of_index": None
+        }
+        for i in range(count)
+    ]
+
+
+def chunk_rows(document_id, count):
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "document_id": document_id,
+            "chunk_index": i,
+            "content": f"Section {i}. " + "The lessee shall maintain the premises in good repair. " * 18,
+            "start_position": i * 800,
+            "end_position": i * 800 + 1000,
+            "chunk_length": 1000,
+            "embedding_id": None
+        }
+        for i in range(count)
+    ]
+
+
+def add_document(db, user):
+    document = models.Document(id=str(uuid.uuid4()), name="bench.pdf", size=0, type="application/pdf", content="",
+                               tags="[]", uploaded_by_id=user.id, processing_status="processing")
+    db.add(document)
+    db.commit()
+    return document
+
+
+def report(label, rows, elapsed):
+    print(f"{label:<28}{rows:>8}{elapsed:>10.3f}{rows / elapsed:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=1000)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per INSERT executemany")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(id=str(uuid.uuid4()), email="bench@example.com", name="Bench", role="buyer", hashed_password="-")
+    db.add(user)
+    db.commit()
+
+    try:
+        print(f"{'path':<28}{'rows':>8}{'seconds':>10}{'rows/s':>12}")
+        entries = question_entries(args.questions)
+
+        start = time.perf_counter()
+        rows = question_processor._create_questions_one_by_one(db, entries, user.id)
+        report("questions, one per commit", len(rows), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        rows = crud.create_questions_bulk(db, entries, user.id, batch_size=args.batch_size)
+        report("questions, bulk", len(rows), time.perf_counter() - start)
+
+        # Previous path: one ORM object per chunk through the unit of work
+        document = add_document(db, user)
+        rows = chunk_rows(document.id, args.chunks)
+        start = time.perf_counter()
+        for row in rows:
+            db.add(models.DocumentChunk(**row))
+        document.processing_status = "completed"
+        db.commit()
+        report("chunks, ORM add", len(rows), time.perf_counter() - start)
+
+        document = add_document(db, user)
+        rows = chunk_rows(document.id, args.chunks)
+        start = time.perf_counter()
+        crud.insert_document_chunks(db, rows, batch_size=args.batch_size)
+        document.processing_status = "completed"
+        db.commit()
+        report("chunks, bulk", len(rows), time.perf_counter() - start)
+    finally:
+        db.close()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
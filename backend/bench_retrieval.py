@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark flat vs hierarchical (document-then-chunk) retrieval.
+
+Builds a synthetic data room in a temporary database and Chroma directory: each
+document has its own topic direction and its chunks are noisy variants of it, with
+queries drawn from random chunks. Recall@k is measured against exact brute-force
+search, so no OpenAI calls are made.
+
+Usage:
+    python bench_retrieval.py --documents 500 --chunks-per-document 40 --fan-out 5 10 20 50
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+# Add the backend directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+WORK_DIR = tempfile.mkdtemp(prefix="bench_retrieval_")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/bench.db"
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from database import SessionLocal, engine
+from models import models
+from services.document_processor import DocumentProcessor
+
+
+def build_corpus(doc_processor, db, documents, chunks_per_document, dimensions, noise, rng):
+    user = models.User(id=str(uuid.uuid4()), email="bench@example.com", name="Bench", role="seller", hashed_password="-")
+    db.add(user)
+    db.commit()
+
+    all_ids, all_vectors = [], []
+    for d in range(documents):
+        document_id = str(uuid.uuid4())
+        db.add(models.Document(id=document_id, name=f"doc-{d}.txt", size=0, type="text/plain", content="",
+                               tags="[]", uploaded_by_id=user.id, processing_status="completed"))
+        topic = rng.normal(size=dimensions)
+        vectors = topic + noise * rng.normal(size=(chunks_per_document, dimensions))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = [f"{document_id}_chunk_{i}" for i in range(chunks_per_document)]
+        doc_processor.collection.add(
+            ids=ids,
+            embeddings=vectors.tolist(),
+            documents=[f"chunk {i} of document {d}" for i in range(chunks_per_document)],
+            metadatas=[{"document_id": document_id, "document_name": f"doc-{d}.txt", "chunk_index": i}
+                       for i in range(chunks_per_document)]
+        )
+        all_ids.extend(ids)
+        all_vectors.append(vectors)
+    db.commit()
+    return all_ids, np.vstack(all_vectors).astype(np.float32)
+
+
+def timed_search(doc_processor, queries, k, fan_out=None):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        if fan_out:
+            hits = doc_processor.document_index.search(query, k=k, fan_out=fan_out)
+        else:
+            hits = doc_processor.search_by_vector(query, k=k)
+        latencies.append(time.perf_counter() - start)
+        results.append([hit["chunk_id"] for hit in hits])
+    return results, np.array(latencies) * 1000
+
+
+def recall(results, truth):
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=300)
+    parser.add_argument("--chunks-per-document", type=int, default=40)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=1.0, help="Chunk spread around the document topic")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--fan-out", type=int, nargs="+", default=[5, 10, 20, 50])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    doc_processor = DocumentProcessor(chroma_db_path=os.path.join(WORK_DIR, "chroma"), collection_name="bench_chunks")
+
+    try:
+        print(f"Building {args.documents} documents x {args.chunks_per_document} chunks ...")
+        chunk_ids, chunk_matrix = build_corpus(
+            doc_processor, db, args.documents, args.chunks_per_document, args.dimensions, args.noise, rng
+        )
+        start = time.perf_counter()
+        for document_id, in db.query(models.Document.id).all():
+            doc_processor.document_index.compute_document_embedding(db, document_id)
+        print(f"Indexed document centroids in {time.perf_counter() - start:.2f}s")
+
+        picks = rng.choice(len(chunk_ids), size=args.queries, replace=False)
+        queries = chunk_matrix[picks] + 0.3 * rng.normal(size=(args.queries, args.dimensions)).astype(np.float32)
+        exact = np.argsort(-(queries @ chunk_matrix.T), axis=1)[:, :args.k]
+        truth = [[chunk_ids[i] for i in row] for row in exact]
+
+        # Warm the flat path and the document index so the timings exclude loading them
+        timed_search(doc_processor, queries[:3], args.k)
+        doc_processor.document_index.candidate_documents(queries[0], 1)
+
+        def report(label, results, latencies):
+            print(f"{label:<34}{recall(results, truth):>10.3f}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}")
+
+        print(f"\n{'mode':<34}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}")
+        report("flat", *timed_search(doc_processor, queries, args.k))
+        for fan_out in args.fan_out:
+            # Cold: every candidate's chunks are read from Chroma; warm: served from the chunk cache
+            doc_processor.document_index._chunk_cache.clear()
+            doc_processor.document_index.chunk_cache_documents = 0
+            report(f"hierarchical fan-out {fan_out} (cold)", *timed_search(doc_processor, queries, args.k, fan_out=fan_out))
+            doc_processor.document_index.chunk_cache_documents = args.documents
+            timed_search(doc_processor, queries, args.k, fan_out=fan_out)
+            report(f"hierarchical fan-out {fan_out} (warm)", *timed_search(doc_processor, queries, args.k, fan_out=fan_out))
+    finally:
+        db.close()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark list-endpoint serialization: ORM objects + response models vs row projections.
+
+Seeds questions (half of them answered, with related documents) and documents into a
+temporary database, then builds one page of each list endpoint's JSON body both ways:
+
+  orm + pydantic   ORM entities with relationships loaded, one response model per row,
+                   then FastAPI's response_model validation and encoding
+  projection       crud.get_question_rows / get_document_rows dicts encoded directly
+                   with FastJSONResponse (orjson when installed)
+
+Query and serialization time are reported separately, in ms per 1,000 rows.
+
+Usage:
+    python bench_serialization.py --rows 5000 --repeat 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+# Add the backend directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+WORK_DIR = tempfile.mkdtemp(prefix="bench_serialization_")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/bench.db"
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+
+import crud
+import fast_json
+from database import SessionLocal, engine
+from fast_json import FastJSONResponse
+from models import models, schemas
+
+
+def seed(db, rows):
+    users = [{"id": str(uuid.uuid4()), "email": f"bench{i}@example.com", "name": f"Bench User {i}",
+              "role": "seller" if i % 2 else "buyer", "hashed_password": "-"} for i in range(10)]
+    db.execute(insert(models.User.__table__), users)
+    start = datetime(2026, 1, 1)
+    documents = [
+        {"id": str(uuid.uuid4()), "name": f"document-{i}.pdf", "size": 1000 + i, "type": "application/pdf",
+         "content": "x" * 2000, "tags": json.dumps(["legal", "finance"][:i % 3]), "uploaded_by_id": users[i % 10]["id"],
+         "uploaded_at": start + timedelta(seconds=i), "summary": "A short summary of the document." if i % 2 else None}
+        for i in range(rows)
+    ]
+    db.execute(insert(models.Document.__table__), documents)
+    questions = [
+        {"id": str(uuid.uuid4()), "title": f"Question {i}", "content": "What are the termination clauses? " * 3,
+         "status": "answered" if i % 2 else "pending", "priority": "medium", "tags": json.dumps(["legal", "hr"][:i % 3]),
+         "asked_by_id": users[i % 10]["id"], "asked_at": start + timedelta(seconds=i),
+         "answer": "See section 12 of the master agreement." if i % 2 else None,
+         "answered_by_id": users[1]["id"] if i % 2 else None, "answered_at": start + timedelta(days=1) if i % 2 else None}
+        for i in range(rows)
+    ]
+    db.execute(insert(models.Question.__table__), questions)
+    links = [{"question_id": q["id"], "document_id": documents[(i + j) % rows]["id"]}
+             for i, q in enumerate(questions) if i % 2 for j in range(2)]
+    db.execute(insert(models.question_documents), links)
+    db.commit()
+
+
+def legacy_questions(db, rows):
+    questions = crud.get_questions(db, limit=rows, with_relations=True)
+    return questions, lambda: [
+        schemas.QuestionResponse(
+            id=q.id, title=q.title, content=q.content, status=q.status, priority=q.priority,
+            tags=json.loads(q.tags), asked_by=q.asker.name, asked_at=q.asked_at, answer=q.answer,
+            answered_by=q.answerer.name if q.answerer else None, answered_at=q.answered_at,
+            related_documents=[doc.id for doc in q.related_documents], duplicate_of=q.duplicate_of_id
+        )
+        for q in questions
+    ]
+
+
+def legacy_documents(db, rows):
+    documents = crud.get_documents(db, limit=rows)
+    return documents, lambda: [
+        schemas.DocumentResponse(
+            id=doc.id, name=doc.name, size=doc.size, type=doc.type, tags=json.loads(doc.tags),
+            uploaded_by=doc.uploader.name, uploaded_at=doc.uploaded_at, summary=doc.summary
+        )
+        for doc in documents
+    ]
+
+
+def measure(build, repeat):
+    """Median (query seconds, serialization seconds, body bytes) over fresh sessions."""
+    queries, serializations = [], []
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            serialize = build(db)
+            queried = time.perf_counter()
+            body = serialize()
+            serializations.append(time.perf_counter() - queried)
+            queries.append(queried - start)
+        finally:
+            db.close()
+    return statistics.median(queries), statistics.median(serializations), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000, help="Questions and documents seeded and listed in one page")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        seed(db, args.rows)
+    finally:
+        db.close()
+    
+    question_adapter = TypeAdapter(List[schemas.QuestionResponse])
+    document_adapter = TypeAdapter(List[schemas.DocumentResponse])
+    
+    def orm_pydantic(legacy, adapter):
+        def build(db):
+            _, responses = legacy(db, args.rows)
+            # What FastAPI does with a response_model: validate the returned objects again, then encode
+            return lambda: JSONResponse(adapter.dump_python(
+                adapter.validate_python(responses(), from_attributes=True), mode="json"
+            )).body
+        return build
+    
+    def projection(rows_query):
+        def build(db):
+            rows = rows_query(db, limit=args.rows)
+            return lambda: FastJSONResponse(rows).body
+        return build
+    
+    cases = [
+        ("questions", "orm + pydantic", orm_pydantic(legacy_questions, question_adapter)),
+        ("questions", "projection", projection(crud.get_question_rows)),
+        ("documents", "orm + pydantic", orm_pydantic(legacy_documents, document_adapter)),
+        ("documents", "projection", projection(crud.get_document_rows)),
+    ]
+    
+    try:
+        encoder = "orjson" if fast_json.orjson is not None else "json (orjson not installed)"
+        print(f"{args.rows} rows per page, FastJSONResponse encoder: {encoder}")
+        print(f"\n{'endpoint':<12}{'path':<18}{'query ms/1k':>14}{'serialize ms/1k':>18}{'total ms/1k':>14}{'body KB':>10}")
+        per_thousand = 1000.0 / args.rows * 1000
+        for endpoint, label, build in cases:
+            measure(build, 1)  # warm up
+            query_s, serialize_s, size = measure(build, args.repeat)
+            print(f"{endpoint:<12}{label:<18}{query_s * per_thousand:>14.1f}{serialize_s * per_thousand:>18.1f}"
+                  f"{(query_s + serialize_s) * per_thousand:>14.1f}{size / 1024:>10.0f}")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
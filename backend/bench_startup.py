@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark API startup: import time and first-request latency.
+
+Each run starts a fresh interpreter in a temporary directory (own SQLite database and
+Chroma directory) and measures, in order: `import main`, the first GET /health (which
+also runs the startup events), the first authenticated list request and the first AI
+request (GET /ai/rag-status, which builds the RAG services). No OpenAI calls are made.
+With --top, the slowest imports under `main` (from `python -X importtime`) are listed too.
+
+Usage:
+    python bench_startup.py --runs 5 --top 15
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = [
+    ("import_main", "import main"),
+    ("first_health", "first GET /health"),
+    ("first_list", "first GET /documents/"),
+    ("first_ai", "first GET /ai/rag-status"),
+]
+
+
+def child(import_only=False):
+    import time
+    start = time.perf_counter()
+    import main
+    timings = {"import_main": time.perf_counter() - start}
+    if import_only:
+        return
+    
+    import auth
+    import crud
+    from database import SessionLocal
+    from fastapi.testclient import TestClient
+    from models import schemas
+    
+    db = SessionLocal()
+    user = crud.create_user(db, schemas.UserCreate(email="bench@example.com", name="Bench", role="seller", password="bench"))
+    db.close()
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': user.email})}"}
+    
+    with TestClient(main.app) as client:
+        for stage, path in [("first_health", "/health"), ("first_list", "/documents/"), ("first_ai", "/ai/rag-status")]:
+            start = time.perf_counter()
+            response = client.get(path, headers=headers)
+            timings[stage] = time.perf_counter() - start
+            if response.status_code != 200:
+                timings[f"{stage}_status"] = response.status_code
+    print(json.dumps(timings))
+
+
+def run_child(python_args=None, child_args=None):
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "DATABASE_URL": f"sqlite:///{work_dir}/bench.db",
+        "JOB_WORKERS": "0"
+    }
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    try:
+        return subprocess.run(
+            [sys.executable, *(python_args or []), os.path.abspath(__file__), "--child", *(child_args or [])],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def slowest_imports(stderr, top):
+    """(cumulative seconds, module) for the slowest modules in -X importtime output, excluding main itself."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and name.strip() != "main":
+            rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="List the N slowest imports")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--import-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child(args.import_only)
+        return
+    
+    results = []
+    for _ in range(args.runs):
+        output = run_child().stdout.strip().splitlines()[-1]
+        results.append(json.loads(output))
+    
+    print(f"{'stage':<28}{'median s':>10}{'min s':>10}{'max s':>10}")
+    for stage, label in STAGES:
+        values = [r[stage] for r in results]
+        print(f"{label:<28}{statistics.median(values):>10.3f}{min(values):>10.3f}{max(values):>10.3f}")
+    for stage, label in STAGES:
+        failed = [r[f"{stage}_status"] for r in results if f"{stage}_status" in r]
+        if failed:
+            print(f"warning: {label} returned status {failed[0]}")
+    
+    if args.top:
+        print("\nSlowest imports (cumulative s):")
+        for seconds, module in slowest_imports(run_child(["-X", "importtime"], ["--import-only"]).stderr, args.top):
+            print(f"  {seconds:>7.3f}  {module}")
+
+
+if __name__ == "__main__":
+    main()
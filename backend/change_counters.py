@@ -0,0 +1,112 @@
+"""
+Monotonic change counters for the questions, documents and chunks tables.
+
+Every transaction that writes one of the tracked tables increments the matching row
+of `change_counters` once, inside the same transaction, so the new version becomes
+visible exactly when the write does, in every process sharing the database. ORM
+flushes are tracked from the session's new, dirty and deleted objects. Statements
+run through Session.execute (bulk inserts, query.update/delete) are tracked from
+their target table. SQL sent straight to an engine connection is not tracked.
+
+The counters a transaction touched are collected as it runs and incremented just
+before it commits, one row at a time in name order. Each counter row is then locked
+only for the commit, and two transactions always lock them in the same order, so
+they cannot deadlock on them.
+
+List and detail endpoints use the versions as ETag inputs and as response cache keys,
+see response_cache.py.
+"""
+from typing import Iterable
+
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+
+from models import models
+
+COUNTERS = ("questions", "documents", "chunks")
+
+# Counters whose responses change when a table is written; user names appear in both lists
+TABLE_COUNTERS = {
+    "questions": ("questions",),
+    "question_tags": ("questions",),
+    "question_documents": ("questions",),
+    "documents": ("documents",),
+    "document_tags": ("documents",),
+    "document_chunks": ("chunks",),
+    "users": ("questions", "documents"),
+}
+
+# Deleting a document also removes its chunks and its links to questions during the flush
+DELETE_COUNTERS = {
+    "documents": ("documents", "chunks", "questions"),
+}
+
+_PENDING_KEY = "change_counters_pending"
+_BUMPED_KEY = "change_counters_bumped"
+
+_counters_table = models.ChangeCounter.__table__
+
+
+def bump(connection, names: Iterable[str]):
+    """Increment the named counters in name order, creating any that are missing (databases that skipped the migration)."""
+    for name in sorted(set(names)):
+        result = connection.execute(
+            update(_counters_table).where(_counters_table.c.name == name)
+            .values(version=_counters_table.c.version + 1)
+        )
+        if not result.rowcount:
+            connection.execute(insert(_counters_table).values(name=name, version=1))
+
+
+def _track(session: Session, names: Iterable[str]):
+    names = set(names)
+    if not names:
+        return
+    bumped = session.info.get(_BUMPED_KEY)
+    if bumped is None:
+        session.info.setdefault(_PENDING_KEY, set()).update(names)
+        return
+    # Written by a flush that commit() ran after before_commit; one increment per transaction is enough
+    pending = names - bumped
+    if pending:
+        bump(session.connection(), pending)
+        bumped.update(pending)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    names = set()
+    for instance in list(session.new) + [i for i in session.dirty if session.is_modified(i)]:
+        names.update(TABLE_COUNTERS.get(getattr(instance, "__tablename__", None), ()))
+    for instance in session.deleted:
+        table = getattr(instance, "__tablename__", None)
+        names.update(DELETE_COUNTERS.get(table, TABLE_COUNTERS.get(table, ())))
+    _track(session, names)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, "table", None)
+    _track(orm_execute_state.session, TABLE_COUNTERS.get(getattr(table, "name", None), ()))
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_pending(session):
+    if session.in_nested_transaction():
+        # Releasing a savepoint; the enclosing transaction increments them when it commits
+        return
+    # Flush first so the pending objects' counters are collected before they are incremented
+    session.flush()
+    names = session.info.pop(_PENDING_KEY, set())
+    if names:
+        bump(session.connection(), names)
+    session.info[_BUMPED_KEY] = names
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _reset(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+        session.info.pop(_BUMPED_KEY, None)
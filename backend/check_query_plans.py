@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Check that the hot filtered queries use an index rather than a full table scan.
+
+Builds a temporary SQLite database as an existing deployment would have it (tables
+without the hot-filter indexes), applies the migrations, then runs each hot query
+through `crud` and asks SQLite for the plan of every statement it issued. Exits
+non-zero if any plan scans a table without an index or sorts a list.
+
+Usage:
+    python check_query_plans.py --verbose
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from datetime import datetime
+
+# Add the backend directory to the path so we can import modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+WORK_DIR = tempfile.mkdtemp(prefix="check_query_plans_")
+os.environ["DATABASE_URL"] = f"sqlite:///{WORK_DIR}/check.db"
+
+from sqlalchemy import event, text
+
+from database import SessionLocal, engine
+from migrations import run_migrations, MIGRATIONS
+from models import models
+import crud
+
+HOT_FILTER_INDEXES = [
+    "ix_questions_status_asked_at_id",
+    "ix_questions_asked_by_id_asked_at_id",
+    "ix_questions_asked_at_id",
+    "ix_documents_uploaded_at_id",
+    "ix_document_chunks_document_id_chunk_index",
+    "ix_documents_uploaded_by_id",
+    "ix_question_documents_document_id",
+]
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("EXPLAIN") and not executemany:
+            self.statements.append((statement, parameters))
+
+
+def build_database(db):
+    """Tables as a database created before the indexes existed, then migrated."""
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name in HOT_FILTER_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"))
+        conn.execute(text("DELETE FROM schema_migrations"))
+        conn.execute(text("INSERT INTO schema_migrations VALUES (:version, CURRENT_TIMESTAMP)"), {"version": MIGRATIONS[0][0]})
+    run_migrations(engine)
+
+    user = models.User(id=str(uuid.uuid4()), email="plans@example.com", name="Plans", role="buyer", hashed_password="-")
+    document = models.Document(id=str(uuid.uuid4()), name="doc.txt", size=0, type="text/plain", content="",
+                               tags="[]", uploaded_by_id=user.id, processing_status="completed")
+    db.add_all([user, document])
+    for i in range(20):
+        db.add(models.DocumentChunk(id=str(uuid.uuid4()), document_id=document.id, chunk_index=i, content=f"chunk {i}"))
+        db.add(models.Question(id=str(uuid.uuid4()), title=f"Question {i}", content="?", tags=json.dumps([]),
+                               status="pending" if i % 2 else "answered", asked_by_id=user.id,
+                               related_documents=[document]))
+    db.commit()
+    return user, document
+
+
+def hot_queries(user, document):
+    return {
+        "questions by status": lambda db: crud.get_question_rows(db, status="pending"),
+        "questions by asker": lambda db: crud.get_question_rows(db, user_id=user.id),
+        "questions by status and asker": lambda db: crud.get_questions(db, status="pending", user_id=user.id),
+        "all questions, newest first": lambda db: crud.get_question_rows(db),
+        "next page of questions": lambda db: crud.get_question_rows(db, after=(datetime.utcnow(), "~")),
+        "all documents, newest first": lambda db: crud.get_document_rows(db),
+        "next page of documents": lambda db: crud.get_document_rows(db, after=(datetime.utcnow(), "~")),
+        "documents with all tags": lambda db: crud.get_document_rows(db, tags=["legal", "finance"]),
+        "questions with any tag": lambda db: crud.get_question_rows(db, tags=["legal", "finance"], tag_mode="any"),
+        "chunks of a document": lambda db: crud.get_document_chunk_rows(db, document.id),
+        "documents of an uploader": lambda db: db.query(models.Document).filter(
+            models.Document.uploaded_by_id == user.id).all(),
+        "questions linked to a document": lambda db: db.query(models.Question).join(
+            models.Question.related_documents).filter(models.Document.id == document.id).all(),
+    }
+
+
+# Tag filters are driven from the tag index, so only the matching rows are sorted
+SORTED_AFTER_FILTER = {"documents with all tags", "questions with any tag"}
+
+
+def problems(plan, allow_sort=False):
+    """Plan steps that read a whole table or sort a result instead of using an index."""
+    found = []
+    for step in plan:
+        detail = step[-1]
+        if detail.startswith("SCAN") and "USING" not in detail and "SUBQUERY" not in detail:
+            found.append(detail)
+        elif detail.startswith("USE TEMP B-TREE") and "ORDER BY" in detail and not allow_sort:
+            found.append(detail)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="Print every statement's plan")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    failed = False
+    try:
+        user, document = build_database(db)
+        recorder = StatementRecorder()
+        for label, run in hot_queries(user, document).items():
+            recorder.statements.clear()
+            db.expire_all()
+            run(db)
+            issues = []
+            with engine.connect() as conn:
+                for statement, parameters in list(recorder.statements):
+                    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+                    issues.extend(problems(plan, allow_sort=label in SORTED_AFTER_FILTER))
+                    if args.verbose:
+                        print(f"  {' '.join(statement.split())[:120]}")
+                        for step in plan:
+                            print(f"    {step[-1]}")
+            failed = failed or bool(issues)
+            print(f"{label:<34}{'ok' if not issues else 'NOT INDEXED: ' + '; '.join(issues)}")
+    finally:
+        db.close()
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from sqlalchemy import and_, or_, update, func, select, insert, tuple_
 from models import models, schemas
 from passlib.context import CryptContext
+from fast_json import loads as json_loads
+import change_counters  # registers the session events that keep the change counters current
 import json
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -42,17 +44,147 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[models
         return None
     return user
 
+# Change counters
+def get_change_counters(db: Session, names) -> tuple:
+    """Current versions of the named change counters, in the given order (0 for counters never written)."""
+    versions = dict(db.query(models.ChangeCounter.name, models.ChangeCounter.version).filter(
+        models.ChangeCounter.name.in_(list(names))
+    ).all())
+    return tuple(versions.get(name, 0) for name in names)
+
 # Document operations
-def get_documents(db: Session, skip: int = 0, limit: int = 100, tags: Optional[List[str]] = None) -> List[models.Document]:
-    query = db.query(models.Document)
+def _after_cursor(query, timestamp_column, id_column, after: Optional[tuple]):
+    """Newest first by (timestamp, id); with `after`, only rows that sort after that key."""
+    if after:
+        timestamp, row_id = after
+        # The redundant `<=` gives the planner an index range to seek to instead of walking the newer rows
+        query = query.filter(timestamp_column <= timestamp, or_(
+            timestamp_column < timestamp,
+            and_(timestamp_column == timestamp, id_column < row_id)
+        ))
+    return query.order_by(timestamp_column.desc(), id_column.desc())
+
+def normalize_tags(tags: List[str]) -> List[str]:
+    """Trimmed, lowercase, de-duplicated tags in their original order; the form stored in the tag tables."""
+    return list(dict.fromkeys(str(tag).strip().lower() for tag in tags if str(tag).strip()))
+
+def _tag_filter(id_column, tag_model, owner_column_name: str, tags: List[str], tag_mode: str = "all"):
+    """
+    Condition on `id_column` matching rows tagged with all (tag_mode "all") or any ("any") of the tags,
+    answered from the tag table's (tag, owner) index.
+    """
+    tags = normalize_tags(tags)
+    tag_rows = aliased(tag_model)
+    owner_column = getattr(tag_rows, owner_column_name)
+    matching = select(owner_column).where(tag_rows.tag.in_(tags))
+    if tag_mode == "all":
+        matching = matching.group_by(owner_column).having(func.count() == len(tags))
+    return id_column.in_(matching)
+
+def _filter_documents(query, tags: Optional[List[str]], after: Optional[tuple], tag_mode: str):
     if tags:
-        for tag in tags:
-            query = query.filter(models.Document.tags.contains(tag.lower()))
-    return query.offset(skip).limit(limit).all()
+        query = query.filter(_tag_filter(models.Document.id, models.DocumentTag, "document_id", tags, tag_mode))
+    return _after_cursor(query, models.Document.uploaded_at, models.Document.id, after)
+
+def get_documents(db: Session, skip: int = 0, limit: int = 100, tags: Optional[List[str]] = None,
+                  after: Optional[tuple] = None, tag_mode: str = "all") -> List[models.Document]:
+    # Uploader names are shown for every row, so load them in the same query
+    query = db.query(models.Document).options(joinedload(models.Document.uploader))
+    return _filter_documents(query, tags, after, tag_mode).offset(skip).limit(limit).all()
+
+def get_document_rows(db: Session, skip: int = 0, limit: int = 100, tags: Optional[List[str]] = None,
+                      after: Optional[tuple] = None, tag_mode: str = "all") -> List[dict]:
+    """
+    Document list rows as plain dicts with the DocumentResponse fields, from one column projection
+    joined to the uploader's name. The file content is never loaded.
+    """
+    query = db.query(
+        models.Document.id, models.Document.name, models.Document.size, models.Document.type,
+        models.Document.tags, models.User.name.label("uploaded_by"), models.Document.uploaded_at,
+        models.Document.summary
+    ).join(models.User, models.Document.uploaded_by_id == models.User.id)
+    rows = _filter_documents(query, tags, after, tag_mode).offset(skip).limit(limit).all()
+    return [
+        {
+            "name": row.name,
+            "size": row.size,
+            "type": row.type,
+            "tags": json_loads(row.tags),
+            "id": row.id,
+            "uploaded_by": row.uploaded_by,
+            "uploaded_at": row.uploaded_at,
+            "summary": row.summary,
+            "processing_status": None,
+            "job_id": None
+        }
+        for row in rows
+    ]
+
+def get_document_tag_counts(db: Session, tags: Optional[List[str]] = None, tag_mode: str = "all") -> List[tuple]:
+    """(tag, document count) for every tag, most used first; with `tags`, counted within the matching documents."""
+    count = func.count(models.DocumentTag.document_id)
+    query = db.query(models.DocumentTag.tag, count)
+    if tags:
+        query = query.filter(_tag_filter(models.DocumentTag.document_id, models.DocumentTag, "document_id", tags, tag_mode))
+    return [tuple(row) for row in query.group_by(models.DocumentTag.tag).order_by(count.desc(), models.DocumentTag.tag).all()]
 
 def get_document(db: Session, document_id: str) -> Optional[models.Document]:
     return db.query(models.Document).filter(models.Document.id == document_id).first()
 
+def get_documents_by_ids(db: Session, document_ids: List[str]) -> List[models.Document]:
+    """Documents (with uploaders) for the given IDs in one query; order is not preserved."""
+    if not document_ids:
+        return []
+    return db.query(models.Document).options(joinedload(models.Document.uploader)).filter(
+        models.Document.id.in_(document_ids)
+    ).all()
+
+def get_document_embeddings(db: Session) -> List[models.DocumentEmbedding]:
+    """Document centroids, leaving out the markers recorded for documents without chunk vectors."""
+    return db.query(models.DocumentEmbedding).filter(models.DocumentEmbedding.chunk_count > 0).all()
+
+def get_document_embedding_version(db: Session) -> tuple:
+    """Cheap fingerprint of the document index; changes whenever an embedding is added, updated or removed."""
+    return db.query(
+        func.count(models.DocumentEmbedding.document_id),
+        func.max(models.DocumentEmbedding.updated_at)
+    ).one()
+
+def get_unindexed_document_ids(db: Session) -> List[str]:
+    """Processed documents with no document-level embedding, or one older than their last processing."""
+    rows = db.query(models.Document.id).outerjoin(models.DocumentEmbedding).filter(
+        models.Document.processing_status == "completed",
+        or_(
+            models.DocumentEmbedding.document_id.is_(None),
+            models.DocumentEmbedding.updated_at < models.Document.processed_at
+        )
+    ).all()
+    return [row[0] for row in rows]
+
+def save_document_embedding(db: Session, embedding: dict):
+    db.merge(models.DocumentEmbedding(**embedding, updated_at=datetime.utcnow()))
+    db.commit()
+
+def insert_document_chunks(db: Session, chunks: List[dict], batch_size: int = 1000):
+    """Bulk-insert chunk rows; the caller commits (e.g. together with the document's status update)."""
+    _insert_in_batches(db, models.DocumentChunk, chunks, batch_size)
+
+def get_document_chunk_rows(db: Session, document_id: str) -> List[models.DocumentChunk]:
+    return db.query(models.DocumentChunk).filter(
+        models.DocumentChunk.document_id == document_id
+    ).order_by(models.DocumentChunk.chunk_index).all()
+
+def get_cached_summaries(db: Session, content_hashes: List[str]) -> dict:
+    if not content_hashes:
+        return {}
+    rows = db.query(models.SummaryCache).filter(models.SummaryCache.content_hash.in_(content_hashes)).all()
+    return {row.content_hash: row.summary for row in rows}
+
+def save_cached_summaries(db: Session, summaries: List[dict]):
+    for summary in summaries:
+        db.merge(models.SummaryCache(**summary))
+    db.commit()
+
 def create_document(db: Session, document: schemas.DocumentCreate, user_id: str) -> models.Document:
     import uuid
     db_document = models.Document(
@@ -62,7 +194,8 @@ def create_document(db: Session, document: schemas.DocumentCreate, user_id: str)
         type=document.type,
         content=document.content,
         tags=json.dumps(document.tags),
-        uploaded_by_id=user_id
+        uploaded_by_id=user_id,
+        tag_rows=[models.DocumentTag(tag=tag) for tag in normalize_tags(document.tags)]
     )
     db.add(db_document)
     db.commit()
@@ -97,18 +230,134 @@ def update_document_summary(db: Session, document_id: str, summary: str) -> Opti
     return document
 
 # Question operations
-def get_questions(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None, user_id: Optional[str] = None) -> List[models.Question]:
+def get_questions(db: Session, skip: int = 0, limit: Optional[int] = 100, status: Optional[str] = None, user_id: Optional[str] = None,
+                  with_relations: bool = False, after: Optional[tuple] = None, tags: Optional[List[str]] = None,
+                  tag_mode: str = "all") -> List[models.Question]:
     query = db.query(models.Question)
+    if with_relations:
+        # Asker/answerer names and related document IDs for every row: one join plus one IN query,
+        # instead of three lazy loads per question. Only document IDs are needed, not their content.
+        query = query.options(
+            joinedload(models.Question.asker),
+            joinedload(models.Question.answerer),
+            selectinload(models.Question.related_documents).load_only(models.Document.id)
+        )
+    query = _filter_questions(query, status, user_id, after, tags, tag_mode)
+    return query.offset(skip).limit(limit).all()
+
+def _filter_questions(query, status: Optional[str], user_id: Optional[str], after: Optional[tuple],
+                      tags: Optional[List[str]], tag_mode: str):
     if status:
         query = query.filter(models.Question.status == status)
     if user_id:
         query = query.filter(models.Question.asked_by_id == user_id)
-    return query.order_by(models.Question.asked_at.desc()).offset(skip).limit(limit).all()
+    if tags:
+        query = query.filter(_tag_filter(models.Question.id, models.QuestionTag, "question_id", tags, tag_mode))
+    return _after_cursor(query, models.Question.asked_at, models.Question.id, after)
+
+def get_question_rows(db: Session, skip: int = 0, limit: Optional[int] = 100, status: Optional[str] = None,
+                      user_id: Optional[str] = None, after: Optional[tuple] = None, tags: Optional[List[str]] = None,
+                      tag_mode: str = "all") -> List[dict]:
+    """
+    Question list rows as plain dicts with the QuestionResponse fields: one column projection joined to
+    the asker's and answerer's names, plus one IN query for the related document IDs of the page.
+    """
+    asker, answerer = aliased(models.User), aliased(models.User)
+    query = db.query(
+        models.Question.id, models.Question.title, models.Question.content, models.Question.status,
+        models.Question.priority, models.Question.tags, asker.name.label("asked_by"), models.Question.asked_at,
+        models.Question.answer, answerer.name.label("answered_by"), models.Question.answered_at,
+        models.Question.duplicate_of_id
+    ).join(asker, models.Question.asked_by_id == asker.id).outerjoin(
+        answerer, models.Question.answered_by_id == answerer.id
+    )
+    rows = _filter_questions(query, status, user_id, after, tags, tag_mode).offset(skip).limit(limit).all()
+    
+    related = {row.id: [] for row in rows}
+    if related:
+        links = db.execute(
+            select(models.question_documents.c.question_id, models.question_documents.c.document_id)
+            .where(models.question_documents.c.question_id.in_(list(related)))
+        )
+        for question_id, document_id in links:
+            related[question_id].append(document_id)
+    
+    return [
+        {
+            "title": row.title,
+            "content": row.content,
+            "priority": row.priority,
+            "tags": json_loads(row.tags),
+            "id": row.id,
+            "status": row.status,
+            "asked_by": row.asked_by,
+            "asked_at": row.asked_at,
+            "answer": row.answer,
+            "answered_by": row.answered_by,
+            "answered_at": row.answered_at,
+            "related_documents": related[row.id],
+            "duplicate_of": row.duplicate_of_id
+        }
+        for row in rows
+    ]
+
+def get_question_tag_counts(db: Session, user_id: Optional[str] = None, tags: Optional[List[str]] = None,
+                            tag_mode: str = "all") -> List[tuple]:
+    """(tag, question count) for every tag, most used first, optionally limited to one asker's questions."""
+    count = func.count(models.QuestionTag.question_id)
+    query = db.query(models.QuestionTag.tag, count)
+    if user_id:
+        query = query.join(models.Question, models.Question.id == models.QuestionTag.question_id).filter(
+            models.Question.asked_by_id == user_id
+        )
+    if tags:
+        query = query.filter(_tag_filter(models.QuestionTag.question_id, models.QuestionTag, "question_id", tags, tag_mode))
+    return [tuple(row) for row in query.group_by(models.QuestionTag.tag).order_by(count.desc(), models.QuestionTag.tag).all()]
+
+def get_question_ids_page(db: Session, status: Optional[str] = None, after_id: Optional[str] = None, limit: int = 200) -> List[str]:
+    """Page through question IDs in ID order; pass the last ID back as `after_id` for the next page."""
+    query = db.query(models.Question.id)
+    if status:
+        query = query.filter(models.Question.status == status)
+    if after_id:
+        query = query.filter(models.Question.id > after_id)
+    return [row.id for row in query.order_by(models.Question.id).limit(limit).all()]
+
+def get_question_embeddings(db: Session, question_ids: List[str]) -> List[models.QuestionEmbedding]:
+    if not question_ids:
+        return []
+    return db.query(models.QuestionEmbedding).filter(models.QuestionEmbedding.question_id.in_(question_ids)).all()
+
+def save_question_embeddings(db: Session, embeddings: List[dict]):
+    """Insert or replace stored question vectors in one transaction."""
+    for values in embeddings:
+        db.merge(models.QuestionEmbedding(**values))
+    db.commit()
+
+def get_canonical_question_texts(db: Session, user_id: str) -> List[tuple]:
+    """(id, content) for every question asked by the user that is not itself linked as a duplicate."""
+    rows = db.query(models.Question.id, models.Question.content).filter(
+        models.Question.asked_by_id == user_id,
+        models.Question.duplicate_of_id.is_(None)
+    ).all()
+    return [tuple(row) for row in rows]
+
+def get_duplicate_question_rows(db: Session, user_id: Optional[str] = None) -> List[tuple]:
+    """(duplicate_id, duplicate_title, canonical_id, canonical_title) for every linked duplicate."""
+    canonical = aliased(models.Question)
+    # Questions are only linked within one asker's questions, so a cluster never spans buyers
+    query = db.query(models.Question.id, models.Question.title, canonical.id, canonical.title).join(
+        canonical, and_(models.Question.duplicate_of_id == canonical.id,
+                        models.Question.asked_by_id == canonical.asked_by_id)
+    )
+    if user_id:
+        query = query.filter(models.Question.asked_by_id == user_id)
+    return [tuple(row) for row in query.order_by(canonical.id).all()]
 
 def get_question(db: Session, question_id: str) -> Optional[models.Question]:
     return db.query(models.Question).filter(models.Question.id == question_id).first()
 
-def create_question(db: Session, question: schemas.QuestionCreate, user_id: str) -> models.Question:
+def create_question(db: Session, question: schemas.QuestionCreate, user_id: str, duplicate_of_id: Optional[str] = None) -> models.Question:
     import uuid
     db_question = models.Question(
         id=str(uuid.uuid4()),
@@ -116,31 +365,180 @@ def create_question(db: Session, question: schemas.QuestionCreate, user_id: str)
         content=question.content,
         priority=question.priority,
         tags=json.dumps(question.tags),
-        asked_by_id=user_id
+        tag_rows=[models.QuestionTag(tag=tag) for tag in normalize_tags(question.tags)],
+        asked_by_id=user_id,
+        # Near-duplicates wait on their canonical question instead of being answered separately
+        status="duplicate" if duplicate_of_id else "pending",
+        duplicate_of_id=duplicate_of_id
     )
+    if duplicate_of_id:
+        canonical = get_question(db, duplicate_of_id)
+        if canonical and canonical.status == "answered":
+            db_question.answer = canonical.answer
+            db_question.answered_by_id = canonical.answered_by_id
+            db_question.answered_at = canonical.answered_at
+            db_question.status = "answered"
+            db_question.related_documents = list(canonical.related_documents)
     db.add(db_question)
     db.commit()
     db.refresh(db_question)
     return db_question
 
-def answer_question(db: Session, question_id: str, answer: str, user_id: Optional[str], related_documents: List[str]) -> Optional[models.Question]:
-    question = get_question(db, question_id)
-    if question:
-        question.answer = answer
-        question.answered_by_id = user_id
-        question.answered_at = datetime.utcnow()
-        question.status = "answered"
-        
-        # Clear existing relationships and add new ones
-        question.related_documents.clear()
-        for doc_id in related_documents:
-            document = get_document(db, doc_id)
-            if document:
-                question.related_documents.append(document)
-        
+def _insert_in_batches(db: Session, table, rows: List[dict], batch_size: int):
+    """
+    One INSERT statement executed for `batch_size` rows at a time. Compiling a literal
+    multi-row VALUES clause costs more than the insert itself, while one executemany of a
+    single compiled statement keeps the per-row cost to binding parameters.
+    """
+    table = getattr(table, "__table__", table)
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(table), rows[start:start + batch_size])
+
+def create_questions_bulk(db: Session, questions: List[dict], user_id: str, batch_size: int = 500) -> List[dict]:
+    """
+    Insert many questions, their tags and inherited document links in one transaction.
+    
+    Each entry has title, content, priority, tags and optionally `duplicate_of_id` (an existing
+    question) or `duplicate_of_index` (an earlier entry in the same list). Duplicates of an
+    answered question inherit its answer, as in `create_question`.
+    
+    Returns:
+        One dictionary of column values per inserted question, in input order
+    """
+    import uuid
+    ids = [str(uuid.uuid4()) for _ in questions]
+    
+    # Answers and document links of answered canonical questions, in two queries for the whole batch
+    canonical_ids = {q["duplicate_of_id"] for q in questions if q.get("duplicate_of_id")}
+    answered = {
+        row.id: row for row in db.query(
+            models.Question.id, models.Question.answer, models.Question.answered_by_id, models.Question.answered_at
+        ).filter(models.Question.id.in_(canonical_ids), models.Question.status == "answered").all()
+    } if canonical_ids else {}
+    canonical_documents: dict = {}
+    if answered:
+        links = db.execute(select(models.question_documents.c.question_id, models.question_documents.c.document_id).where(
+            models.question_documents.c.question_id.in_(list(answered))
+        ))
+        for question_id, document_id in links:
+            canonical_documents.setdefault(question_id, []).append(document_id)
+    
+    rows, tag_rows, document_links = [], [], []
+    for question_id, question in zip(ids, questions):
+        duplicate_of_id = question.get("duplicate_of_id")
+        if question.get("duplicate_of_index") is not None:
+            duplicate_of_id = ids[question["duplicate_of_index"]]
+        row = {
+            "id": question_id,
+            "title": question["title"],
+            "content": question["content"],
+            "priority": question["priority"],
+            "tags": json.dumps(question["tags"]),
+            "asked_by_id": user_id,
+            "asked_at": datetime.utcnow(),
+            # Near-duplicates wait on their canonical question instead of being answered separately
+            "status": "duplicate" if duplicate_of_id else "pending",
+            "duplicate_of_id": duplicate_of_id,
+            "answer": None,
+            "answered_by_id": None,
+            "answered_at": None
+        }
+        canonical = answered.get(duplicate_of_id)
+        if canonical:
+            row.update(answer=canonical.answer, answered_by_id=canonical.answered_by_id,
+                       answered_at=canonical.answered_at, status="answered")
+            document_links.extend({"question_id": question_id, "document_id": document_id}
+                                  for document_id in canonical_documents.get(duplicate_of_id, []))
+        rows.append(row)
+        tag_rows.extend({"question_id": question_id, "tag": tag} for tag in normalize_tags(question["tags"]))
+    
+    try:
+        _insert_in_batches(db, models.Question, rows, batch_size)
+        _insert_in_batches(db, models.QuestionTag, tag_rows, batch_size)
+        _insert_in_batches(db, models.question_documents, document_links, batch_size)
         db.commit()
-        db.refresh(question)
-    return question
+    except Exception:
+        db.rollback()
+        raise
+    return rows
+
+def _replace_question_documents(db: Session, links: dict):
+    """
+    Make each question's related documents exactly the given document IDs (IDs of documents that
+    don't exist are dropped): one IN lookup per table, then one bulk delete and one bulk insert
+    of only the association rows that changed.
+    """
+    association = models.question_documents
+    wanted = {document_id for document_ids in links.values() for document_id in document_ids}
+    existing = {row.id for row in db.query(models.Document.id).filter(models.Document.id.in_(wanted))} if wanted else set()
+    current: dict = {}
+    for question_id, document_id in db.execute(
+        select(association.c.question_id, association.c.document_id).where(association.c.question_id.in_(list(links)))
+    ):
+        current.setdefault(question_id, set()).add(document_id)
+    
+    stale, missing = [], []
+    for question_id, document_ids in links.items():
+        target = [document_id for document_id in dict.fromkeys(document_ids) if document_id in existing]
+        have = current.get(question_id, set())
+        stale.extend((question_id, document_id) for document_id in have - set(target))
+        missing.extend({"question_id": question_id, "document_id": document_id} for document_id in target if document_id not in have)
+    
+    if stale:
+        db.execute(association.delete().where(tuple_(association.c.question_id, association.c.document_id).in_(stale)))
+    if missing:
+        db.execute(insert(association), missing)
+
+def answer_questions(db: Session, answers: List[dict]) -> List[models.Question]:
+    """
+    Record several answers in one transaction.
+    
+    Each entry has question_id, answer, user_id (None for system-generated answers) and
+    related_documents (document IDs). Near-duplicates linked to an answered question share
+    its answer and documents.
+    
+    Returns:
+        The answered questions, in input order; unknown question IDs are skipped
+    """
+    if not answers:
+        return []
+    questions = {
+        question.id: question
+        for question in db.query(models.Question).filter(models.Question.id.in_([a["question_id"] for a in answers])).all()
+    }
+    duplicates: dict = {}
+    for duplicate in db.query(models.Question).filter(models.Question.duplicate_of_id.in_(list(questions))).all():
+        if duplicate.asked_by_id == questions[duplicate.duplicate_of_id].asked_by_id:
+            duplicates.setdefault(duplicate.duplicate_of_id, []).append(duplicate)
+    
+    now = datetime.utcnow()
+    answered, links = [], {}
+    for entry in answers:
+        question = questions.get(entry["question_id"])
+        if not question:
+            continue
+        # Near-duplicates linked to this question share its answer
+        for target in [question] + duplicates.get(question.id, []):
+            target.answer = entry["answer"]
+            target.answered_by_id = entry["user_id"]
+            target.answered_at = now
+            target.status = "answered"
+            links[target.id] = entry["related_documents"]
+        answered.append(question)
+    
+    db.flush()
+    _replace_question_documents(db, links)
+    db.commit()
+    return answered
+
+def answer_question(db: Session, question_id: str, answer: str, user_id: Optional[str], related_documents: List[str]) -> Optional[models.Question]:
+    answered = answer_questions(db, [{
+        "question_id": question_id,
+        "answer": answer,
+        "user_id": user_id,
+        "related_documents": related_documents
+    }])
+    return answered[0] if answered else None
 
 def update_question_status(db: Session, question_id: str, status: str) -> Optional[models.Question]:
     question = get_question(db, question_id)
@@ -153,7 +551,207 @@ def update_question_status(db: Session, question_id: str, status: str) -> Option
 def delete_question(db: Session, question_id: str) -> bool:
     question = get_question(db, question_id)
     if question:
+        # Unanswered duplicates of a deleted question go back to being answered on their own
+        for duplicate in question.duplicates:
+            duplicate.duplicate_of_id = None
+            if duplicate.status == "duplicate":
+                duplicate.status = "pending"
         db.delete(question)
         db.commit()
         return True
-    return False
\ No newline at end of file
+    return False
+
+# Job operations
+def create_job(db: Session, job_type: str, payload: dict, max_attempts: int = 5) -> models.Job:
+    import uuid
+    db_job = models.Job(
+        id=str(uuid.uuid4()),
+        type=job_type,
+        payload=json.dumps(payload),
+        status="queued",
+        max_attempts=max_attempts
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_job(db: Session, job_id: str) -> Optional[models.Job]:
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+def get_jobs(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None, job_type: Optional[str] = None) -> List[models.Job]:
+    query = db.query(models.Job)
+    if status:
+        query = query.filter(models.Job.status == status)
+    if job_type:
+        query = query.filter(models.Job.type == job_type)
+    return query.order_by(models.Job.created_at.desc()).offset(skip).limit(limit).all()
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[models.Job]:
+    """Atomically move the oldest runnable queued job to running under this worker's lease."""
+    now = datetime.utcnow()
+    candidates = db.query(models.Job.id).filter(
+        models.Job.status == "queued",
+        or_(models.Job.run_after.is_(None), models.Job.run_after <= now)
+    ).order_by(models.Job.created_at).limit(5).all()
+    
+    for (job_id,) in candidates:
+        # Conditional update: only one worker can flip a given job out of "queued"
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.status == "queued")
+            .values(status="running", locked_by=worker_id, locked_at=now,
+                    attempts=models.Job.attempts + 1, updated_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return get_job(db, job_id)
+    return None
+
+def update_job_progress(db: Session, job_id: str, worker_id: str, progress: Optional[float] = None,
+                        message: Optional[str] = None) -> bool:
+    """Renew the job's lease, recording progress when given. False when this worker no longer holds the job."""
+    now = datetime.utcnow()
+    values = dict(locked_at=now, updated_at=now)
+    if progress is not None:
+        values.update(progress=progress, progress_message=message)
+    renewed = db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.status == "running", models.Job.locked_by == worker_id)
+        .values(**values)
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+def complete_job(db: Session, job_id: str, worker_id: str, result: Optional[dict] = None) -> bool:
+    """Mark the job succeeded. False when its lease expired and another worker took it over."""
+    now = datetime.utcnow()
+    completed = db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.status == "running", models.Job.locked_by == worker_id)
+        .values(status="succeeded", progress=1.0, result=json.dumps(result or {}), error=None,
+                locked_by=None, locked_at=None, updated_at=now, finished_at=now)
+    ).rowcount
+    db.commit()
+    return bool(completed)
+
+def fail_job(db: Session, job_id: str, worker_id: str, error: str, retry_delay: Optional[float] = None) -> bool:
+    """Requeue the job after `retry_delay` seconds, or mark it failed when no retry is given. False as in complete_job."""
+    now = datetime.utcnow()
+    if retry_delay is not None:
+        values = dict(status="queued", run_after=now + timedelta(seconds=retry_delay))
+    else:
+        values = dict(status="failed", finished_at=now)
+    failed = db.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.status == "running", models.Job.locked_by == worker_id)
+        .values(error=error, locked_by=None, locked_at=None, updated_at=now, **values)
+    ).rowcount
+    db.commit()
+    return bool(failed)
+
+def requeue_stale_jobs(db: Session, lease_seconds: float) -> Tuple[int, int]:
+    """
+    Recover running jobs whose lease has expired (crashed worker), returning (requeued, failed) counts.
+    Jobs that already used all their attempts are failed, so one that keeps killing its worker stops.
+    """
+    now = datetime.utcnow()
+    stale = and_(models.Job.status == "running", models.Job.locked_at < now - timedelta(seconds=lease_seconds))
+    failed = db.execute(
+        update(models.Job)
+        .where(stale, models.Job.attempts >= models.Job.max_attempts)
+        .values(status="failed", error="Lease expired on the final attempt (worker crashed or was killed)",
+                locked_by=None, locked_at=None, updated_at=now, finished_at=now)
+    ).rowcount
+    requeued = db.execute(
+        update(models.Job)
+        .where(stale, models.Job.attempts < models.Job.max_attempts)
+        .values(status="queued", locked_by=None, locked_at=None, run_after=None, updated_at=now)
+    ).rowcount
+    db.commit()
+    return requeued, failed
+
+# Chat session operations
+def create_chat_session(db: Session, user_id: str, title: Optional[str] = None) -> models.ChatSession:
+    import uuid
+    db_session = models.ChatSession(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        title=title,
+        summarized_count=0,
+        message_count=0,
+        chunk_cache="[]"
+    )
+    db.add(db_session)
+    db.commit()
+    db.refresh(db_session)
+    return db_session
+
+def get_chat_session(db: Session, session_id: str, user_id: str) -> Optional[models.ChatSession]:
+    return db.query(models.ChatSession).filter(
+        models.ChatSession.id == session_id,
+        models.ChatSession.user_id == user_id
+    ).first()
+
+def get_chat_sessions(db: Session, user_id: str, skip: int = 0, limit: int = 50) -> List[models.ChatSession]:
+    return db.query(models.ChatSession).filter(
+        models.ChatSession.user_id == user_id
+    ).order_by(models.ChatSession.updated_at.desc()).offset(skip).limit(limit).all()
+
+def get_chat_messages(db: Session, session_id: str, from_position: int = 0, to_position: Optional[int] = None) -> List[models.ChatMessage]:
+    """Messages with from_position <= position < to_position, in order."""
+    query = db.query(models.ChatMessage).filter(
+        models.ChatMessage.session_id == session_id,
+        models.ChatMessage.position >= from_position
+    )
+    if to_position is not None:
+        query = query.filter(models.ChatMessage.position < to_position)
+    return query.order_by(models.ChatMessage.position).all()
+
+def add_chat_turn(db: Session, chat_session: models.ChatSession, user_message: str, assistant_message: str,
+                  sources: Optional[list] = None, chunk_cache: Optional[list] = None) -> Optional[models.ChatSession]:
+    """
+    Append a user/assistant exchange and the updated chunk cache in one commit.
+    Returns None, writing nothing, when another turn was appended since the session was read.
+    """
+    import uuid
+    start = chat_session.message_count
+    # Claim positions start and start + 1; a concurrent turn has already moved message_count on
+    claimed = db.execute(
+        update(models.ChatSession)
+        .where(models.ChatSession.id == chat_session.id, models.ChatSession.message_count == start)
+        .values(message_count=models.ChatSession.message_count + 2, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return None
+    
+    db.add_all([
+        models.ChatMessage(id=str(uuid.uuid4()), session_id=chat_session.id, position=start,
+                           role="user", content=user_message),
+        models.ChatMessage(id=str(uuid.uuid4()), session_id=chat_session.id, position=start + 1,
+                           role="assistant", content=assistant_message, sources=json.dumps(sources or []))
+    ])
+    if chunk_cache is not None:
+        chat_session.chunk_cache = json.dumps(chunk_cache)
+    if not chat_session.title:
+        chat_session.title = user_message[:80]
+    db.commit()
+    db.refresh(chat_session)
+    return chat_session
+
+def update_chat_summary(db: Session, chat_session: models.ChatSession, summary: str, summarized_count: int) -> models.ChatSession:
+    chat_session.summary = summary
+    chat_session.summarized_count = summarized_count
+    db.commit()
+    db.refresh(chat_session)
+    return chat_session
+
+def delete_chat_session(db: Session, session_id: str, user_id: str) -> bool:
+    chat_session = get_chat_session(db, session_id, user_id)
+    if chat_session:
+        db.delete(chat_session)
+        db.commit()
+        return True
+    return False
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -8,10 +9,69 @@ load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./vdr.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+def _sqlite_engine(url) -> Engine:
+    """
+    SQLite profile: WAL lets readers run alongside the single writer, and the busy timeout makes
+    a writer wait for the lock instead of failing with "database is locked".
+    """
+    busy_timeout_ms = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    journal_mode = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    synchronous = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    in_memory = url.database in (None, "", ":memory:")
+    
+    # Request handlers, job workers and batch threads each hold a connection while they work
+    pool_args = {} if in_memory else {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    }
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": busy_timeout_ms / 1000},
+        **pool_args
+    )
+    
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            # Persistent for the database file, but cheap to re-assert on every connection
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        # NORMAL is durable in WAL mode except for the last transactions before a power loss
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        cursor.close()
+    
+    return engine
+
+def _postgresql_engine(url) -> Engine:
+    """
+    PostgreSQL profile: a bounded pool of pre-pinged connections, recycled before server-side
+    idle timeouts, with a statement timeout so a runaway query can't hold a connection forever.
+    """
+    statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+    return create_engine(
+        url,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pool_pre_ping=True,
+        # Timestamps are written as naive UTC, so the session must interpret them as UTC
+        connect_args={"options": f"-c statement_timeout={statement_timeout_ms} -c timezone=UTC"}
+    )
+
+def build_engine(database_url: str) -> Engine:
+    """Engine configured with the profile for the URL's backend (SQLite or PostgreSQL)."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return _sqlite_engine(url)
+    if backend == "postgresql":
+        return _postgresql_engine(url)
+    return create_engine(url, pool_pre_ping=True)
+
+engine = build_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -22,4 +82,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
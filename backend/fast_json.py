@@ -0,0 +1,41 @@
+"""
+JSON responses for endpoints that return already-serializable rows.
+
+List endpoints build plain dicts straight from column projections and return them in
+FastJSONResponse, which skips FastAPI's response_model validation and jsonable_encoder
+pass. The body is encoded with orjson when it is installed, which also handles
+datetimes natively. Otherwise the standard library encoder is used with the same output.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder produces the same JSON, more slowly
+    orjson = None
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse for content made only of dicts, lists, strings, numbers, None and datetimes."""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,17 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+import logging
 import os
 from dotenv import load_dotenv
 
 from database import get_db, engine
 from models import models
-from routers import auth, documents, questions, ai
+from migrations import run_migrations
+from routers import auth, documents, questions, ai, jobs
+from services.job_queue import start_workers, stop_workers
+from services.llm_gateway import LLMRequestError, LLMUnavailableError
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 models.Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app = FastAPI(
     title="NextGenVDR API",
@@ -25,12 +33,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
 app.include_router(documents.router, prefix="/documents", tags=["documents"])
 app.include_router(questions.router, prefix="/questions", tags=["questions"])
 app.include_router(ai.router, prefix="/ai", tags=["ai"])
+app.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailableError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "AI service is temporarily unavailable, please retry shortly"},
+        headers={"Retry-After": "30"}
+    )
+
+@app.exception_handler(LLMRequestError)
+async def llm_request_handler(request: Request, exc: LLMRequestError):
+    # A rejected request (bad input, invalid API key) fails the same way on retry, so no Retry-After
+    logger.error(f"AI provider rejected a request for {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=502,
+        content={"detail": "AI service rejected the request"}
+    )
+
+@app.on_event("startup")
+def start_job_workers():
+    start_workers()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    stop_workers()
 
 @app.get("/")
 async def root():
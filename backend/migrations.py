@@ -0,0 +1,167 @@
+"""
+Lightweight schema migrations for changes `create_all` cannot make to existing tables.
+
+`create_all` creates missing tables but never alters ones that already exist, so
+columns, indexes and backfills for existing tables are applied here. Each migration runs
+once, is recorded in `schema_migrations`, and is written to be a no-op on a database
+that `create_all` has just built with the current models.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, ddl: str):
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _create_index_if_missing(conn: Connection, name: str, table: str, columns: str):
+    indexes = {i["name"] for i in inspect(conn).get_indexes(table)}
+    if name not in indexes:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+
+
+def _create_unique_index_if_missing(conn: Connection, name: str, table: str, columns: str):
+    # create_all builds the constraint into the table, where SQLite reports it as a unique constraint
+    inspector = inspect(conn)
+    existing = {i["name"] for i in inspector.get_indexes(table)} | {c["name"] for c in inspector.get_unique_constraints(table)}
+    if name not in existing:
+        conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({columns})"))
+
+
+def _question_duplicate_of(conn: Connection):
+    _add_column_if_missing(conn, "questions", "duplicate_of_id", "VARCHAR REFERENCES questions(id)")
+    _create_index_if_missing(conn, "ix_questions_duplicate_of_id", "questions", "duplicate_of_id")
+
+
+def _hot_filter_indexes(conn: Connection):
+    _create_index_if_missing(conn, "ix_questions_status_asked_at", "questions", "status, asked_at")
+    _create_index_if_missing(conn, "ix_questions_asked_by_id_asked_at", "questions", "asked_by_id, asked_at")
+    _create_index_if_missing(conn, "ix_questions_asked_at", "questions", "asked_at")
+    _create_index_if_missing(conn, "ix_document_chunks_document_id_chunk_index", "document_chunks", "document_id, chunk_index")
+    _create_index_if_missing(conn, "ix_documents_uploaded_by_id", "documents", "uploaded_by_id")
+    _create_index_if_missing(conn, "ix_question_documents_document_id", "question_documents", "document_id")
+
+
+def _keyset_pagination(conn: Connection):
+    # The list indexes gain the ID tie-breaker so a page is read in index order without a sort
+    for name in ("ix_questions_status_asked_at", "ix_questions_asked_by_id_asked_at", "ix_questions_asked_at"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    _create_index_if_missing(conn, "ix_questions_status_asked_at_id", "questions", "status, asked_at, id")
+    _create_index_if_missing(conn, "ix_questions_asked_by_id_asked_at_id", "questions", "asked_by_id, asked_at, id")
+    _create_index_if_missing(conn, "ix_questions_asked_at_id", "questions", "asked_at, id")
+    _create_index_if_missing(conn, "ix_documents_uploaded_at_id", "documents", "uploaded_at, id")
+    if conn.dialect.name == "sqlite":
+        # Rows stamped by the old CURRENT_TIMESTAMP server default are stored without microseconds,
+        # so they would compare unequal to the same instant bound from a cursor; store them as SQLAlchemy does
+        for table, column in (("questions", "asked_at"), ("documents", "uploaded_at")):
+            conn.execute(text(
+                f"UPDATE {table} SET {column} = strftime('%Y-%m-%d %H:%M:%S', {column}) || '.000000' "
+                f"WHERE length({column}) = 19"
+            ))
+
+
+def _normalized_tags(conn: Connection):
+    # Backfill the tag tables from the JSON tag lists of rows written before they existed
+    from crud import normalize_tags
+    for table, tag_table, owner_column in (("documents", "document_tags", "document_id"),
+                                           ("questions", "question_tags", "question_id")):
+        tagged = {row[0] for row in conn.execute(text(f"SELECT DISTINCT {owner_column} FROM {tag_table}"))}
+        rows = []
+        for owner_id, tags in conn.execute(text(f"SELECT id, tags FROM {table}")):
+            if owner_id in tagged:
+                continue
+            try:
+                tags = json.loads(tags or "[]")
+            except ValueError:
+                tags = []
+            if isinstance(tags, list):
+                rows.extend({"owner_id": owner_id, "tag": tag} for tag in normalize_tags(tags))
+        if rows:
+            conn.execute(text(f"INSERT INTO {tag_table} ({owner_column}, tag) VALUES (:owner_id, :tag)"), rows)
+
+
+def _change_counters(conn: Connection):
+    # The table itself comes from create_all; its rows exist before the first write bumps them
+    existing = {row[0] for row in conn.execute(text("SELECT name FROM change_counters"))}
+    for name in ("questions", "documents", "chunks"):
+        if name not in existing:
+            conn.execute(text("INSERT INTO change_counters (name, version) VALUES (:name, 0)"), {"name": name})
+
+
+def _unlink_cross_asker_duplicates(conn: Connection):
+    # Uploads used to match against every asker's questions; links now stay within one asker's questions
+    linked = conn.execute(text(
+        "SELECT duplicate.id, duplicate.answer, duplicate.answered_by_id, canonical.id, "
+        "canonical.answer, canonical.answered_by_id FROM questions duplicate "
+        "JOIN questions canonical ON canonical.id = duplicate.duplicate_of_id "
+        "WHERE duplicate.asked_by_id <> canonical.asked_by_id"
+    )).all()
+    for question_id, answer, answered_by_id, canonical_id, canonical_answer, canonical_answered_by_id in linked:
+        if answer is not None and answer == canonical_answer and answered_by_id == canonical_answered_by_id:
+            # The answer and its documents were copied from the other asker's question; take them back
+            conn.execute(text(
+                "DELETE FROM question_documents WHERE question_id = :question_id AND document_id IN "
+                "(SELECT document_id FROM question_documents WHERE question_id = :canonical_id)"
+            ), {"question_id": question_id, "canonical_id": canonical_id})
+            conn.execute(text(
+                "UPDATE questions SET status = 'pending', answer = NULL, answered_by_id = NULL, answered_at = NULL, "
+                "duplicate_of_id = NULL WHERE id = :question_id"
+            ), {"question_id": question_id})
+        else:
+            conn.execute(text(
+                "UPDATE questions SET duplicate_of_id = NULL, "
+                "status = CASE WHEN status = 'duplicate' THEN 'pending' ELSE status END WHERE id = :question_id"
+            ), {"question_id": question_id})
+    if linked:
+        # Written outside the ORM, so the question lists' ETags are invalidated here
+        conn.execute(text("UPDATE change_counters SET version = version + 1 WHERE name = 'questions'"))
+
+
+def _unique_chat_message_positions(conn: Connection):
+    # Concurrent turns could store messages at the same position; renumber those sessions in order first
+    session_ids = [row[0] for row in conn.execute(text(
+        "SELECT DISTINCT session_id FROM chat_messages GROUP BY session_id, position HAVING COUNT(*) > 1"
+    ))]
+    for session_id in session_ids:
+        message_ids = [row[0] for row in conn.execute(text(
+            "SELECT id FROM chat_messages WHERE session_id = :session_id ORDER BY position, created_at, id"
+        ), {"session_id": session_id})]
+        for position, message_id in enumerate(message_ids):
+            conn.execute(text("UPDATE chat_messages SET position = :position WHERE id = :id"),
+                         {"position": position, "id": message_id})
+        conn.execute(text("UPDATE chat_sessions SET message_count = :count WHERE id = :session_id"),
+                     {"count": len(message_ids), "session_id": session_id})
+    _create_unique_index_if_missing(conn, "uq_chat_messages_session_id_position", "chat_messages", "session_id, position")
+
+
+MIGRATIONS = [
+    ("0001_question_duplicate_of", _question_duplicate_of),
+    ("0002_hot_filter_indexes", _hot_filter_indexes),
+    ("0003_keyset_pagination", _keyset_pagination),
+    ("0004_normalized_tags", _normalized_tags),
+    ("0005_change_counters", _change_counters),
+    ("0006_unlink_cross_asker_duplicates", _unlink_cross_asker_duplicates),
+    ("0007_unique_chat_message_positions", _unique_chat_message_positions),
+]
+
+
+def run_migrations(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (version VARCHAR PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+    
+    for version, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, applied_at) VALUES (:version, :applied_at)"),
+                {"version": version, "applied_at": datetime.utcnow()}
+            )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, Table, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -10,7 +10,9 @@ question_documents = Table(
     'question_documents',
     Base.metadata,
     Column('question_id', String, ForeignKey('questions.id'), primary_key=True),
-    Column('document_id', String, ForeignKey('documents.id'), primary_key=True)
+    Column('document_id', String, ForeignKey('documents.id'), primary_key=True),
+    # The primary key only serves lookups by question; deleting a document looks its links up by document
+    Index('ix_question_documents_document_id', 'document_id')
 )
 
 class User(Base):
@@ -30,6 +32,10 @@ class User(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Document list, newest first, and its keyset cursor
+        Index("ix_documents_uploaded_at_id", "uploaded_at", "id"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -38,8 +44,8 @@ class Document(Base):
     content = Column(Text, nullable=False)  # Base64 encoded
     file_path = Column(String)  # Optional file system path
     tags = Column(Text, nullable=False)  # JSON array as string
-    uploaded_by_id = Column(String, ForeignKey("users.id"), nullable=False)
-    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    uploaded_by_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    uploaded_at = Column(DateTime(timezone=True), default=datetime.utcnow)  # Set in Python so keyset cursors compare exactly
     summary = Column(Text)  # AI-generated summary
     processing_status = Column(String, default="pending")  # pending, processing, completed, failed
     processed_at = Column(DateTime(timezone=True))
@@ -48,9 +54,27 @@ class Document(Base):
     uploader = relationship("User", back_populates="uploaded_documents")
     related_questions = relationship("Question", secondary=question_documents, back_populates="related_documents")
     chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+    embedding = relationship("DocumentEmbedding", uselist=False, back_populates="document", cascade="all, delete-orphan")
+    tag_rows = relationship("DocumentTag", back_populates="document", cascade="all, delete-orphan")
+
+class DocumentTag(Base):
+    __tablename__ = "document_tags"
+    __table_args__ = (
+        # Tag filters and facet counts; the primary key serves lookups by document
+        Index("ix_document_tags_tag_document_id", "tag", "document_id"),
+    )
+    
+    document_id = Column(String, ForeignKey("documents.id"), primary_key=True)
+    tag = Column(String, primary_key=True)  # Normalized (trimmed, lowercase) copy of an entry in Document.tags
+    
+    # Relationships
+    document = relationship("Document", back_populates="tag_rows")
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_document_id_chunk_index", "document_id", "chunk_index"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     document_id = Column(String, ForeignKey("documents.id"), nullable=False)
@@ -65,22 +89,143 @@ class DocumentChunk(Base):
     # Relationships
     document = relationship("Document", back_populates="chunks")
 
+class DocumentEmbedding(Base):
+    __tablename__ = "document_embeddings"
+    
+    document_id = Column(String, ForeignKey("documents.id"), primary_key=True)
+    model = Column(String, nullable=False)  # Embedding model of the chunk vectors
+    chunk_count = Column(Integer, nullable=False)  # Chunks averaged into the centroid; 0 marks a document without chunk vectors
+    dimensions = Column(Integer, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # Normalized float32 chunk centroid
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    document = relationship("Document", back_populates="embedding")
+
+class SummaryCache(Base):
+    __tablename__ = "summary_cache"
+    
+    content_hash = Column(String, primary_key=True)  # SHA-256 of the summarized inputs, model and prompt version
+    model = Column(String, nullable=False)
+    stage = Column(String, nullable=False)  # map (chunk group) or reduce
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        # Question lists filter by status and/or asker and show the newest first, keyset-paged on (asked_at, id)
+        Index("ix_questions_status_asked_at_id", "status", "asked_at", "id"),
+        Index("ix_questions_asked_by_id_asked_at_id", "asked_by_id", "asked_at", "id"),
+        Index("ix_questions_asked_at_id", "asked_at", "id"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
-    status = Column(String, nullable=False, default="pending")  # pending, answered, needs_documents
+    status = Column(String, nullable=False, default="pending")  # pending, answered, needs_documents, duplicate
     priority = Column(String, nullable=False, default="medium")  # low, medium, high
     tags = Column(Text, nullable=False)  # JSON array as string
     answer = Column(Text)
     asked_by_id = Column(String, ForeignKey("users.id"), nullable=False)
     answered_by_id = Column(String, ForeignKey("users.id"))
-    asked_at = Column(DateTime(timezone=True), server_default=func.now())
+    asked_at = Column(DateTime(timezone=True), default=datetime.utcnow)  # Set in Python so keyset cursors compare exactly
     answered_at = Column(DateTime(timezone=True))
+    duplicate_of_id = Column(String, ForeignKey("questions.id"), index=True)  # Canonical question this near-duplicates
     
     # Relationships
     asker = relationship("User", foreign_keys=[asked_by_id], back_populates="asked_questions")
     answerer = relationship("User", foreign_keys=[answered_by_id], back_populates="answered_questions")
-    related_documents = relationship("Document", secondary=question_documents, back_populates="related_questions")
\ No newline at end of file
+    related_documents = relationship("Document", secondary=question_documents, back_populates="related_questions")
+    embedding = relationship("QuestionEmbedding", uselist=False, back_populates="question", cascade="all, delete-orphan")
+    canonical = relationship("Question", remote_side=[id], foreign_keys=[duplicate_of_id], back_populates="duplicates")
+    duplicates = relationship("Question", foreign_keys=[duplicate_of_id], back_populates="canonical")
+    tag_rows = relationship("QuestionTag", back_populates="question", cascade="all, delete-orphan")
+
+class QuestionTag(Base):
+    __tablename__ = "question_tags"
+    __table_args__ = (
+        Index("ix_question_tags_tag_question_id", "tag", "question_id"),
+    )
+    
+    question_id = Column(String, ForeignKey("questions.id"), primary_key=True)
+    tag = Column(String, primary_key=True)  # Normalized (trimmed, lowercase) copy of an entry in Question.tags
+    
+    # Relationships
+    question = relationship("Question", back_populates="tag_rows")
+
+class QuestionEmbedding(Base):
+    __tablename__ = "question_embeddings"
+    
+    question_id = Column(String, ForeignKey("questions.id"), primary_key=True)
+    model = Column(String, nullable=False)  # Embedding model that produced the vector
+    content_hash = Column(String, nullable=False)  # SHA-256 of the embedded text, to detect stale vectors
+    dimensions = Column(Integer, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # float32 vector bytes
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    question = relationship("Question", back_populates="embedding")
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    type = Column(String, nullable=False)  # process_document, auto_answer_document, batch_answer
+    payload = Column(Text, nullable=False)  # JSON object as string
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime(timezone=True))  # Earliest time a queued job may be claimed (retry backoff)
+    locked_by = Column(String)  # Worker ID holding the lease
+    locked_at = Column(DateTime(timezone=True))  # Lease start, renewed on progress updates
+    progress = Column(Float, nullable=False, default=0.0)  # 0.0 - 1.0
+    progress_message = Column(String)
+    result = Column(Text)  # JSON object as string
+    error = Column(Text)
+    # Timestamps are written from Python so claim/lease comparisons use one format
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime(timezone=True))
+
+class ChatSession(Base):
+    __tablename__ = "chat_sessions"
+    
+    id = Column(String, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    title = Column(String)
+    summary = Column(Text)  # Rolling summary of the turns older than the verbatim window
+    summarized_count = Column(Integer, nullable=False, default=0)  # Messages already folded into the summary
+    message_count = Column(Integer, nullable=False, default=0)
+    chunk_cache = Column(Text, nullable=False, default="[]")  # JSON array of recently retrieved chunks
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    messages = relationship("ChatMessage", back_populates="session", cascade="all, delete-orphan",
+                            order_by="ChatMessage.position")
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Two turns appended concurrently can never share a position
+        UniqueConstraint("session_id", "position", name="uq_chat_messages_session_id_position"),
+    )
+    
+    id = Column(String, primary_key=True, index=True)
+    session_id = Column(String, ForeignKey("chat_sessions.id"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)  # 0-based order within the session
+    role = Column(String, nullable=False)  # user or assistant
+    content = Column(Text, nullable=False)
+    sources = Column(Text)  # JSON array of source chunks for assistant messages
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    
+    # Relationships
+    session = relationship("ChatSession", back_populates="messages")
+
+class ChangeCounter(Base):
+    __tablename__ = "change_counters"
+    
+    # "questions", "documents" or "chunks"; incremented once per transaction that writes their tables
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
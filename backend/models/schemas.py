@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -35,6 +35,8 @@ class DocumentResponse(DocumentBase):
     uploaded_by: str
     uploaded_at: datetime
     summary: Optional[str] = None
+    processing_status: Optional[str] = None
+    job_id: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -42,6 +44,10 @@ class DocumentResponse(DocumentBase):
 class DocumentUpload(BaseModel):
     tags: List[str]
 
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
 class QuestionBase(BaseModel):
     title: str
     content: str
@@ -60,10 +66,20 @@ class QuestionResponse(QuestionBase):
     answered_by: Optional[str] = None
     answered_at: Optional[datetime] = None
     related_documents: List[str] = []
+    duplicate_of: Optional[str] = None
 
     class Config:
         from_attributes = True
 
+class DuplicateQuestion(BaseModel):
+    id: str
+    title: str
+
+class DuplicateCluster(BaseModel):
+    canonical_id: str
+    canonical_title: str
+    duplicates: List[DuplicateQuestion]
+
 class QuestionAnswer(BaseModel):
     answer: str
     related_documents: List[str]
@@ -86,6 +102,7 @@ class AIAnalysisResponse(BaseModel):
 
 class AIDocumentSuggestionRequest(BaseModel):
     question_id: str
+    limit: int = 5
 
 class AIAnswerRequest(BaseModel):
     question_id: str
@@ -104,4 +121,40 @@ class TokenData(BaseModel):
     email: Optional[str] = None
 
 class QuestionTextUpload(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    status: str
+    attempts: int
+    max_attempts: int
+    progress: float
+    progress_message: Optional[str] = None
+    payload: Dict[str, Any]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    run_after: Optional[datetime] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ChatSessionCreate(BaseModel):
+    title: Optional[str] = None
+
+class ChatMessageResponse(BaseModel):
+    id: str
+    position: int
+    role: str
+    content: str
+    sources: List[Dict[str, Any]] = []
+    created_at: datetime
+
+class ChatSessionResponse(BaseModel):
+    id: str
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    message_count: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    messages: Optional[List[ChatMessageResponse]] = None
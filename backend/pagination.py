@@ -0,0 +1,28 @@
+"""
+Opaque cursors for keyset pagination of list endpoints.
+
+A cursor encodes the sort key of the last row of a page, (timestamp, id), so the next
+page starts strictly after it. Unlike offsets, fetching a deep page costs the same as
+the first one, and rows inserted meanwhile don't shift rows between pages.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Sort key encoded in a cursor; raises ValueError for anything that isn't one of ours."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(timestamp), str(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
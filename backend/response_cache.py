@@ -0,0 +1,117 @@
+"""
+Conditional GETs and an in-process cache of serialized responses.
+
+A cacheable GET is identified by its path and query string, the caller's scope (what
+the caller is allowed to see) and the versions of the change counters its data comes
+from. The ETag is a hash of that key, so it can be checked, and a 304 Not Modified
+returned, after one counter read and before any data is queried. A 200 body is kept in
+an LRU keyed the same way. A write bumps a counter, which changes the key, so a stale
+entry can never be served. Old entries age out of the LRU.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+import crud
+
+# The browser keeps the body but revalidates on every request, so polls become conditional GETs
+CACHE_CONTROL = "private, no-cache"
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, etag: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return entry
+    
+    def put(self, etag: str, body: bytes, media_type: str, headers: dict):
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(etag, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[etag] = (body, media_type, headers)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Global instance
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", "512")),
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+# Headers of a built response that are replayed with its cached body
+REPLAYED_HEADERS = ("x-next-cursor",)
+
+
+def _etag(request: Request, scope: str, counters: Sequence[str], versions: tuple) -> str:
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    key = "\0".join([request.url.path, query, scope, *(f"{n}={v}" for n, v in zip(counters, versions))])
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {candidate.strip() for candidate in header.split(",")}
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def conditional_response(request: Request, db: Session, counters: Sequence[str], build: Callable[[], Response],
+                         scope: str = "all", store: bool = True) -> Response:
+    """
+    Serve a GET as 304 Not Modified, from the response cache, or by calling `build`.
+    
+    Args:
+        counters: Change counters (see change_counters.py) covering every table the response reads
+        build: Builds the full response; exceptions such as 404s propagate uncached
+        scope: Identifies what the caller may see, e.g. a buyer's user ID; part of the key
+        store: False for large bodies that should get an ETag but not take up cache memory
+    """
+    versions = crud.get_change_counters(db, counters)
+    etag = _etag(request, scope, counters, versions)
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=cache_headers)
+    
+    cached = response_cache.get(etag) if store else None
+    if cached is not None:
+        body, media_type, headers = cached
+        return Response(content=body, media_type=media_type, headers={**headers, **cache_headers})
+    
+    response = build()
+    if response.status_code == 200:
+        response.headers.update(cache_headers)
+        if store:
+            replayed = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+            response_cache.put(etag, response.body, response.media_type, replayed)
+    return response
@@ -1,20 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
+import logging
+import os
 
 from database import get_db
 from models import schemas, models
-from services.openai_service import OpenAIService
-from services.agentic_rag import AgenticRAGService
-from services.document_processor import DocumentProcessor
+from services.retrieval_trace import trace_document_ids
+from services.context_packer import split_paragraphs
+from services.llm_gateway import llm_gateway, LLMRequestError, LLMUnavailableError
+from services.chat_sessions import chat_session_service
+from services.providers import (
+    get_openai_service, get_rag_service, get_document_processor, get_document_summarizer
+)
+from services.job_queue import enqueue_job
 import crud
 import auth
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
-openai_service = OpenAIService()
-rag_service = AgenticRAGService()
-doc_processor = DocumentProcessor()
+
+# Chunks retrieved for /generate-answer before packing to the context budget
+GENERATE_ANSWER_CHUNKS = int(os.getenv("GENERATE_ANSWER_CHUNKS", "12"))
 
 @router.post("/analyze-document", response_model=schemas.AIAnalysisResponse)
 def analyze_document(
@@ -26,7 +35,10 @@ def analyze_document(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    analysis = openai_service.analyze_document(document.content, document.name)
+    # Map-reduce over the stored chunks; documents that aren't processed yet get the single-pass analysis
+    analysis = get_document_summarizer().analyze(db, document)
+    if analysis is None:
+        analysis = get_openai_service().analyze_document(document.content, document.name)
     
     # Update document with AI-generated summary
     crud.update_document_summary(db, document.id, analysis["summary"])
@@ -47,28 +59,13 @@ def suggest_documents(
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     
-    documents = crud.get_documents(db, limit=50)
-    
-    # Prepare documents for AI analysis
-    doc_data = [
-        {
-            "id": doc.id,
-            "name": doc.name,
-            "tags": json.loads(doc.tags)
-        }
-        for doc in documents
-    ]
-    
-    matches = openai_service.find_relevant_documents(
-        question.title, 
-        question.content, 
-        doc_data
-    )
+    # Vector top-k over every indexed document, with the best-matching chunks as evidence
+    suggestions = get_document_processor().document_index.suggest(db, question, k=request.limit)
+    documents = {doc.id: doc for doc in crud.get_documents_by_ids(db, [s["document_id"] for s in suggestions])}
     
-    # Convert to response format
     result = []
-    for match in matches:
-        doc = crud.get_document(db, match["document_id"])
+    for suggestion in suggestions:
+        doc = documents.get(suggestion["document_id"])
         if doc:
             result.append(schemas.DocumentMatch(
                 document=schemas.DocumentResponse(
@@ -81,8 +78,11 @@ def suggest_documents(
                     uploaded_at=doc.uploaded_at,
                     summary=doc.summary
                 ),
-                score=match["score"],
-                match_reasons=match["reasons"]
+                score=round(suggestion["score"] * 100, 1),
+                match_reasons=[
+                    f"Chunk {chunk['chunk_index']}: {chunk['content'][:200].strip()}"
+                    for chunk in suggestion["evidence"]
+                ]
             ))
     
     return result
@@ -97,30 +97,39 @@ def generate_answer(
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     
-    # Get document contents
-    document_contents = []
-    valid_doc_ids = []
+    documents = crud.get_documents_by_ids(db, request.document_ids)
+    if not documents:
+        raise HTTPException(status_code=400, detail="No valid documents found")
     
-    for doc_id in request.document_ids:
-        document = crud.get_document(db, doc_id)
-        if document:
-            content_text = openai_service._extract_text_from_base64(document.content)
-            document_contents.append(f"Document: {document.name}\n{content_text}")
-            valid_doc_ids.append(doc_id)
+    # Most relevant indexed chunks from only the requested documents, using the stored question vector
+    doc_processor = get_document_processor()
+    query_vector = doc_processor.document_index.question_embeddings.get_matrix(db, [question])[0]
+    chunks = doc_processor.search_by_vector(
+        query_vector, k=GENERATE_ANSWER_CHUNKS, document_ids=[doc.id for doc in documents]
+    )
     
-    if not document_contents:
-        raise HTTPException(status_code=400, detail="No valid documents found")
+    # Documents that haven't been indexed yet contribute their decoded text, after the ranked chunks
+    for document in documents:
+        if document.processing_status != "completed":
+            text = get_openai_service()._extract_text_from_base64(document.content)
+            chunks.extend(
+                {"document_id": document.id, "document_name": document.name, "content": paragraph}
+                for paragraph in split_paragraphs(text)
+            )
     
-    answer_data = openai_service.generate_answer(
+    if not chunks:
+        raise HTTPException(status_code=400, detail="No indexed content found for the selected documents")
+    
+    answer_data = get_openai_service().generate_answer(
         question.title,
         question.content,
-        document_contents
+        chunks
     )
     
     return schemas.AIAnswerResponse(
         suggested_answer=answer_data["suggested_answer"],
         confidence=answer_data["confidence"],
-        sources=valid_doc_ids
+        sources=answer_data["sources"]
     )
 
 @router.post("/extract-tags", response_model=List[str])
@@ -133,7 +142,7 @@ def extract_tags(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    tags = openai_service.extract_tags(document.content, document.name)
+    tags = get_openai_service().extract_tags(document.content, document.name)
     return tags
 
 # === RAG-POWERED ENDPOINTS ===
@@ -150,7 +159,7 @@ def process_document_for_rag(
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Process document for RAG
-    result = doc_processor.process_document(
+    result = get_document_processor().process_document(
         document_content=document.content,
         document_name=document.name,
         document_id=document.id,
@@ -191,7 +200,7 @@ def rag_answer_question(
     }
     
     # Use agentic RAG to answer
-    result = rag_service.answer_predefined_question(question_data)
+    result = get_rag_service().answer_predefined_question(question_data, mode=request.get("mode"))
     
     return {
         "question_id": question_id,
@@ -199,63 +208,151 @@ def rag_answer_question(
         "confidence": result["confidence"],
         "sources": result["sources"],
         "agent_used_retrieval": result["agent_used_retrieval"],
-        "success": result["success"]
+        "success": result["success"],
+        "mode": result.get("mode"),
+        "context_stats": result.get("context_stats")
     }
 
 @router.post("/rag-chat")
 def rag_chat(
     request: Dict[str, Any],
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
 ):
-    """Interactive chat with RAG-powered responses."""
+    """
+    Interactive chat with RAG-powered responses.
+    
+    With a `session_id` the history, summary and previously retrieved chunks come from the
+    server-side session; otherwise the client-supplied `chat_history` is used as before.
+    """
     message = request.get("message", "")
-    chat_history = request.get("chat_history", [])
+    session_id = request.get("session_id")
     
     if not message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
     
+    chat_session = None
+    if session_id:
+        chat_session = crud.get_chat_session(db, session_id, current_user.id)
+        if not chat_session:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        turn = chat_session_service.build_turn_context(db, chat_session)
+        chat_history, context = turn["chat_history"], turn["context"]
+    else:
+        chat_history, context = request.get("chat_history", []), None
+    
     # Use agentic RAG for chat
-    result = rag_service.chat_with_documents(
-        message=message,
-        chat_history=chat_history
-    )
+    with llm_gateway.caller("chat"):
+        result = get_rag_service().chat_with_documents(
+            message=message,
+            chat_history=chat_history,
+            mode=request.get("mode"),
+            context=context
+        )
     
-    # Get detailed source information if documents were used
-    detailed_sources = []
-    used_documents = result.get("agent_used_retrieval", False)
+    # Sources are the chunks the agent actually retrieved while answering
+    used_documents = result.get("used_documents", False)
+    detailed_sources = [
+        {
+            "chunk_id": hit["chunk_id"],
+            "document_id": hit["document_id"],
+            "document_name": hit["document_name"],
+            "chunk_index": hit["chunk_index"],
+            "start_position": hit["start_position"],
+            "end_position": hit["end_position"],
+            "content": hit["content"],
+            "similarity_score": hit["similarity_score"],
+            "query": hit["query"]
+        }
+        for hit in result["retrieval_trace"]["hits"][:5]
+    ]
     
-    # If the agent used retrieval, get the actual source documents
-    if used_documents:
-        similar_docs = doc_processor.search_similar_documents(
-            query=message,
-            k=5,
-            score_threshold=0.2
+    if chat_session and result["success"]:
+        recorded = chat_session_service.record_turn(
+            db, chat_session, message, result["response"],
+            sources=detailed_sources, hits=result["retrieval_trace"]["hits"]
         )
-        
-        # Convert to detailed source format
-        for doc in similar_docs:
-            detailed_sources.append({
-                "document_id": doc["document_id"],
-                "document_name": doc["document_name"],
-                "chunk_index": doc["chunk_index"],
-                "start_position": doc.get("start_position", 0),
-                "end_position": doc.get("end_position", 0),
-                "content": doc["content"],
-                "similarity_score": doc["similarity_score"]
-            })
+        if recorded is None:
+            raise HTTPException(
+                status_code=409,
+                detail="Another message was added to this chat session at the same time; reload it and resend"
+            )
     
     return {
         "response": result["response"],
         "used_documents": used_documents,
         "sources": detailed_sources,
         "success": result["success"],
-        "message_type": result["message_type"]
+        "message_type": result["message_type"],
+        "mode": result.get("mode"),
+        "context_stats": result.get("context_stats"),
+        "session_id": chat_session.id if chat_session else None
     }
 
+def _chat_session_response(chat_session: models.ChatSession, messages: Optional[List[models.ChatMessage]] = None) -> schemas.ChatSessionResponse:
+    return schemas.ChatSessionResponse(
+        id=chat_session.id,
+        title=chat_session.title,
+        summary=chat_session.summary,
+        message_count=chat_session.message_count,
+        created_at=chat_session.created_at,
+        updated_at=chat_session.updated_at,
+        messages=[
+            schemas.ChatMessageResponse(
+                id=message.id,
+                position=message.position,
+                role=message.role,
+                content=message.content,
+                sources=json.loads(message.sources) if message.sources else [],
+                created_at=message.created_at
+            )
+            for message in messages
+        ] if messages is not None else None
+    )
+
+@router.post("/chat-sessions", response_model=schemas.ChatSessionResponse)
+def create_chat_session(
+    session: schemas.ChatSessionCreate,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    return _chat_session_response(crud.create_chat_session(db, current_user.id, title=session.title))
+
+@router.get("/chat-sessions", response_model=List[schemas.ChatSessionResponse])
+def get_chat_sessions(
+    skip: int = 0,
+    limit: int = 50,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    return [_chat_session_response(s) for s in crud.get_chat_sessions(db, current_user.id, skip=skip, limit=limit)]
+
+@router.get("/chat-sessions/{session_id}", response_model=schemas.ChatSessionResponse)
+def get_chat_session(
+    session_id: str,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    chat_session = crud.get_chat_session(db, session_id, current_user.id)
+    if not chat_session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return _chat_session_response(chat_session, crud.get_chat_messages(db, chat_session.id))
+
+@router.delete("/chat-sessions/{session_id}")
+def delete_chat_session(
+    session_id: str,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not crud.delete_chat_session(db, session_id, current_user.id):
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return {"message": "Chat session deleted successfully"}
+
 @router.post("/rag-answer-with-documents")
 def rag_answer_with_documents(
     question_id: str,
     document_ids: List[str],
+    mode: Optional[str] = None,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -281,9 +378,10 @@ def rag_answer_with_documents(
     }
     
     # Use agentic RAG with specific documents
-    result = rag_service.answer_predefined_question(
+    result = get_rag_service().answer_predefined_question(
         question_data=question_data,
-        relevant_document_ids=valid_doc_ids
+        relevant_document_ids=valid_doc_ids,
+        mode=mode
     )
     
     return {
@@ -293,7 +391,9 @@ def rag_answer_with_documents(
         "confidence": result["confidence"],
         "sources": result["sources"],
         "agent_used_retrieval": result["agent_used_retrieval"],
-        "success": result["success"]
+        "success": result["success"],
+        "mode": result.get("mode"),
+        "context_stats": result.get("context_stats")
     }
 
 @router.get("/rag-search")
@@ -301,13 +401,13 @@ def rag_search(
     query: str,
     k: int = 5,
     score_threshold: float = 0.7,
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: auth.TokenUser = Depends(auth.get_current_claims)
 ):
     """Search documents using RAG vector similarity."""
     if not query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
-    results = doc_processor.search_similar_documents(
+    results = get_document_processor().search_similar_documents(
         query=query,
         k=k,
         score_threshold=score_threshold
@@ -320,9 +420,9 @@ def rag_search(
     }
 
 @router.get("/rag-status")
-def rag_status(current_user: models.User = Depends(auth.get_current_user)):
+def rag_status(current_user: auth.TokenUser = Depends(auth.get_current_claims)):
     """Get status of the RAG system."""
-    return rag_service.get_system_status()
+    return get_rag_service().get_system_status()
 
 @router.post("/bulk-process-documents-for-rag")
 def bulk_process_documents_for_rag(
@@ -332,6 +432,7 @@ def bulk_process_documents_for_rag(
     """Process all documents in the database for RAG."""
     documents = crud.get_documents(db, limit=1000)  # Get all documents
     
+    doc_processor = get_document_processor()
     results = []
     successful = 0
     failed = 0
@@ -384,31 +485,43 @@ def batch_answer_questions(
     current_user: models.User = Depends(auth.get_current_seller),
     db: Session = Depends(get_db)
 ):
-    """Batch process questions to auto-answer using available documents"""
-    from services.qa_automation import qa_automation_service
-    
-    question_ids = request.get("question_ids", [])
-    if not question_ids:
-        # Process all pending questions if none specified
-        pending_questions = crud.get_questions(db, status="pending")
-        question_ids = [q.id for q in pending_questions]
-    
-    if not question_ids:
-        return {
-            "message": "No pending questions to process",
-            "results": {
-                "answered": [],
-                "no_answer": [],
-                "errors": []
-            }
-        }
-    
-    results = qa_automation_service.batch_process_questions(db, question_ids)
+    """Queue a durable job that auto-answers questions using available documents"""
+    # Answer every pending question if none are specified
+    question_ids = request.get("question_ids") or None
+    job = enqueue_job(db, "batch_answer", {"question_ids": question_ids})
     
     return {
-        "message": f"Processed {len(question_ids)} questions",
-        "results": results
+        "message": "Batch answering queued",
+        "job": _batch_job_response(job)
+    }
+
+@router.get("/batch-answer-questions/{job_id}")
+def get_batch_answer_job(
+    job_id: str,
+    current_user: models.User = Depends(auth.get_current_seller),
+    db: Session = Depends(get_db)
+):
+    """Get progress and, once finished, counters and results for a batch answering job"""
+    job = crud.get_job(db, job_id)
+    if not job or job.type != "batch_answer":
+        raise HTTPException(status_code=404, detail="Batch job not found")
+    return _batch_job_response(job)
+
+def _batch_job_response(job: models.Job) -> Dict[str, Any]:
+    response = {
+        "job_id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "progress": job.progress,
+        "progress_message": job.progress_message,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
     }
+    # Counters and per-question results are stored as the job result when it succeeds
+    if job.result:
+        response.update(json.loads(job.result))
+    return response
 
 @router.post("/auto-answer-question/{question_id}")
 def auto_answer_single_question(
@@ -425,20 +538,14 @@ def auto_answer_single_question(
         return {"message": "Question is not pending", "status": question.status}
     
     try:
-        # Use agentic RAG to answer
-        rag_response = rag_service.answer_question(question.content)
+        # Tracker questions always need retrieval, so the router sends them down the fast path
+        rag_response = get_rag_service().answer(question.content, source="tracker")
         
         if not rag_response.get("answer") or not rag_response.get("success"):
             return {"message": "Could not generate answer", "error": "No answer from RAG"}
         
-        # Find relevant documents
-        relevant_docs = doc_processor.search_similar_documents(
-            query=question.content,
-            k=3,
-            score_threshold=0.3
-        )
-        
-        relevant_doc_ids = [doc.get("document_id") for doc in relevant_docs if doc.get("document_id")]
+        # Relevant documents are the ones the agent retrieved while answering
+        relevant_doc_ids = trace_document_ids(rag_response["retrieval_trace"], min_score=0.3)
         
         # Update question with answer
         updated_question = crud.answer_question(
@@ -459,6 +566,8 @@ def auto_answer_single_question(
         else:
             return {"message": "Failed to update question", "error": "Database update failed"}
             
+    except (LLMUnavailableError, LLMRequestError):
+        raise
     except Exception as e:
         logger.error(f"Error auto-answering question {question_id}: {e}")
-        return {"message": "Error processing question", "error": str(e)}
\ No newline at end of file
+        return {"message": "Error processing question", "error": str(e)}
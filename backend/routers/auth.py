@@ -31,7 +31,7 @@ def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
         )
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=auth.token_data(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Literal
 import base64
 import json
 
@@ -8,7 +9,11 @@ from database import get_db
 from models import schemas, models
 import crud
 import auth
-from services.document_processor import DocumentProcessor
+from pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+from fast_json import FastJSONResponse
+from response_cache import conditional_response
+from services.providers import get_document_processor
+from services.job_queue import enqueue_job
 
 router = APIRouter()
 
@@ -37,26 +42,8 @@ async def upload_document(
     
     db_document = crud.create_document(db, document_create, current_user.id)
     
-    # Auto-trigger RAG processing for uploaded document
-    try:
-        doc_processor = DocumentProcessor()
-        processing_result = doc_processor.process_document(
-            db_document.content, 
-            db_document.name, 
-            db_document.id,
-            db
-        )
-        
-        # Trigger question auto-answering after document processing
-        if processing_result.get("success"):
-            from services.qa_automation import qa_automation_service
-            qa_automation_service.process_new_document(db, db_document.id)
-            
-    except Exception as e:
-        # Log error but don't fail the upload
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"Auto-processing failed for document {db_document.id}: {e}")
+    # Processing and auto-answering run on the durable job queue, so the upload returns immediately
+    job = enqueue_job(db, "process_document", {"document_id": db_document.id})
     
     return schemas.DocumentResponse(
         id=db_document.id,
@@ -66,54 +53,87 @@ async def upload_document(
         tags=json.loads(db_document.tags),
         uploaded_by=db_document.uploader.name,
         uploaded_at=db_document.uploaded_at,
-        summary=db_document.summary
+        summary=db_document.summary,
+        processing_status=db_document.processing_status,
+        job_id=job.id
     )
 
 @router.get("/", response_model=List[schemas.DocumentResponse])
 def get_documents(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     tags: Optional[str] = None,
-    current_user: models.User = Depends(auth.get_current_user),
+    tag_mode: Literal["all", "any"] = "all",
+    cursor: Optional[str] = None,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
-    tags_list = tags.split(",") if tags else None
-    documents = crud.get_documents(db, skip=skip, limit=limit, tags=tags_list)
-    
-    return [
-        schemas.DocumentResponse(
-            id=doc.id,
-            name=doc.name,
-            size=doc.size,
-            type=doc.type,
-            tags=json.loads(doc.tags),
-            uploaded_by=doc.uploader.name,
-            uploaded_at=doc.uploaded_at,
-            summary=doc.summary
-        )
-        for doc in documents
-    ]
+    """
+    Newest documents first, optionally only those with all (`tag_mode=all`) or any (`tag_mode=any`)
+    of the comma-separated `tags`. When a full page is returned, the X-Next-Cursor header holds a
+    cursor for the next page; pass it back as `cursor` (instead of `skip`) to continue.
+    
+    Responses carry an ETag; send it back in If-None-Match to get 304 Not Modified while no
+    document has changed.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    tags_list = crud.normalize_tags(tags.split(",")) if tags else None
+    
+    def build():
+        # Rows come back already shaped like DocumentResponse, so they are encoded without re-validation
+        documents = crud.get_document_rows(db, skip=0 if after else skip, limit=limit, tags=tags_list or None,
+                                           tag_mode=tag_mode, after=after)
+        headers = {}
+        if documents and len(documents) == limit:
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(documents[-1]["uploaded_at"], documents[-1]["id"])
+        return FastJSONResponse(documents, headers=headers)
+    
+    return conditional_response(request, db, ("documents",), build)
+
+@router.get("/tags", response_model=List[schemas.TagCount])
+def get_document_tag_counts(
+    request: Request,
+    tags: Optional[str] = None,
+    tag_mode: Literal["all", "any"] = "all",
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    """Document count per tag, most used first; with `tags`, counted within the documents that match them"""
+    tags_list = crud.normalize_tags(tags.split(",")) if tags else None
+    return conditional_response(request, db, ("documents",), lambda: FastJSONResponse([
+        {"tag": tag, "count": count}
+        for tag, count in crud.get_document_tag_counts(db, tags=tags_list or None, tag_mode=tag_mode)
+    ]))
 
 @router.get("/{document_id}", response_model=schemas.DocumentResponse)
 def get_document(
     document_id: str,
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
-    document = crud.get_document(db, document_id)
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    def build():
+        document = crud.get_document(db, document_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        return FastJSONResponse(schemas.DocumentResponse(
+            id=document.id,
+            name=document.name,
+            size=document.size,
+            type=document.type,
+            tags=json.loads(document.tags),
+            uploaded_by=document.uploader.name,
+            uploaded_at=document.uploaded_at,
+            summary=document.summary
+        ).model_dump(mode="json"))
     
-    return schemas.DocumentResponse(
-        id=document.id,
-        name=document.name,
-        size=document.size,
-        type=document.type,
-        tags=json.loads(document.tags),
-        uploaded_by=document.uploader.name,
-        uploaded_at=document.uploaded_at,
-        summary=document.summary
-    )
+    return conditional_response(request, db, ("documents",), build)
 
 @router.delete("/{document_id}")
 def delete_document(
@@ -134,68 +154,82 @@ def delete_document(
 @router.get("/{document_id}/content")
 def get_document_content(
     document_id: str,
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
-    document = crud.get_document(db, document_id)
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
+    def build():
+        document = crud.get_document(db, document_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        return FastJSONResponse({"content": document.content})
     
-    return {"content": document.content}
+    # Whole files are too large to keep in memory, so this only gets the ETag
+    return conditional_response(request, db, ("documents",), build, store=False)
 
 @router.get("/{document_id}/preview")
 def get_document_preview(
     document_id: str,
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
     """Get document content and chunks for preview with highlighting."""
-    document = crud.get_document(db, document_id)
-    if not document:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
-    doc_processor = DocumentProcessor()
-    
-    # Get document text content
-    document_text = doc_processor.get_document_text(document_id)
-    
-    # Get all chunks for this document
-    chunks = doc_processor.get_document_chunks(document_id)
+    def build():
+        document = crud.get_document(db, document_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        doc_processor = get_document_processor()
+        
+        # Get document text content
+        document_text = doc_processor.get_document_text(document_id)
+        
+        # Get all chunks for this document
+        chunks = doc_processor.get_document_chunks(document_id)
+        
+        return FastJSONResponse(jsonable_encoder({
+            "document_id": document_id,
+            "document_name": document.name,
+            "document_type": document.type,
+            "text_content": document_text,
+            "chunks": chunks,
+            "processing_status": document.processing_status
+        }))
     
-    return {
-        "document_id": document_id,
-        "document_name": document.name,
-        "document_type": document.type,
-        "text_content": document_text,
-        "chunks": chunks,
-        "processing_status": document.processing_status
-    }
+    # The vector store's chunks are written in the same processing run as the chunk rows
+    return conditional_response(request, db, ("documents", "chunks"), build)
 
 @router.get("/{document_id}/chunks/{chunk_id}")
 def get_document_chunk(
     document_id: str,
     chunk_id: str,
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
     """Get specific chunk content with position data for highlighting."""
-    chunk = db.query(models.DocumentChunk).filter(
-        models.DocumentChunk.document_id == document_id,
-        models.DocumentChunk.id == chunk_id
-    ).first()
-    
-    if not chunk:
-        raise HTTPException(status_code=404, detail="Chunk not found")
+    def build():
+        chunk = db.query(models.DocumentChunk).filter(
+            models.DocumentChunk.document_id == document_id,
+            models.DocumentChunk.id == chunk_id
+        ).first()
+        
+        if not chunk:
+            raise HTTPException(status_code=404, detail="Chunk not found")
+        
+        return FastJSONResponse({
+            "chunk_id": chunk.id,
+            "document_id": chunk.document_id,
+            "content": chunk.content,
+            "chunk_index": chunk.chunk_index,
+            "start_position": chunk.start_position,
+            "end_position": chunk.end_position,
+            "chunk_length": chunk.chunk_length
+        })
     
-    return {
-        "chunk_id": chunk.id,
-        "document_id": chunk.document_id,
-        "content": chunk.content,
-        "chunk_index": chunk.chunk_index,
-        "start_position": chunk.start_position,
-        "end_position": chunk.end_position,
-        "chunk_length": chunk.chunk_length
-    }
+    return conditional_response(request, db, ("chunks",), build)
 
 @router.post("/{document_id}/process")
 async def process_document_for_rag(
@@ -208,7 +242,7 @@ async def process_document_for_rag(
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    doc_processor = DocumentProcessor()
+    doc_processor = get_document_processor()
     result = doc_processor.process_document(
         document.content, 
         document.name, 
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import json
+
+from database import get_db
+from models import schemas, models
+import crud
+import auth
+
+router = APIRouter()
+
+def _job_response(job: models.Job) -> schemas.JobResponse:
+    return schemas.JobResponse(
+        id=job.id,
+        type=job.type,
+        status=job.status,
+        attempts=job.attempts,
+        max_attempts=job.max_attempts,
+        progress=job.progress,
+        progress_message=job.progress_message,
+        payload=json.loads(job.payload),
+        result=json.loads(job.result) if job.result else None,
+        error=job.error,
+        run_after=job.run_after,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+        finished_at=job.finished_at
+    )
+
+@router.get("/", response_model=List[schemas.JobResponse])
+def get_jobs(
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    type: Optional[str] = None,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    jobs = crud.get_jobs(db, skip=skip, limit=limit, status=status, job_type=type)
+    return [_job_response(job) for job in jobs]
+
+@router.get("/{job_id}", response_model=schemas.JobResponse)
+def get_job(
+    job_id: str,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    job = crud.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Literal
 import json
 
 from database import get_db
 from models import schemas, models
 import crud
 import auth
+from pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+from fast_json import FastJSONResponse
+from response_cache import conditional_response
 from services.question_processor import question_processor
+from services.question_dedup import build_clusters
 
 router = APIRouter()
 
@@ -31,71 +36,109 @@ def create_question(
         answer=db_question.answer,
         answered_by=db_question.answerer.name if db_question.answerer else None,
         answered_at=db_question.answered_at,
-        related_documents=[doc.id for doc in db_question.related_documents]
+        related_documents=[doc.id for doc in db_question.related_documents],
+        duplicate_of=db_question.duplicate_of_id
     )
 
 @router.get("/", response_model=List[schemas.QuestionResponse])
 def get_questions(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     status: Optional[str] = None,
-    current_user: models.User = Depends(auth.get_current_user),
+    tags: Optional[str] = None,
+    tag_mode: Literal["all", "any"] = "all",
+    cursor: Optional[str] = None,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
+    """
+    Newest questions first, optionally only those with all (`tag_mode=all`) or any (`tag_mode=any`)
+    of the comma-separated `tags`. When a full page is returned, the X-Next-Cursor header holds a
+    cursor for the next page; pass it back as `cursor` (instead of `skip`) to continue.
+    
+    Responses carry an ETag; send it back in If-None-Match to get 304 Not Modified while no
+    question has changed.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
     user_id = current_user.id if current_user.role == "buyer" else None
-    print(f"DEBUG: Current user: {current_user.email}, Role: {current_user.role}, ID: {current_user.id}")
-    print(f"DEBUG: Filtering by user_id: {user_id}")
-    questions = crud.get_questions(db, skip=skip, limit=limit, status=status, user_id=user_id)
-    print(f"DEBUG: Found {len(questions)} questions")
+    tags_list = crud.normalize_tags(tags.split(",")) if tags else None
     
-    result = []
-    for q in questions:
-        try:
-            question_response = schemas.QuestionResponse(
-                id=q.id,
-                title=q.title,
-                content=q.content,
-                status=q.status,
-                priority=q.priority,
-                tags=json.loads(q.tags),
-                asked_by=q.asker.name,
-                asked_at=q.asked_at,
-                answer=q.answer,
-                answered_by=q.answerer.name if q.answerer else None,
-                answered_at=q.answered_at,
-                related_documents=[doc.id for doc in q.related_documents]
-            )
-            result.append(question_response)
-        except Exception as e:
-            print(f"DEBUG: Error serializing question {q.id}: {e}")
+    def build():
+        # Rows come back already shaped like QuestionResponse, so they are encoded without re-validation
+        questions = crud.get_question_rows(db, skip=0 if after else skip, limit=limit, status=status, user_id=user_id,
+                                           after=after, tags=tags_list or None, tag_mode=tag_mode)
+        headers = {}
+        if questions and len(questions) == limit:
+            headers[NEXT_CURSOR_HEADER] = encode_cursor(questions[-1]["asked_at"], questions[-1]["id"])
+        return FastJSONResponse(questions, headers=headers)
     
-    print(f"DEBUG: Returning {len(result)} questions")
-    return result
+    # Buyers only see their own questions, so their responses are keyed by their ID
+    return conditional_response(request, db, ("questions",), build, scope=user_id or "all")
+
+@router.get("/duplicates", response_model=List[schemas.DuplicateCluster])
+def get_duplicate_clusters(
+    request: Request,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    """Near-duplicate questions grouped under the canonical question they are linked to"""
+    user_id = current_user.id if current_user.role == "buyer" else None
+    return conditional_response(
+        request, db, ("questions",),
+        lambda: FastJSONResponse(jsonable_encoder(build_clusters(crud.get_duplicate_question_rows(db, user_id=user_id)))),
+        scope=user_id or "all"
+    )
+
+@router.get("/tags", response_model=List[schemas.TagCount])
+def get_question_tag_counts(
+    request: Request,
+    tags: Optional[str] = None,
+    tag_mode: Literal["all", "any"] = "all",
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
+    db: Session = Depends(get_db)
+):
+    """Question count per tag, most used first; buyers only see counts over their own questions"""
+    user_id = current_user.id if current_user.role == "buyer" else None
+    tags_list = crud.normalize_tags(tags.split(",")) if tags else None
+    return conditional_response(request, db, ("questions",), lambda: FastJSONResponse([
+        {"tag": tag, "count": count}
+        for tag, count in crud.get_question_tag_counts(db, user_id=user_id, tags=tags_list or None, tag_mode=tag_mode)
+    ]), scope=user_id or "all")
 
 @router.get("/{question_id}", response_model=schemas.QuestionResponse)
 def get_question(
     question_id: str,
-    current_user: models.User = Depends(auth.get_current_user),
+    request: Request,
+    current_user: auth.TokenUser = Depends(auth.get_current_claims),
     db: Session = Depends(get_db)
 ):
-    question = crud.get_question(db, question_id)
-    if not question:
-        raise HTTPException(status_code=404, detail="Question not found")
+    def build():
+        question = crud.get_question(db, question_id)
+        if not question:
+            raise HTTPException(status_code=404, detail="Question not found")
+        
+        return FastJSONResponse(schemas.QuestionResponse(
+            id=question.id,
+            title=question.title,
+            content=question.content,
+            status=question.status,
+            priority=question.priority,
+            tags=json.loads(question.tags),
+            asked_by=question.asker.name,
+            asked_at=question.asked_at,
+            answer=question.answer,
+            answered_by=question.answerer.name if question.answerer else None,
+            answered_at=question.answered_at,
+            related_documents=[doc.id for doc in question.related_documents],
+            duplicate_of=question.duplicate_of_id
+        ).model_dump(mode="json"))
     
-    return schemas.QuestionResponse(
-        id=question.id,
-        title=question.title,
-        content=question.content,
-        status=question.status,
-        priority=question.priority,
-        tags=json.loads(question.tags),
-        asked_by=question.asker.name,
-        asked_at=question.asked_at,
-        answer=question.answer,
-        answered_by=question.answerer.name if question.answerer else None,
-        answered_at=question.answered_at,
-        related_documents=[doc.id for doc in question.related_documents]
-    )
+    return conditional_response(request, db, ("questions",), build)
 
 @router.put("/{question_id}/answer", response_model=schemas.QuestionResponse)
 def answer_question(
@@ -122,7 +165,8 @@ def answer_question(
         answer=question.answer,
         answered_by=question.answerer.name if question.answerer else None,
         answered_at=question.answered_at,
-        related_documents=[doc.id for doc in question.related_documents]
+        related_documents=[doc.id for doc in question.related_documents],
+        duplicate_of=question.duplicate_of_id
     )
 
 @router.put("/{question_id}/status", response_model=schemas.QuestionResponse)
@@ -148,7 +192,8 @@ def update_question_status(
         answer=question.answer,
         answered_by=question.answerer.name if question.answerer else None,
         answered_at=question.answered_at,
-        related_documents=[doc.id for doc in question.related_documents]
+        related_documents=[doc.id for doc in question.related_documents],
+        duplicate_of=question.duplicate_of_id
     )
 
 @router.post("/upload-text", response_model=List[schemas.QuestionResponse])
@@ -182,10 +227,11 @@ def upload_questions_text(
             tags=json.loads(q["tags"]),
             asked_by=current_user.name,
             asked_at=q["asked_at"],
-            answer=None,
+            answer=q["answer"],
             answered_by=None,
-            answered_at=None,
-            related_documents=[]
+            answered_at=q["answered_at"],
+            related_documents=[],
+            duplicate_of=q["duplicate_of"]
         )
         for q in created_questions
     ]
@@ -236,10 +282,11 @@ def upload_questions_files(
             tags=json.loads(q["tags"]),
             asked_by=current_user.name,
             asked_at=q["asked_at"],
-            answer=None,
+            answer=q["answer"],
             answered_by=None,
-            answered_at=None,
-            related_documents=[]
+            answered_at=q["answered_at"],
+            related_documents=[],
+            duplicate_of=q["duplicate_of"]
         )
         for q in all_created_questions
     ]
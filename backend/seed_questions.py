@@ -167,6 +167,7 @@ def seed_questions():
                 status=status,
                 priority=q_data["priority"],
                 tags=json.dumps(tags),
+                tag_rows=[models.QuestionTag(tag=tag) for tag in crud.normalize_tags(tags)],
                 asked_by_id=buyer.id,
                 answer=answer,
                 answered_by_id=answered_by_id,
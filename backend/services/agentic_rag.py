@@ -1,15 +1,29 @@
 from typing import List, Dict, Any, Optional
 import os
-from langchain_openai import ChatOpenAI
+import re
+import time
 from langchain_core.tools import tool
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from .document_processor import DocumentProcessor
+from .providers import get_document_processor
+from .retrieval_trace import collect_retrieval_trace, record_search
+from .latency_stats import LatencyStats
+from .context_packer import ContextPacker
+from .llm_gateway import llm_gateway, LLMRequestError, LLMUnavailableError
 import json
 
+ANSWER_MODES = ("agent", "fast")
+
+# Openers that mark a message as a document request rather than small talk
+_REQUEST_OPENERS = re.compile(
+    r"^(what|which|who|when|where|how|why|is|are|does|do|did|has|have|can|could|please|provide|list|describe|"
+    r"explain|summari[sz]e|detail|identify|confirm|share|give|show|outline)\b",
+    re.IGNORECASE
+)
+
 
 class AgenticRAGService:
     """
@@ -17,13 +31,16 @@ class AgenticRAGService:
     Implements best practices from LangChain 2025 for agentic RAG systems.
     """
     
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            model="gpt-4o-mini",
-            temperature=0.3
-        )
-        self.doc_processor = DocumentProcessor()
+    def __init__(self, doc_processor=None):
+        self.llm = llm_gateway.chat_model(model="gpt-4o-mini", temperature=0.3)
+        # Shares the process-wide vector store unless the caller supplies its own
+        self.doc_processor = doc_processor or get_document_processor()
+        self.default_mode = os.getenv("RAG_ANSWER_MODE", "auto")
+        self.fast_path_k = int(os.getenv("RAG_FAST_PATH_K", "6"))
+        # Chunks ranked from the documents a tracker question is focused on
+        self.focus_k = int(os.getenv("RAG_FOCUS_K", "20"))
+        self.latency_stats = LatencyStats()
+        self.context_packer = ContextPacker("gpt-4o-mini")
         
         # Create retriever tool
         self.retriever_tool = self._create_retriever_tool()
@@ -49,6 +66,7 @@ class AgenticRAGService:
     def _create_retriever_tool(self):
         """Create a tool that the agent can use to search documents."""
         doc_processor = self.doc_processor  # Capture reference
+        context_packer = self.context_packer
         
         @tool
         def search_documents(query: str, k: int = 5) -> str:
@@ -59,20 +77,24 @@ class AgenticRAGService:
                     k=k, 
                     score_threshold=0.2  # Much lower threshold for L2 distance conversion
                 )
+                record_search(query, k, relevant_docs)
                 
                 if not relevant_docs:
                     return "No relevant documents found for the query."
                 
-                # Format results for the agent
-                result = f"Found {len(relevant_docs)} relevant document chunks:\n\n"
-                
-                for i, doc in enumerate(relevant_docs, 1):
-                    result += f"--- Document {i} ---\n"
-                    result += f"Source: {doc['document_name']} (Chunk {doc['chunk_index']})\n"
-                    result += f"Relevance Score: {doc['similarity_score']:.2f}\n"
-                    result += f"Content: {doc['content']}\n\n"
+                # Format results for the agent, keeping each search within half the context budget
+                packed = context_packer.pack(
+                    relevant_docs,
+                    budget=context_packer.budget // 2,
+                    format_chunk=lambda i, doc: (
+                        f"--- Document {i} ---\n"
+                        f"Source: {doc['document_name']} (Chunk {doc['chunk_index']})\n"
+                        f"Relevance Score: {doc['similarity_score']:.2f}\n"
+                        f"Content: {doc['content']}\n\n"
+                    )
+                )
                 
-                return result
+                return f"Found {packed['stats']['chunks_used']} relevant document chunks:\n\n" + packed["text"]
                 
             except Exception as e:
                 return f"Error searching documents: {str(e)}"
@@ -128,7 +150,8 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
             tools=tools,
             verbose=True,
             handle_parsing_errors=True,
-            max_iterations=5
+            max_iterations=5,
+            return_intermediate_steps=True
         )
         
         return agent_executor
@@ -151,46 +174,161 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
             if context:
                 input_text = f"Context: {context}\n\nQuestion: {question}"
             
-            # Run the agent
-            result = self.agent_executor.invoke({
-                "input": input_text,
-                "chat_history": chat_history or []
-            })
+            # Run the agent, recording every search the retriever tool performs
+            with collect_retrieval_trace() as trace:
+                result = self.agent_executor.invoke({
+                    "input": input_text,
+                    "chat_history": chat_history or []
+                })
+            
+            return {
+                "answer": result["output"],
+                "success": True,
+                "agent_used_retrieval": trace.used_retrieval,
+                "sources_consulted": trace.document_names(),
+                "retrieval_trace": trace.to_dict()
+            }
+            
+        except (LLMUnavailableError, LLMRequestError):
+            raise
+        except Exception as e:
+            return {
+                "answer": f"Error processing question: {str(e)}",
+                "success": False,
+                "agent_used_retrieval": False,
+                "sources_consulted": [],
+                "retrieval_trace": {"searches": [], "hits": []}
+            }
+    
+    def answer_question_fast(self, question: str, context: Optional[str] = None, k: Optional[int] = None,
+                             search: bool = True) -> Dict[str, Any]:
+        """
+        Answer with a single retrieve-then-generate pass instead of the agent loop.
+        
+        Embeds the question once, retrieves the top-k chunks, packs them into the prompt
+        and makes one generation call.
+        
+        Args:
+            question: The question to answer
+            context: Optional additional context
+            k: Number of chunks to retrieve (defaults to RAG_FAST_PATH_K)
+            search: False when `context` already holds the retrieved excerpts; no search is run
+            
+        Returns:
+            Dictionary with the same shape as answer_question
+        """
+        k = k or self.fast_path_k
+        search = search or not context
+        try:
+            with collect_retrieval_trace() as trace:
+                if search:
+                    relevant_docs = self.doc_processor.search_similar_documents(
+                        query=question,
+                        k=k,
+                        score_threshold=0.2
+                    )
+                    record_search(question, k, relevant_docs)
             
-            # Check if retrieval was used by looking for tool usage in the output
-            output = result.get("output", "")
-            intermediate_steps = result.get("intermediate_steps", [])
+            if search:
+                # Highest-ranked chunks that fit the model's context budget
+                packed = self.context_packer.pack(relevant_docs)
+                excerpts = packed["text"] or "No relevant document excerpts were found."
+                
+                prompt = f"Document excerpts:\n\n{excerpts}\n"
+                if context:
+                    prompt += f"\nContext: {context}\n"
+            else:
+                packed = {"stats": None}
+                prompt = f"{context}\n"
+            prompt += f"\nQuestion: {question}"
             
-            # Agent used retrieval if there are intermediate steps or if specific documents are mentioned
-            used_retrieval = (
-                len(intermediate_steps) > 0 or 
-                "Insurance_Cyber.pdf" in output or 
-                "Board_Meeting_Minutes" in output or
-                "document titled" in output.lower()
-            )
+            response = self.llm.invoke([
+                SystemMessage(content=(
+                    "You are an expert financial analyst helping with due diligence questions. "
+                    "Answer using only the document excerpts provided, citing the source documents by name. "
+                    "If the excerpts don't contain enough information, clearly state what's missing."
+                )),
+                HumanMessage(content=prompt)
+            ])
             
             return {
-                "answer": result["output"],
+                "answer": response.content,
                 "success": True,
-                "agent_used_retrieval": used_retrieval,
-                "sources_consulted": self._extract_sources_from_result(result)
+                "agent_used_retrieval": trace.used_retrieval,
+                "sources_consulted": trace.document_names(),
+                "retrieval_trace": trace.to_dict(),
+                "context_stats": packed["stats"]
             }
             
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return {
                 "answer": f"Error processing question: {str(e)}",
                 "success": False,
                 "agent_used_retrieval": False,
-                "sources_consulted": []
+                "sources_consulted": [],
+                "retrieval_trace": {"searches": [], "hits": []}
             }
     
-    def answer_predefined_question(self, question_data: Dict[str, Any], relevant_document_ids: List[str] = None) -> Dict[str, Any]:
+    def route_question(self, question: str, chat_history: Optional[List] = None, source: str = "chat") -> str:
+        """
+        Pick the answer mode for a request without calling the LLM.
+        
+        Tracker questions always need retrieval, so they take the fast path. Chat turns with
+        history go to the agent, which can resolve references to earlier turns; standalone
+        chat messages take the fast path only when they read like a document request.
+        """
+        if source == "tracker":
+            return "fast"
+        if chat_history:
+            return "agent"
+        
+        text = question.strip()
+        if len(text.split()) >= 4 and ("?" in text or _REQUEST_OPENERS.match(text)):
+            return "fast"
+        return "agent"
+    
+    def answer(self, question: str, mode: Optional[str] = None, context: Optional[str] = None,
+               chat_history: Optional[List] = None, source: str = "chat", search: bool = True) -> Dict[str, Any]:
+        """
+        Answer a question with the agent or the fast path, recording per-mode latency.
+        
+        Args:
+            question: The question to answer
+            mode: "agent", "fast" or "auto" (defaults to RAG_ANSWER_MODE)
+            context: Optional additional context
+            chat_history: Optional chat history for context (agent mode only)
+            source: Where the question came from, "tracker" or "chat", used by the router
+            search: False when `context` already holds the retrieved excerpts, so the fast
+                path answers from them instead of searching again
+            
+        Returns:
+            Dictionary containing the answer, retrieval trace and the mode used
+        """
+        mode = mode or self.default_mode
+        if mode not in ANSWER_MODES:
+            mode = self.route_question(question, chat_history, source)
+        
+        start = time.perf_counter()
+        if mode == "fast":
+            result = self.answer_question_fast(question, context=context, search=search)
+        else:
+            result = self.answer_question(question, context=context, chat_history=chat_history)
+        self.latency_stats.record(mode, time.perf_counter() - start, error=not result["success"])
+        
+        result["mode"] = mode
+        return result
+    
+    def answer_predefined_question(self, question_data: Dict[str, Any], relevant_document_ids: List[str] = None,
+                                   mode: Optional[str] = None) -> Dict[str, Any]:
         """
         Answer a predefined question from the question list, optionally focusing on specific documents.
         
         Args:
             question_data: Dictionary containing question title, content, and metadata
             relevant_document_ids: Optional list of document IDs to focus the search on
+            mode: Optional answer mode override ("agent", "fast" or "auto")
             
         Returns:
             Dictionary containing the comprehensive answer
@@ -202,39 +340,43 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
             # Create comprehensive query
             query = f"Question: {question_title}\nDetails: {question_content}"
             
-            # If specific documents are provided, search within those first
-            if relevant_document_ids:
-                # Get chunks from specific documents
-                all_relevant_chunks = []
-                for doc_id in relevant_document_ids:
-                    chunks = self.doc_processor.get_document_chunks(doc_id)
-                    all_relevant_chunks.extend(chunks)
-                
-                # Also do a general search
-                search_results = self.doc_processor.search_similar_documents(
-                    query=query, 
-                    k=8, 
-                    score_threshold=0.6
-                )
+            # Collect one trace across the pre-search and the agent run
+            with collect_retrieval_trace():
+                # If specific documents are provided, search within those first
+                if relevant_document_ids:
+                    # One query embedding, ranked against the given documents' chunks and the whole collection
+                    query_embedding = self.doc_processor.embeddings.embed_query(query)
+                    focused_results = self.doc_processor.search_by_vector(
+                        query_embedding,
+                        k=self.focus_k,
+                        document_ids=relevant_document_ids
+                    )
+                    record_search(query, self.focus_k, focused_results)
                 
-                # Combine and deduplicate
-                all_sources = all_relevant_chunks + [
-                    {"content": r["content"], "metadata": r["metadata"]} 
-                    for r in search_results
-                ]
+                    # Also do a general search
+                    search_results = self.doc_processor.search_by_embedding(
+                        query_embedding,
+                        k=8,
+                        score_threshold=0.6
+                    )
+                    record_search(query, 8, search_results)
                 
-                # Remove duplicates based on content similarity
-                unique_sources = self._deduplicate_sources(all_sources)
+                    # Merge by score so the best hits come first, then drop duplicates
+                    ranked = sorted(focused_results + search_results, key=lambda r: r["similarity_score"], reverse=True)
+                    unique_sources = self._deduplicate_sources(ranked)
                 
-                # Format context for the agent
-                context = self._format_sources_for_context(unique_sources[:6])  # Limit to 6 most relevant
-                query_with_context = f"Based on the following document excerpts:\n\n{context}\n\n{query}"
+                    # Pack the highest-ranked sources that fit the context budget
+                    packed = self.context_packer.pack(unique_sources)
+                    context = f"Based on the following document excerpts:\n\n{packed['text']}"
+                    context_stats = packed["stats"]
                 
-            else:
-                query_with_context = query
+                else:
+                    context = None
+                    context_stats = None
             
-            # Use the agent to answer
-            result = self.answer_question(query_with_context)
+                # Answer with the agent or the fast path, whichever the router picks
+                # The pre-search already retrieved and packed the excerpts, so the fast path reuses them
+                result = self.answer(query, mode=mode, context=context, source="tracker", search=context is None)
             
             # Enhance with confidence scoring
             confidence_score = self._calculate_confidence_score(result, question_data)
@@ -245,25 +387,34 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
                 "sources": result.get("sources_consulted", []),
                 "agent_used_retrieval": result.get("agent_used_retrieval", False),
                 "success": result["success"],
-                "question_type": question_data.get("priority", "medium")
+                "question_type": question_data.get("priority", "medium"),
+                "retrieval_trace": result.get("retrieval_trace", {"searches": [], "hits": []}),
+                "mode": result["mode"],
+                "context_stats": context_stats or result.get("context_stats")
             }
             
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return {
                 "suggested_answer": f"Error answering predefined question: {str(e)}",
                 "confidence": 0.0,
                 "sources": [],
                 "agent_used_retrieval": False,
-                "success": False
+                "success": False,
+                "retrieval_trace": {"searches": [], "hits": []}
             }
     
-    def chat_with_documents(self, message: str, chat_history: List[Dict] = None) -> Dict[str, Any]:
+    def chat_with_documents(self, message: str, chat_history: List[Dict] = None, mode: Optional[str] = None,
+                            context: Optional[str] = None) -> Dict[str, Any]:
         """
         Interactive chat interface that can reference documents when needed.
         
         Args:
             message: User message
             chat_history: Previous chat messages
+            mode: Optional answer mode override ("agent", "fast" or "auto")
+            context: Optional conversation context (session summary and cached excerpts)
             
         Returns:
             Chat response with document context when relevant
@@ -276,47 +427,34 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
                     if msg.get("role") == "user":
                         lc_chat_history.append(HumanMessage(content=msg["content"]))
                     elif msg.get("role") == "assistant":
-                        lc_chat_history.append(SystemMessage(content=msg["content"]))
+                        lc_chat_history.append(AIMessage(content=msg["content"]))
             
-            # Use agent to process the message
-            result = self.answer_question(message, chat_history=lc_chat_history)
+            # Let the router pick the agent or the fast path for this turn
+            result = self.answer(message, mode=mode, context=context, chat_history=lc_chat_history, source="chat")
             
             return {
                 "response": result["answer"],
                 "used_documents": result.get("agent_used_retrieval", False),
                 "sources": result.get("sources_consulted", []),
                 "success": result["success"],
-                "message_type": "chat"
+                "message_type": "chat",
+                "retrieval_trace": result.get("retrieval_trace", {"searches": [], "hits": []}),
+                "mode": result["mode"],
+                "context_stats": result.get("context_stats")
             }
             
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return {
                 "response": f"Sorry, I encountered an error: {str(e)}",
                 "used_documents": False,
                 "sources": [],
                 "success": False,
-                "message_type": "error"
+                "message_type": "error",
+                "retrieval_trace": {"searches": [], "hits": []}
             }
     
-    def _extract_sources_from_result(self, result: Dict) -> List[str]:
-        """Extract document sources from agent execution result."""
-        sources = []
-        try:
-            intermediate_steps = result.get("intermediate_steps", [])
-            for step in intermediate_steps:
-                if len(step) > 1 and "Document" in str(step[1]):
-                    # Parse document names from the tool output
-                    output = str(step[1])
-                    lines = output.split('\n')
-                    for line in lines:
-                        if line.startswith("Source: "):
-                            source = line.replace("Source: ", "").strip()
-                            if source not in sources:
-                                sources.append(source)
-        except Exception:
-            pass
-        return sources
-    
     def _deduplicate_sources(self, sources: List[Dict]) -> List[Dict]:
         """Remove duplicate sources based on content similarity."""
         unique_sources = []
@@ -330,15 +468,6 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
         
         return unique_sources
     
-    def _format_sources_for_context(self, sources: List[Dict]) -> str:
-        """Format sources into context string for the agent."""
-        context = ""
-        for i, source in enumerate(sources, 1):
-            metadata = source["metadata"]
-            context += f"--- Source {i}: {metadata.get('document_name', 'Unknown')} ---\n"
-            context += f"{source['content']}\n\n"
-        return context
-    
     def _calculate_confidence_score(self, result: Dict, question_data: Dict) -> float:
         """Calculate confidence score based on result quality."""
         base_score = 0.7 if result["success"] else 0.0
@@ -368,6 +497,8 @@ Remember: You are helping with due diligence, so accuracy and thoroughness are c
             "llm_model": "gpt-4o-mini",
             "vector_store_stats": vector_stats,
             "tools_available": ["search_documents"],
+            "default_answer_mode": self.default_mode,
+            "answer_mode_latency": self.latency_stats.snapshot(),
             "system_ready": all([
                 self.agent_executor is not None,
                 self.retriever_tool is not None,
@@ -0,0 +1,164 @@
+"""
+Batch answering engine: answers many pending questions on a bounded worker pool.
+Runs inside a "batch_answer" job on the durable job queue (see services/job_queue.py).
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional
+
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal
+from services.rate_limiter import TokenBucket, answer_rate_limiter
+from services.llm_gateway import llm_gateway
+import crud
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJob:
+    """Progress counters and results for one batch run; safe to read while workers update it."""
+    
+    def __init__(self, question_ids: Optional[List[str]] = None):
+        self.question_ids = question_ids
+        self.total = len(question_ids) if question_ids is not None else 0
+        self.enumerated = question_ids is not None
+        self.processed = 0
+        self.answered: List[Dict[str, Any]] = []
+        self.no_answer: List[str] = []
+        self.errors: List[str] = []
+        self._lock = threading.Lock()
+    
+    def add_discovered(self, count: int):
+        with self._lock:
+            self.total += count
+    
+    def mark_enumerated(self):
+        with self._lock:
+            self.enumerated = True
+    
+    def record(self, question_id: str, outcome: Dict[str, Any]):
+        with self._lock:
+            self.processed += 1
+            if outcome.get("answered"):
+                self.answered.append({
+                    "question_id": question_id,
+                    "answer": outcome["answer"],
+                    "sources": outcome["sources"]
+                })
+            elif outcome.get("error"):
+                self.errors.append(f"Question {question_id}: {outcome['error']}")
+            else:
+                self.no_answer.append(question_id)
+    
+    def to_dict(self, include_results: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            job = {
+                "total": self.total,
+                "total_known": self.enumerated,
+                "processed": self.processed,
+                "answered": len(self.answered),
+                "no_answer": len(self.no_answer),
+                "errors": len(self.errors)
+            }
+            if include_results:
+                job["results"] = {
+                    "answered": list(self.answered),
+                    "no_answer": list(self.no_answer),
+                    "errors": list(self.errors)
+                }
+            return job
+
+
+class BatchAnsweringEngine:
+    """
+    Answers a batch of questions for one "batch_answer" job.
+    
+    Pending questions are paged through with a keyset cursor rather than loaded in one
+    query, each question is answered on a bounded thread pool under a shared rate
+    limiter, and each answer is committed in its own short transaction on a
+    worker-local session.
+    """
+    
+    def __init__(self, qa_service, session_factory: sessionmaker = SessionLocal,
+                 max_workers: int = None, rate_limiter: TokenBucket = answer_rate_limiter,
+                 page_size: int = 200):
+        self.qa_service = qa_service
+        self.session_factory = session_factory
+        self.max_workers = max_workers or int(os.getenv("BATCH_ANSWER_WORKERS", "4"))
+        self.rate_limiter = rate_limiter
+        self.page_size = page_size
+    
+    def run(self, question_ids: Optional[List[str]] = None,
+            on_progress: Optional[Callable[[BatchJob], None]] = None,
+            should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Answer the given questions, or every pending question if none are given, and return
+        the counters and results. on_progress is called after each question; once should_stop
+        returns True no more questions are submitted and RuntimeError is raised.
+        """
+        job = BatchJob(question_ids)
+        # Bound in-flight work so paging doesn't run far ahead of the workers
+        in_flight = threading.BoundedSemaphore(self.max_workers * 2)
+        
+        def submit(executor: ThreadPoolExecutor, question_id: str):
+            if should_stop and should_stop():
+                raise RuntimeError("Batch answering stopped before all questions were submitted")
+            in_flight.acquire()
+            future = executor.submit(self._answer_one, job, question_id, on_progress)
+            future.add_done_callback(lambda _: in_flight.release())
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch-answer") as executor:
+            if job.question_ids is not None:
+                for question_id in job.question_ids:
+                    submit(executor, question_id)
+            else:
+                for page in self._pending_question_pages():
+                    job.add_discovered(len(page))
+                    for question_id in page:
+                        submit(executor, question_id)
+                job.mark_enumerated()
+        return job.to_dict(include_results=True)
+    
+    def _pending_question_pages(self):
+        """Yield pages of pending question IDs using a keyset cursor instead of an offset scan."""
+        db = self.session_factory()
+        try:
+            after_id = None
+            while True:
+                page = crud.get_question_ids_page(db, status="pending", after_id=after_id, limit=self.page_size)
+                if not page:
+                    return
+                yield page
+                after_id = page[-1]
+        finally:
+            db.close()
+    
+    def _answer_one(self, job: BatchJob, question_id: str,
+                    on_progress: Optional[Callable[[BatchJob], None]] = None):
+        db = self.session_factory()
+        try:
+            question = crud.get_question(db, question_id)
+            if not question:
+                job.record(question_id, {"error": "not found"})
+                return
+            if question.status != "pending":
+                job.record(question_id, {"error": "not pending"})
+                return
+            
+            self.rate_limiter.acquire()
+            with llm_gateway.caller("batch"):
+                job.record(question_id, self.qa_service.try_answer_with_all_docs(db, question))
+        except Exception as e:
+            logger.error(f"Error batch answering question {question_id}: {e}")
+            job.record(question_id, {"error": str(e)})
+        finally:
+            db.close()
+        if on_progress:
+            try:
+                on_progress(job)
+            except Exception as e:
+                logger.warning(f"Batch progress update failed: {e}")
+
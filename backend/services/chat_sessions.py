@@ -0,0 +1,134 @@
+"""
+Server-side chat sessions for the RAG chat.
+
+A session keeps a rolling summary of older turns, the most recent turns verbatim and a
+cache of the chunks retrieved in earlier turns, so the client only sends a session ID
+and the new message and the prompt stays a bounded size however long the chat runs.
+"""
+import json
+import logging
+import os
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy.orm import Session
+
+from models import models
+from services.context_packer import ContextPacker
+from services.llm_gateway import llm_gateway
+import crud
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSessionService:
+    def __init__(self, gateway=llm_gateway):
+        self.gateway = gateway
+        # Messages always kept verbatim; older ones are folded into the summary in batches
+        self.recent_messages = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+        self.summary_batch = int(os.getenv("CHAT_SUMMARY_BATCH", "4"))
+        self.chunk_cache_size = int(os.getenv("CHAT_CHUNK_CACHE_SIZE", "12"))
+        self.chunk_cache_budget = int(os.getenv("CHAT_CHUNK_CACHE_TOKENS", "1500"))
+        self.context_packer = ContextPacker("gpt-4o-mini")
+    
+    def build_turn_context(self, db: Session, chat_session: models.ChatSession) -> Dict[str, Any]:
+        """
+        Prompt inputs for the next turn of a session.
+        
+        Returns:
+            Dictionary with `chat_history` (unsummarized messages, oldest first) and
+            `context` (rolling summary plus packed cached chunks, or None)
+        """
+        messages = crud.get_chat_messages(db, chat_session.id, from_position=chat_session.summarized_count)
+        chat_history = [{"role": message.role, "content": message.content} for message in messages]
+        
+        parts = []
+        if chat_session.summary:
+            parts.append(f"Summary of the earlier conversation:\n{chat_session.summary}")
+        cached_chunks = json.loads(chat_session.chunk_cache or "[]")
+        if cached_chunks:
+            packed = self.context_packer.pack(cached_chunks, budget=self.chunk_cache_budget)
+            if packed["text"]:
+                parts.append(f"Document excerpts retrieved earlier in this conversation:\n\n{packed['text']}")
+        
+        return {
+            "chat_history": chat_history,
+            "context": "\n\n".join(parts) or None
+        }
+    
+    def record_turn(self, db: Session, chat_session: models.ChatSession, message: str,
+                    response: str, sources: List[Dict[str, Any]], hits: List[Dict[str, Any]]) -> Optional[models.ChatSession]:
+        """
+        Store the exchange, merge this turn's hits into the chunk cache and fold old turns if due.
+        Returns None if another turn was stored in the session while this one was being answered.
+        """
+        chunk_cache = self._merge_chunk_cache(json.loads(chat_session.chunk_cache or "[]"), hits)
+        chat_session = crud.add_chat_turn(db, chat_session, message, response, sources=sources, chunk_cache=chunk_cache)
+        if chat_session is None:
+            return None
+        return self.maybe_summarize(db, chat_session)
+    
+    def _merge_chunk_cache(self, cached: List[Dict[str, Any]], hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Newest hits first (best score first within a turn), then older entries, capped to the cache size."""
+        merged, seen = [], set()
+        fresh = [
+            {
+                "chunk_id": hit.get("chunk_id"),
+                "document_id": hit.get("document_id"),
+                "document_name": hit.get("document_name"),
+                "chunk_index": hit.get("chunk_index"),
+                "similarity_score": hit.get("similarity_score", 0.0),
+                "content": hit.get("content", "")
+            }
+            for hit in hits
+        ]
+        for chunk in fresh + cached:
+            key = chunk["chunk_id"] or f"{chunk['document_id']}:{chunk['chunk_index']}"
+            if key in seen or not chunk["content"]:
+                continue
+            seen.add(key)
+            merged.append(chunk)
+        return merged[:self.chunk_cache_size]
+    
+    def maybe_summarize(self, db: Session, chat_session: models.ChatSession) -> models.ChatSession:
+        """
+        Fold the messages older than the verbatim window into the rolling summary once a
+        full batch of them has accumulated. On failure the messages simply stay verbatim
+        and are folded on a later turn.
+        """
+        unsummarized = chat_session.message_count - chat_session.summarized_count
+        if unsummarized <= self.recent_messages + self.summary_batch:
+            return chat_session
+        
+        fold_to = chat_session.message_count - self.recent_messages
+        messages = crud.get_chat_messages(db, chat_session.id, from_position=chat_session.summarized_count, to_position=fold_to)
+        transcript = "\n".join(f"{message.role.capitalize()}: {message.content}" for message in messages)
+        
+        prompt = f"""Update the running summary of a due diligence chat with the new exchanges below.
+Keep the facts, figures, document names and open questions the user may refer back to. Be concise (under 200 words).
+
+Current summary:
+{chat_session.summary or "(none)"}
+
+New exchanges:
+{transcript}
+
+Updated summary:"""
+
+        try:
+            response = self.gateway.chat(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=400,
+                temperature=0.2,
+                caller="chat"
+            )
+            summary = response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Error summarizing chat session {chat_session.id}: {e}")
+            return chat_session
+        
+        return crud.update_chat_summary(db, chat_session, summary, fold_to)
+
+
+# Global instance
+chat_session_service = ChatSessionService()
@@ -0,0 +1,151 @@
+"""
+Token-budgeted context packing for prompt construction.
+
+Fills a per-model token budget with the highest-ranked chunks, measured with the
+model's tiktoken encoding, and never cuts a chunk in half.
+"""
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Callable, List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Tokens of retrieved context allowed per prompt, by model
+DEFAULT_CONTEXT_BUDGETS = {
+    "gpt-4o-mini": 6000,
+    "gpt-3.5-turbo": 2500,
+}
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable for {model}, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """The longest prefix of `text` within max_tokens."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max(max_tokens, 0) * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max(max_tokens, 0)])
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """Split text on blank lines, the natural chunk boundary for whole-document text."""
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def _default_format(index: int, chunk: Dict[str, Any]) -> str:
+    name = chunk.get("document_name") or chunk.get("metadata", {}).get("document_name", "Unknown")
+    return f"--- Source {index}: {name} ---\n{chunk['content']}\n\n"
+
+
+class ContextPacker:
+    """
+    Packs ranked chunks into a token budget.
+    
+    Args:
+        model: Model the prompt is for; selects the tokenizer and default budget
+        budget: Token budget for packed context (defaults to CONTEXT_TOKEN_BUDGET or the model default)
+    """
+    
+    def __init__(self, model: str = "gpt-4o-mini", budget: Optional[int] = None):
+        self.model = model
+        self.budget = budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_CONTEXT_BUDGETS.get(model, 4000)))
+    
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+    
+    def pack(self, chunks: List[Dict[str, Any]], budget: Optional[int] = None,
+             format_chunk: Callable[[int, Dict[str, Any]], str] = _default_format) -> Dict[str, Any]:
+        """
+        Fill the budget with chunks in rank order, skipping any chunk that would overflow it.
+        
+        Args:
+            chunks: Chunks ordered best first; each needs `content`
+            budget: Override the packer's budget for this call
+            format_chunk: Renders (1-based position, chunk) into prompt text
+            
+        Returns:
+            Dictionary with the packed `text`, the included `chunks`, and `stats`
+            (tokens_used, budget, chunks_used, chunks_dropped)
+        """
+        budget = budget or self.budget
+        parts, included, tokens_used, dropped = [], [], 0, 0
+        for chunk in chunks:
+            rendered = format_chunk(len(included) + 1, chunk)
+            tokens = self.count(rendered)
+            if tokens_used + tokens > budget:
+                dropped += 1
+                continue
+            parts.append(rendered)
+            included.append(chunk)
+            tokens_used += tokens
+        
+        stats = {
+            "model": self.model,
+            "budget": budget,
+            "tokens_used": tokens_used,
+            "chunks_used": len(included),
+            "chunks_dropped": dropped
+        }
+        logger.info(f"Packed context: {tokens_used}/{budget} tokens, {len(included)} chunks used, {dropped} dropped")
+        return {"text": "".join(parts), "chunks": included, "stats": stats}
+    
+    def pack_text(self, text: str, budget: Optional[int] = None) -> Dict[str, Any]:
+        """Pack a single document's text, keeping whole segments from the start until the budget is full."""
+        budget = budget or self.budget
+        parts, tokens_used, dropped = [], 0, 0
+        for segment in self._segments(text):
+            tokens = self.count(segment + "\n\n")
+            if not parts and not dropped and tokens > budget:
+                # One segment longer than the whole budget (a table or OCR line without sentence breaks)
+                # is cut to fit rather than leaving the prompt without any of the document
+                segment = truncate_tokens(segment, budget - self.count("\n\n"), self.model)
+                tokens = self.count(segment + "\n\n")
+            elif dropped or tokens_used + tokens > budget:
+                # Stop at the first segment that doesn't fit so the kept text stays contiguous
+                dropped += 1
+                continue
+            parts.append(segment)
+            tokens_used += tokens
+        
+        stats = {
+            "model": self.model,
+            "budget": budget,
+            "tokens_used": tokens_used,
+            "chunks_used": len(parts),
+            "chunks_dropped": dropped
+        }
+        return {"text": "\n\n".join(parts), "stats": stats}
+    
+    def _segments(self, text: str, max_tokens: int = 512):
+        """Paragraphs, falling back to lines and then sentences for paragraphs longer than max_tokens."""
+        for paragraph in split_paragraphs(text):
+            if self.count(paragraph) <= max_tokens:
+                yield paragraph
+                continue
+            for line in (l.strip() for l in paragraph.split("\n")):
+                if not line:
+                    continue
+                if self.count(line) <= max_tokens:
+                    yield line
+                else:
+                    yield from (s.strip() for s in re.split(r"(?<=[.!?])\s+", line) if s.strip())
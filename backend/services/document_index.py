@@ -0,0 +1,211 @@
+"""
+Document-level embedding index for ranking whole documents against a question.
+
+Each processed document is represented by the normalized centroid of its chunk
+embeddings (read back from Chroma, so building it costs no API calls). The centroids
+are kept in one in-memory matrix, reloaded when the document_embeddings table changes,
+so ranking every document is a single matrix-vector product.
+
+The same matrix is the first level of hierarchical retrieval: pick the best-matching
+documents, then score the chunks of only those documents exactly, using chunk
+matrices cached per document.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import SessionLocal
+from models import models
+from services.question_embeddings import QuestionEmbeddingStore, bytes_to_vector, vector_to_bytes, normalize_rows
+import crud
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentIndex:
+    def __init__(self, doc_processor, session_factory: sessionmaker = SessionLocal):
+        self.doc_processor = doc_processor
+        self.session_factory = session_factory
+        # Searches and suggestions re-check the table at most this often
+        self.refresh_seconds = float(os.getenv("DOCUMENT_INDEX_REFRESH_SECONDS", "10"))
+        self._checked_at = 0.0
+        # LRU of document_id -> (chunks, chunk matrix) for the second retrieval level
+        self.chunk_cache_documents = int(os.getenv("DOCUMENT_INDEX_CHUNK_CACHE", "256"))
+        self._chunk_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.model = getattr(doc_processor.embeddings, "model", "unknown")
+        self.question_embeddings = QuestionEmbeddingStore(doc_processor.embeddings)
+        self._document_ids: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._version = None
+        self._lock = threading.Lock()
+    
+    def compute_document_embedding(self, db: Session, document_id: str) -> bool:
+        """Store the centroid of a document's chunk embeddings; returns False if it has no chunks."""
+        _, vectors = self.doc_processor.get_chunk_embeddings(document_id)
+        if len(vectors) == 0:
+            # Zero-chunk marker, so the document isn't looked up in Chroma again until it is reprocessed
+            crud.save_document_embedding(db, {
+                "document_id": document_id,
+                "model": self.model,
+                "chunk_count": 0,
+                "dimensions": 0,
+                "embedding": b""
+            })
+            return False
+        
+        centroid = normalize_rows(np.asarray(vectors, dtype=np.float32)).mean(axis=0)
+        centroid /= np.linalg.norm(centroid) or 1.0
+        crud.save_document_embedding(db, {
+            "document_id": document_id,
+            "model": self.model,
+            "chunk_count": len(vectors),
+            "dimensions": int(centroid.shape[0]),
+            "embedding": vector_to_bytes(centroid)
+        })
+        return True
+    
+    def _refresh(self, db: Session):
+        # Documents processed before the index existed, or reprocessed since, are (re)indexed on first use
+        for document_id in crud.get_unindexed_document_ids(db):
+            self.compute_document_embedding(db, document_id)
+        
+        version = tuple(crud.get_document_embedding_version(db))
+        with self._lock:
+            if version == self._version:
+                return
+            rows = [row for row in crud.get_document_embeddings(db) if row.model == self.model]
+            # Swapped together so concurrent searches never pair IDs with the wrong matrix
+            self._document_ids, self._matrix = (
+                [row.document_id for row in rows],
+                np.vstack([bytes_to_vector(row.embedding) for row in rows]) if rows else None
+            )
+            self._version = version
+            # Reprocessed documents change the version, so their cached chunks may be stale
+            self._chunk_cache.clear()
+            logger.info(f"Loaded document index with {len(rows)} documents")
+    
+    def _refresh_if_due(self, db: Optional[Session] = None):
+        if time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        if db is not None:
+            self._refresh(db)
+        else:
+            db = self.session_factory()
+            try:
+                self._refresh(db)
+            finally:
+                db.close()
+        self._checked_at = time.monotonic()
+    
+    def candidate_documents(self, query_embedding, fan_out: int) -> List[str]:
+        """IDs of the `fan_out` documents whose centroids best match the query, best first."""
+        self._refresh_if_due()
+        matrix, document_ids = self._matrix, self._document_ids
+        if matrix is None:
+            return []
+        
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        scores = matrix @ (query_vector / (np.linalg.norm(query_vector) or 1.0))
+        fan_out = min(fan_out, len(scores))
+        top = np.argpartition(-scores, fan_out - 1)[:fan_out]
+        return [document_ids[i] for i in top[np.argsort(-scores[top])]]
+    
+    def _document_chunks(self, document_ids: List[str]) -> Dict[str, tuple]:
+        """(chunks, chunk matrix, squared norms) per document, reading all cache misses in one collection call."""
+        entries, missing = {}, []
+        with self._lock:
+            for document_id in document_ids:
+                cached = self._chunk_cache.get(document_id)
+                if cached is not None:
+                    self._chunk_cache.move_to_end(document_id)
+                    entries[document_id] = cached
+                else:
+                    missing.append(document_id)
+        
+        if missing:
+            fetched = self.doc_processor.get_chunk_embeddings_for_documents(missing)
+            with self._lock:
+                for document_id in missing:
+                    chunks, vectors = fetched.get(document_id, ([], []))
+                    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+                    entries[document_id] = (chunks, matrix, np.einsum("ij,ij->i", matrix, matrix))
+                    self._chunk_cache[document_id] = entries[document_id]
+                while len(self._chunk_cache) > self.chunk_cache_documents:
+                    self._chunk_cache.popitem(last=False)
+        return entries
+    
+    def search(self, query_embedding, k: int = 5, fan_out: int = 20,
+               score_threshold: float = 0.0) -> Optional[List[Dict[str, Any]]]:
+        """
+        Two-level search: top `fan_out` documents by centroid, then exact chunk scoring inside them.
+        
+        Scores match the flat Chroma search (1 / (1 + squared L2 distance)) so thresholds carry over.
+        Returns None when no documents are indexed, so the caller can fall back to the flat search.
+        """
+        candidates = self.candidate_documents(query_embedding, fan_out)
+        if not candidates:
+            return None
+        
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = float(query_vector @ query_vector)
+        scored = []
+        entries = self._document_chunks(candidates)
+        for document_id in candidates:
+            chunks, matrix, norms = entries[document_id]
+            if not chunks:
+                continue
+            distances = np.maximum(norms + query_norm - 2 * (matrix @ query_vector), 0.0)
+            scored.extend(zip(1 / (1 + distances), chunks))
+        
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return [
+            self.doc_processor._format_search_hit(chunk["chunk_id"], chunk["content"], chunk["metadata"] or {}, float(score))
+            for score, chunk in scored[:k]
+            if score >= score_threshold
+        ]
+    
+    def suggest(self, db: Session, question: models.Question, k: int = 5,
+                evidence_per_document: int = 2) -> List[Dict[str, Any]]:
+        """
+        Rank all indexed documents against a question.
+        
+        Returns:
+            Up to k dictionaries with `document_id`, `score` (cosine similarity) and
+            `evidence` (the document's best-matching chunks), best first
+        """
+        self._refresh_if_due(db)
+        matrix, document_ids = self._matrix, self._document_ids
+        if matrix is None:
+            return []
+        
+        query_vector = normalize_rows(self.question_embeddings.get_matrix(db, [question]))[0]
+        scores = matrix @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        ranked = [(document_ids[i], float(scores[i])) for i in top]
+        
+        # One chunk search restricted to the top documents supplies the evidence for all of them
+        evidence: Dict[str, List[Dict[str, Any]]] = {document_id: [] for document_id, _ in ranked}
+        try:
+            chunks = self.doc_processor.search_by_vector(
+                query_vector, k=k * evidence_per_document * 2, document_ids=list(evidence)
+            )
+        except Exception as e:
+            logger.error(f"Error retrieving evidence chunks: {e}")
+            chunks = []
+        for chunk in chunks:
+            bucket = evidence.get(chunk["document_id"])
+            if bucket is not None and len(bucket) < evidence_per_document:
+                bucket.append(chunk)
+        
+        return [
+            {"document_id": document_id, "score": score, "evidence": evidence[document_id]}
+            for document_id, score in ranked
+        ]
@@ -1,16 +1,17 @@
 import base64
 import json
 import os
-from typing import List, Dict, Any, Optional
-from langchain_openai import OpenAIEmbeddings
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from pypdf import PdfReader
 import io
 from sqlalchemy.orm import Session
-from models.models import DocumentChunk, Document as DBDocument
+from models.models import Document as DBDocument
 from database import get_db
+from services.llm_gateway import llm_gateway
+import crud
 import uuid
 from datetime import datetime
 
@@ -18,19 +19,23 @@ from datetime import datetime
 class DocumentProcessor:
     """Service for processing and embedding documents for RAG functionality."""
     
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            model="text-embedding-ada-002"  # Use ada-002 for 1536 dimensions to match existing collection
-        )
+    def __init__(self, chroma_db_path: str = "backend/chroma_db", collection_name: str = "vdr_documents"):
+        # Use ada-002 for 1536 dimensions to match existing collection
+        self.embeddings = llm_gateway.embeddings(model="text-embedding-ada-002")
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
         )
         self.vector_store = None
-        self.chroma_db_path = "backend/chroma_db"
-        self.collection_name = "vdr_documents"
+        self.chroma_db_path = chroma_db_path
+        self.collection_name = collection_name
+        # "hierarchical" picks candidate documents by centroid first, then searches chunks inside them
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "flat")
+        self.retrieval_fan_out = int(os.getenv("RETRIEVAL_FAN_OUT", "20"))
+        # Chunk rows per executemany when saving a processed document
+        self.chunk_insert_batch_size = int(os.getenv("CHUNK_INSERT_BATCH", "1000"))
+        self._document_index = None
         
         # Initialize ChromaDB
         self._initialize_chroma_db()
@@ -95,13 +100,15 @@ class DocumentProcessor:
             
             # Add chunks to vector store and database
             chunk_ids = self._add_chunks_to_vector_store(chunks)
+            if len(chunk_ids) != len(chunks):
+                raise Exception(f"Vector store returned {len(chunk_ids)} IDs for {len(chunks)} chunks")
             if db:
+                # Chunk rows and the completed status are committed together, so a completed
+                # document always has its chunks
                 self._save_chunks_to_database(chunks, chunk_ids, db)
-            
-            # Update document status to completed
-            if db and document:
-                document.processing_status = "completed"
-                document.processed_at = datetime.utcnow()
+                if document:
+                    document.processing_status = "completed"
+                    document.processed_at = datetime.utcnow()
                 db.commit()
             
             return {
@@ -114,6 +121,7 @@ class DocumentProcessor:
         except Exception as e:
             # Update status to failed
             if db:
+                db.rollback()
                 document = db.query(DBDocument).filter(DBDocument.id == document_id).first()
                 if document:
                     document.processing_status = "failed"
@@ -216,7 +224,7 @@ class DocumentProcessor:
         return documents
     
     def _add_chunks_to_vector_store(self, documents: List[Document]) -> List[str]:
-        """Add document chunks to the vector store and return chunk IDs."""
+        """Add document chunks to the vector store and return chunk IDs. Raises if they could not be added."""
         if not documents:
             return []
         
@@ -246,30 +254,27 @@ class DocumentProcessor:
             return chunk_ids
             
         except Exception as e:
-            print(f"Error adding chunks to vector store: {e}")
-            return []
+            # Propagate so process_document rolls back and fails the document instead of completing it empty
+            raise Exception(f"Could not add chunks to vector store: {str(e)}") from e
     
     def _save_chunks_to_database(self, documents: List[Document], chunk_ids: List[str], db: Session):
-        """Save chunk metadata to database for position tracking."""
-        try:
-            for i, (doc, chunk_id) in enumerate(zip(documents, chunk_ids)):
-                chunk = DocumentChunk(
-                    id=chunk_id if chunk_id else str(uuid.uuid4()),
-                    document_id=doc.metadata["document_id"],
-                    chunk_index=doc.metadata["chunk_index"],
-                    content=doc.page_content,
-                    start_position=doc.metadata.get("start_position"),
-                    end_position=doc.metadata.get("end_position"),
-                    chunk_length=doc.metadata.get("chunk_length"),
-                    embedding_id=chunk_id
-                )
-                db.add(chunk)
-            
-            db.commit()
-            
-        except Exception as e:
-            print(f"Error saving chunks to database: {e}")
-            db.rollback()
+        """
+        Insert chunk metadata for position tracking with batched Core inserts. Not committed here:
+        the caller commits the chunks together with the document's status update.
+        """
+        crud.insert_document_chunks(db, [
+            {
+                "id": chunk_id if chunk_id else str(uuid.uuid4()),
+                "document_id": doc.metadata["document_id"],
+                "chunk_index": doc.metadata["chunk_index"],
+                "content": doc.page_content,
+                "start_position": doc.metadata.get("start_position"),
+                "end_position": doc.metadata.get("end_position"),
+                "chunk_length": doc.metadata.get("chunk_length"),
+                "embedding_id": chunk_id
+            }
+            for doc, chunk_id in zip(documents, chunk_ids)
+        ], batch_size=self.chunk_insert_batch_size)
     
     def search_similar_documents(self, query: str, k: int = 5, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
         """
@@ -283,40 +288,96 @@ class DocumentProcessor:
         Returns:
             List of relevant document chunks with metadata including position data
         """
-        if self.vector_store is None:
+        if self.vector_store is None or self.collection is None:
             return []
         
         try:
-            # Perform similarity search with scores
-            results = self.vector_store.similarity_search_with_score(query, k=k)
-            
-            # Filter by score threshold and format results
-            relevant_docs = []
-            for doc, score in results:
-                # ChromaDB uses L2 distance, convert to similarity score (higher is better)
-                # For L2 distance, smaller values mean more similar
-                similarity_score = 1 / (1 + score)  # Convert distance to similarity (0-1 range)
-                
-                if similarity_score >= score_threshold:
-                    relevant_docs.append({
-                        "content": doc.page_content,
-                        "metadata": doc.metadata,
-                        "similarity_score": similarity_score,
-                        "document_id": doc.metadata.get("document_id"),
-                        "document_name": doc.metadata.get("document_name"),
-                        "chunk_index": doc.metadata.get("chunk_index"),
-                        "source": doc.metadata.get("source"),
-                        "start_position": doc.metadata.get("start_position"),
-                        "end_position": doc.metadata.get("end_position"),
-                        "chunk_length": doc.metadata.get("chunk_length")
-                    })
-            
-            return relevant_docs
+            return self.search_by_embedding(self.embeddings.embed_query(query), k=k, score_threshold=score_threshold)
             
         except Exception as e:
             print(f"Error searching vector store: {e}")
             return []
     
+    def search_by_embedding(self, query_embedding: List[float], k: int = 5, score_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        """search_similar_documents for an already-computed query embedding, in the configured retrieval mode."""
+        if self.vector_store is None or self.collection is None:
+            return []
+        
+        if self.retrieval_mode == "hierarchical":
+            results = self.document_index.search(query_embedding, k=k, fan_out=self.retrieval_fan_out,
+                                                 score_threshold=score_threshold)
+            # None while no documents are indexed yet; fall back to the flat search
+            if results is not None:
+                return results
+        return self.search_by_vector(query_embedding, k=k, score_threshold=score_threshold)
+    
+    @property
+    def document_index(self):
+        """Document-level index over this processor's collection, created on first use."""
+        if self._document_index is None:
+            from services.document_index import DocumentIndex
+            self._document_index = DocumentIndex(self)
+        return self._document_index
+    
+    def search_by_vector(self, query_embedding: List[float], k: int = 5, score_threshold: float = 0.0,
+                         document_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Search chunks with an already-computed query embedding.
+        
+        Args:
+            query_embedding: Query vector from the collection's embedding model
+            k: Number of results to return
+            score_threshold: Minimum similarity score (0-1)
+            document_ids: Optional list of document IDs to restrict the search to
+            
+        Returns:
+            List of relevant document chunks, in the same format as search_similar_documents
+        """
+        if self.collection is None:
+            return []
+        
+        # Query the collection directly so the chunk IDs come back with the hits
+        results = self.collection.query(
+            query_embeddings=[[float(x) for x in query_embedding]],
+            n_results=k,
+            where={"document_id": {"$in": list(document_ids)}} if document_ids else None,
+            include=["documents", "metadatas", "distances"]
+        )
+        
+        # Filter by score threshold and format results
+        relevant_docs = []
+        for chunk_id, content, metadata, score in zip(
+            results["ids"][0],
+            results["documents"][0],
+            results["metadatas"][0],
+            results["distances"][0]
+        ):
+            metadata = metadata or {}
+            # ChromaDB uses L2 distance, convert to similarity score (higher is better)
+            # For L2 distance, smaller values mean more similar
+            similarity_score = 1 / (1 + score)  # Convert distance to similarity (0-1 range)
+            
+            if similarity_score >= score_threshold:
+                relevant_docs.append(self._format_search_hit(chunk_id, content, metadata, similarity_score))
+        
+        return relevant_docs
+    
+    @staticmethod
+    def _format_search_hit(chunk_id: str, content: str, metadata: Dict[str, Any], similarity_score: float) -> Dict[str, Any]:
+        return {
+            "chunk_id": chunk_id,
+            "content": content,
+            "metadata": metadata,
+            "similarity_score": similarity_score,
+            "document_id": metadata.get("document_id"),
+            "document_name": metadata.get("document_name"),
+            "chunk_index": metadata.get("chunk_index"),
+            "source": metadata.get("source"),
+            "start_position": metadata.get("start_position"),
+            "end_position": metadata.get("end_position"),
+            "chunk_length": metadata.get("chunk_length")
+        }
+    
     def get_document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
         """Get all chunks for a specific document."""
         if self.collection is None:
@@ -334,6 +395,7 @@ class DocumentProcessor:
             for i in range(len(results["documents"])):
                 metadata = results["metadatas"][i]
                 document_chunks.append({
+                    "chunk_id": results["ids"][i],
                     "content": results["documents"][i],
                     "metadata": metadata,
                     "chunk_index": metadata.get("chunk_index"),
@@ -351,6 +413,43 @@ class DocumentProcessor:
             print(f"Error retrieving document chunks: {e}")
             return []
     
+    def get_chunk_embeddings(self, document_id: str) -> Tuple[List[Dict[str, Any]], List[List[float]]]:
+        """Get a document's chunks together with their stored embedding vectors."""
+        return self.get_chunk_embeddings_for_documents([document_id]).get(document_id, ([], []))
+    
+    def get_chunk_embeddings_for_documents(self, document_ids: List[str]) -> Dict[str, Tuple[List[Dict[str, Any]], List[List[float]]]]:
+        """Chunks and embedding vectors for several documents in one collection read, keyed by document ID."""
+        if self.collection is None or not document_ids:
+            return {}
+        
+        try:
+            results = self.collection.get(
+                where={"document_id": document_ids[0]} if len(document_ids) == 1 else {"document_id": {"$in": list(document_ids)}},
+                include=["documents", "metadatas", "embeddings"]
+            )
+            
+            by_document: Dict[str, Tuple[List[Dict[str, Any]], List[List[float]]]] = {}
+            for chunk_id, content, metadata, embedding in zip(
+                results["ids"], results["documents"], results["metadatas"], results["embeddings"]
+            ):
+                chunks, vectors = by_document.setdefault(metadata.get("document_id"), ([], []))
+                chunks.append({
+                    "chunk_id": chunk_id,
+                    "content": content,
+                    "metadata": metadata,
+                    "document_id": metadata.get("document_id"),
+                    "document_name": metadata.get("document_name"),
+                    "chunk_index": metadata.get("chunk_index"),
+                    "start_position": metadata.get("start_position"),
+                    "end_position": metadata.get("end_position")
+                })
+                vectors.append(embedding)
+            return by_document
+            
+        except Exception as e:
+            print(f"Error retrieving chunk embeddings: {e}")
+            return {}
+    
     def remove_document(self, document_id: str) -> bool:
         """Remove all chunks for a specific document from the vector store."""
         if self.collection is None:
@@ -0,0 +1,262 @@
+"""
+Durable background job queue backed by the jobs table.
+
+Jobs survive restarts: a worker claims a job with a conditional update and renews its
+lease from a heartbeat thread while the handler runs. A job whose lease expires (worker
+crashed or was killed) is returned to the queue and picked up again, or failed once it
+has used all its attempts. Only the worker holding the lease can record progress,
+success or failure, so a worker that lost its job cannot overwrite the new run's state.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import uuid
+from typing import Callable, Dict, Any, List, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import SessionLocal
+from services.llm_gateway import llm_gateway
+from services.providers import get_document_processor, get_qa_automation_service, get_batch_answering_engine
+from models import models
+import crud
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot succeed."""
+
+
+class JobContext:
+    """
+    Handed to job handlers so they can report progress. While entered, a heartbeat thread
+    renews the job's lease every JOB_HEARTBEAT_SECONDS, however long a single step takes.
+    """
+    
+    def __init__(self, job_id: str, worker_id: str, session_factory: sessionmaker,
+                 heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.session_factory = session_factory
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._heartbeat, name=f"job-heartbeat-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+    
+    def progress(self, fraction: float, message: Optional[str] = None):
+        self._renew(max(0.0, min(fraction, 1.0)), message)
+    
+    def _renew(self, progress: Optional[float] = None, message: Optional[str] = None):
+        # Own short session so lease commits don't interfere with the handler's transaction
+        db = self.session_factory()
+        try:
+            if not crud.update_job_progress(db, self.job_id, self.worker_id, progress, message):
+                self.lease_lost = True
+        finally:
+            db.close()
+    
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self._renew()
+            except Exception as e:
+                logger.warning(f"Lease renewal for job {self.job_id} failed: {e}")
+
+
+def _process_document(db: Session, payload: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    document = crud.get_document(db, payload["document_id"])
+    if not document:
+        raise PermanentJobError(f"Document {payload['document_id']} not found")
+    
+    doc_processor = get_document_processor()
+    # A retry after a crash may find chunks from the interrupted attempt; start clean
+    doc_processor.remove_document(document.id)
+    db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id == document.id).delete()
+    db.commit()
+    
+    ctx.progress(0.1, "Extracting and embedding chunks")
+    with llm_gateway.caller("ingest"):
+        result = doc_processor.process_document(document.content, document.name, document.id, db)
+    if not result.get("success"):
+        error = result.get("error", "Failed to process document")
+        if "No text content" in error:
+            raise PermanentJobError(error)
+        raise RuntimeError(error)
+    if ctx.lease_lost:
+        # Another worker has taken the job over and owns the document's chunks now
+        raise RuntimeError("Lease lost while processing; the job was taken over by another worker")
+    
+    doc_processor.document_index.compute_document_embedding(db, document.id)
+    
+    # Auto-answering is its own job so a failure there doesn't redo the embedding work
+    answer_job = enqueue_job(db, "auto_answer_document", {"document_id": document.id})
+    return {
+        "chunks_created": result["chunks_created"],
+        "total_characters": result.get("total_characters", 0),
+        "auto_answer_job_id": answer_job.id
+    }
+
+
+def _auto_answer_document(db: Session, payload: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    with llm_gateway.caller("automation"):
+        answered = get_qa_automation_service().process_new_document(
+            db, payload["document_id"],
+            progress_callback=lambda done, total: ctx.progress(done / total if total else 1.0, f"{done}/{total} questions checked")
+        )
+    return {"questions_answered": answered}
+
+
+def _batch_answer(db: Session, payload: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    # A retried run skips questions the earlier attempt already answered (they are no longer pending)
+    def on_progress(batch) -> None:
+        counts = batch.to_dict()
+        ctx.progress(
+            counts["processed"] / counts["total"] if counts["total"] else 0.0,
+            f"{counts['processed']}/{counts['total']} questions processed, {counts['answered']} answered"
+        )
+    
+    return get_batch_answering_engine().run(
+        payload.get("question_ids"), on_progress=on_progress, should_stop=lambda: ctx.lease_lost
+    )
+
+
+JOB_HANDLERS: Dict[str, Callable[[Session, Dict[str, Any], JobContext], Dict[str, Any]]] = {
+    "process_document": _process_document,
+    "auto_answer_document": _auto_answer_document,
+    "batch_answer": _batch_answer,
+}
+
+
+def enqueue_job(db: Session, job_type: str, payload: Dict[str, Any], max_attempts: int = 5) -> models.Job:
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job = crud.create_job(db, job_type, payload, max_attempts=max_attempts)
+    job_available.set()
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, capped at JOB_RETRY_MAX_SECONDS."""
+    ceiling = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+# Wakes idle in-process workers as soon as a job is enqueued instead of waiting a poll interval
+job_available = threading.Event()
+
+
+class JobWorker:
+    """Polls the jobs table and runs claimed jobs one at a time."""
+    
+    def __init__(self, session_factory: sessionmaker = SessionLocal, poll_interval: float = 2.0,
+                 worker_id: Optional[str] = None):
+        self.session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name=f"job-worker-{self.worker_id}", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        job_available.set()
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def run_forever(self):
+        logger.info(f"Job worker {self.worker_id} started")
+        while not self._stop.is_set():
+            try:
+                self.recover_stale_jobs()
+                if not self.run_once():
+                    job_available.wait(self.poll_interval)
+                    job_available.clear()
+            except Exception as e:
+                logger.error(f"Job worker {self.worker_id} loop error: {e}")
+                self._stop.wait(self.poll_interval)
+        logger.info(f"Job worker {self.worker_id} stopped")
+    
+    def recover_stale_jobs(self) -> int:
+        db = self.session_factory()
+        try:
+            requeued, failed = crud.requeue_stale_jobs(db, JOB_LEASE_SECONDS)
+            if requeued:
+                logger.warning(f"Requeued {requeued} job(s) with expired leases")
+            if failed:
+                logger.error(f"Failed {failed} job(s) whose lease expired on their final attempt")
+            return requeued + failed
+        finally:
+            db.close()
+    
+    def run_once(self) -> bool:
+        """Claim and run one job. Returns False when the queue had nothing runnable."""
+        db = self.session_factory()
+        try:
+            job = crud.claim_next_job(db, self.worker_id)
+            if not job:
+                return False
+            
+            job_id, job_type, attempts, max_attempts = job.id, job.type, job.attempts, job.max_attempts
+            handler = JOB_HANDLERS.get(job_type)
+            try:
+                if handler is None:
+                    raise PermanentJobError(f"No handler for job type {job_type}")
+                with JobContext(job_id, self.worker_id, self.session_factory) as ctx:
+                    result = handler(db, json.loads(job.payload), ctx)
+                if crud.complete_job(db, job_id, self.worker_id, result):
+                    logger.info(f"Job {job_id} ({job_type}) succeeded")
+                else:
+                    logger.warning(f"Job {job_id} ({job_type}) finished after its lease was taken over; result discarded")
+            except Exception as e:
+                db.rollback()
+                retryable = not isinstance(e, PermanentJobError) and attempts < max_attempts
+                delay = retry_delay(attempts) if retryable else None
+                if not crud.fail_job(db, job_id, self.worker_id, str(e), retry_delay=delay):
+                    logger.warning(f"Job {job_id} ({job_type}) failed after its lease was taken over: {e}")
+                elif retryable:
+                    logger.warning(f"Job {job_id} ({job_type}) attempt {attempts} failed, retrying in {delay:.0f}s: {e}")
+                else:
+                    logger.error(f"Job {job_id} ({job_type}) failed permanently: {e}")
+            return True
+        finally:
+            db.close()
+
+
+_workers: List[JobWorker] = []
+
+
+def start_workers(count: int = None) -> List[JobWorker]:
+    """Start in-process worker threads (JOB_WORKERS, default 1; 0 leaves jobs to worker.py processes)."""
+    count = int(os.getenv("JOB_WORKERS", "1")) if count is None else count
+    for _ in range(count):
+        worker = JobWorker()
+        worker.start()
+        _workers.append(worker)
+    return list(_workers)
+
+
+def stop_workers(timeout: float = 5.0):
+    for worker in _workers:
+        worker.stop(timeout)
+    _workers.clear()
@@ -0,0 +1,44 @@
+"""
+Rolling latency statistics for timing service calls by label.
+"""
+import threading
+from collections import deque
+from typing import Dict, Any
+
+
+class LatencyStats:
+    """Thread-safe per-label latency samples over a rolling window."""
+    
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+    
+    def record(self, label: str, seconds: float, error: bool = False):
+        with self._lock:
+            self._samples.setdefault(label, deque(maxlen=self.window)).append(seconds)
+            self._counts[label] = self._counts.get(label, 0) + 1
+            if error:
+                self._errors[label] = self._errors.get(label, 0) + 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {}
+            for label, samples in self._samples.items():
+                ordered = sorted(samples)
+                stats[label] = {
+                    "count": self._counts[label],
+                    "errors": self._errors.get(label, 0),
+                    "mean_ms": round(1000 * sum(ordered) / len(ordered), 1),
+                    "p50_ms": round(1000 * self._percentile(ordered, 0.50), 1),
+                    "p95_ms": round(1000 * self._percentile(ordered, 0.95), 1),
+                    "max_ms": round(1000 * ordered[-1], 1)
+                }
+            return stats
+    
+    @staticmethod
+    def _percentile(ordered, fraction: float) -> float:
+        index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+        return ordered[index]
@@ -0,0 +1,261 @@
+"""
+Single gateway for every OpenAI chat and embedding call in the backend.
+
+All callers share one HTTP connection pool and one set of per-model token buckets
+(requests per minute and tokens per minute), so concurrent features can't push the
+account into 429s. Transient failures are retried with jittered exponential backoff,
+and each caller (chat, batch answering, ingestion, ...) has its own concurrency quota
+so one feature can't starve the others.
+
+The OpenAI SDK and LangChain are imported on first use rather than at import time,
+so modules that only hold a reference to the gateway don't slow down API startup.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+
+from services.context_packer import count_tokens
+from services.rate_limiter import TokenBucket
+
+if TYPE_CHECKING:
+    import openai
+    from langchain_core.embeddings import Embeddings
+    from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# (requests per minute, tokens per minute); override with OPENAI_MODEL_LIMITS='{"model": [rpm, tpm]}'
+DEFAULT_MODEL_LIMITS = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-3.5-turbo": (500, 200_000),
+    "text-embedding-ada-002": (3000, 1_000_000),
+}
+FALLBACK_MODEL_LIMITS = (200, 100_000)
+
+# Concurrent in-flight calls per caller; override with LLM_CALLER_QUOTAS='{"caller": n}'
+DEFAULT_CALLER_QUOTAS = {
+    "chat": 8,
+    "batch": 4,
+    "automation": 4,
+    "ingest": 4,
+    "summarize": 4,
+    "default": 4,
+}
+
+_current_caller: ContextVar[Optional[str]] = ContextVar("llm_caller", default=None)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM provider could not be reached or kept failing after retries."""
+
+
+class LLMRequestError(Exception):
+    """The LLM provider rejected the request (4xx other than 429); retrying it cannot succeed."""
+
+
+@lru_cache(maxsize=None)
+def _retryable_errors() -> tuple:
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+
+
+class LLMGateway:
+    def __init__(self):
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "4"))
+        self.retry_base_seconds = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+        self.retry_max_seconds = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+        self.model_limits = {**DEFAULT_MODEL_LIMITS, **json.loads(os.getenv("OPENAI_MODEL_LIMITS", "{}"))}
+        self.caller_quotas = {**DEFAULT_CALLER_QUOTAS, **json.loads(os.getenv("LLM_CALLER_QUOTAS", "{}"))}
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "32")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "16"))
+            ),
+            timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60")), connect=10.0)
+        )
+        self._client = None
+        self._request_buckets: Dict[str, TokenBucket] = {}
+        self._token_buckets: Dict[str, TokenBucket] = {}
+        self._caller_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def client(self) -> "openai.OpenAI":
+        # Created on first use so importing the gateway doesn't require an API key
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    api_key = os.getenv("OPENAI_API_KEY")
+                    if not api_key:
+                        raise ValueError("OPENAI_API_KEY environment variable is required")
+                    import openai
+                    # Retries happen in the gateway so they are paced by the shared buckets
+                    self._client = openai.OpenAI(api_key=api_key, http_client=self.http_client, max_retries=0)
+        return self._client
+    
+    @contextmanager
+    def caller(self, name: str):
+        """Attribute every gateway call made in this context to `name` (and its quota)."""
+        token = _current_caller.set(name)
+        try:
+            yield
+        finally:
+            _current_caller.reset(token)
+    
+    def _buckets(self, model: str):
+        with self._lock:
+            if model not in self._request_buckets:
+                rpm, tpm = self.model_limits.get(model, FALLBACK_MODEL_LIMITS)
+                # Small bursts only; sustained throughput is governed by the refill rate
+                self._request_buckets[model] = TokenBucket.per_minute(rpm, burst=max(rpm / 60.0, 5))
+                self._token_buckets[model] = TokenBucket.per_minute(tpm, burst=max(tpm / 60.0, 8000))
+            return self._request_buckets[model], self._token_buckets[model]
+    
+    def _slot(self, caller: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if caller not in self._caller_slots:
+                quota = self.caller_quotas.get(caller, self.caller_quotas["default"])
+                self._caller_slots[caller] = threading.BoundedSemaphore(quota)
+            return self._caller_slots[caller]
+    
+    def call(self, model: str, estimated_tokens: int, fn: Callable[[], T], caller: Optional[str] = None) -> T:
+        """
+        Run `fn` (one provider request) under the caller's quota and the model's rate limits.
+        
+        Retries rate limits, connection errors, timeouts and 5xx responses with jittered
+        exponential backoff (honoring Retry-After), then raises LLMUnavailableError. Other
+        error responses (bad request, authentication, not found) raise LLMRequestError at once.
+        """
+        import openai
+        
+        caller = caller or _current_caller.get() or "default"
+        request_bucket, token_bucket = self._buckets(model)
+        
+        with self._slot(caller):
+            for attempt in range(self.max_retries + 1):
+                request_bucket.acquire()
+                token_bucket.acquire(estimated_tokens)
+                try:
+                    return fn()
+                except _retryable_errors() as e:
+                    if attempt == self.max_retries:
+                        raise LLMUnavailableError(f"{model} unavailable after {attempt + 1} attempts: {e}") from e
+                    delay = self._retry_delay(attempt, e)
+                    logger.warning(f"{caller} call to {model} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                except openai.APIStatusError as e:
+                    raise LLMRequestError(f"{model} rejected the request with status {e.status_code}: {e}") from e
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.retry_max_seconds)
+            except ValueError:
+                pass
+        ceiling = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt))
+        return random.uniform(0, ceiling)
+    
+    def chat(self, model: str, messages: List[Dict[str, str]], caller: Optional[str] = None, **kwargs) -> Any:
+        """chat.completions.create through the gateway."""
+        estimated = sum(count_tokens(m.get("content") or "", model) for m in messages) + kwargs.get("max_tokens", 500)
+        return self.call(
+            model, estimated,
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs),
+            caller=caller
+        )
+    
+    def embed(self, model: str, inputs: List[str], caller: Optional[str] = None, batch_size: int = 512) -> List[List[float]]:
+        """Embed inputs in batches through the gateway."""
+        vectors = []
+        for start in range(0, len(inputs), batch_size):
+            batch = inputs[start:start + batch_size]
+            estimated = sum(count_tokens(text, model) for text in batch)
+            response = self.call(
+                model, estimated,
+                lambda: self.client.embeddings.create(model=model, input=batch),
+                caller=caller
+            )
+            vectors.extend(item.embedding for item in response.data)
+        return vectors
+    
+    def chat_model(self, model: str = "gpt-4o-mini", caller: Optional[str] = None, **kwargs) -> "ChatOpenAI":
+        """A LangChain chat model whose requests go through this gateway."""
+        return _gateway_chat_openai_class()(
+            gateway=self,
+            caller=caller,
+            model=model,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=self.http_client,
+            max_retries=0,
+            **kwargs
+        )
+    
+    def embeddings(self, model: str = "text-embedding-ada-002", caller: Optional[str] = None) -> "Embeddings":
+        """A LangChain embeddings object whose requests go through this gateway."""
+        return _gateway_embeddings_class()(self, model, caller)
+
+
+@lru_cache(maxsize=None)
+def _gateway_chat_openai_class():
+    """GatewayChatOpenAI, defined on first use so langchain_openai is only loaded when a chat model is built."""
+    from langchain_openai import ChatOpenAI
+    
+    class GatewayChatOpenAI(ChatOpenAI):
+        """ChatOpenAI that routes each generation through the gateway's limits and retries."""
+        
+        gateway: Any = None
+        caller: Optional[str] = None
+        
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            estimated = sum(count_tokens(str(m.content), self.model_name) for m in messages) + (self.max_tokens or 500)
+            return self.gateway.call(
+                self.model_name, estimated,
+                lambda: super(GatewayChatOpenAI, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+                caller=self.caller
+            )
+    
+    return GatewayChatOpenAI
+
+
+@lru_cache(maxsize=None)
+def _gateway_embeddings_class():
+    """GatewayEmbeddings, defined on first use like the chat model class."""
+    from langchain_core.embeddings import Embeddings
+    
+    class GatewayEmbeddings(Embeddings):
+        """LangChain embeddings backed by LLMGateway.embed."""
+        
+        def __init__(self, gateway: LLMGateway, model: str, caller: Optional[str] = None):
+            self.gateway = gateway
+            self.model = model
+            self.caller = caller
+        
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return self.gateway.embed(self.model, texts, caller=self.caller)
+        
+        def embed_query(self, text: str) -> List[float]:
+            return self.gateway.embed(self.model, [text], caller=self.caller)[0]
+    
+    return GatewayEmbeddings
+
+
+# Global instance
+llm_gateway = LLMGateway()
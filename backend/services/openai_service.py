@@ -1,9 +1,10 @@
-from openai import OpenAI, APIConnectionError, RateLimitError, APIStatusError
 import os
 import base64
 import json
 from typing import List, Dict, Any
 from dotenv import load_dotenv
+from services.context_packer import ContextPacker
+from services.llm_gateway import llm_gateway, LLMRequestError, LLMUnavailableError
 
 load_dotenv()
 
@@ -12,11 +13,13 @@ class OpenAIService:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
+        self.gateway = llm_gateway
+        self.context_packer = ContextPacker("gpt-4o-mini")
     
     def analyze_document(self, document_content: str, document_name: str) -> Dict[str, Any]:
         try:
             content_text = self._extract_text_from_base64(document_content)
+            packed = self.context_packer.pack_text(content_text, budget=1500)
             
             prompt = f"""
             Analyze the following document "{document_name}" and provide:
@@ -25,10 +28,10 @@ class OpenAIService:
             3. Suggested tags (3-5 relevant tags)
             
             Document content:
-            {content_text[:4000]}  # Limit content to avoid token limits
+            {packed["text"]}
             """
             
-            response = self.client.chat.completions.create(
+            response = self.gateway.chat(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are an expert document analyzer for due diligence processes. Provide structured analysis of business documents."},
@@ -39,26 +42,12 @@ class OpenAIService:
             )
             
             analysis_text = response.choices[0].message.content
-            return self._parse_analysis_response(analysis_text)
+            analysis = self._parse_analysis_response(analysis_text)
+            analysis["context_stats"] = packed["stats"]
+            return analysis
             
-        except APIConnectionError as e:
-            return {
-                "summary": "Error: Could not connect to OpenAI API",
-                "key_points": [],
-                "suggested_tags": ["document"]
-            }
-        except RateLimitError as e:
-            return {
-                "summary": "Error: OpenAI API rate limit exceeded",
-                "key_points": [],
-                "suggested_tags": ["document"]
-            }
-        except APIStatusError as e:
-            return {
-                "summary": f"Error: OpenAI API returned status {e.status_code}",
-                "key_points": [],
-                "suggested_tags": ["document"]
-            }
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return {
                 "summary": f"Error analyzing document: {str(e)}",
@@ -86,7 +75,7 @@ class OpenAIService:
             {{"matches": [{{"document_id": "id", "score": 85, "reasons": ["reason1", "reason2"]}}]}}
             """
             
-            response = self.client.chat.completions.create(
+            response = self.gateway.chat(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are an expert at matching questions to relevant documents in due diligence processes. Return valid JSON only."},
@@ -99,12 +88,26 @@ class OpenAIService:
             result = json.loads(response.choices[0].message.content)
             return result.get("matches", [])
             
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return []
     
-    def generate_answer(self, question_title: str, question_content: str, document_contents: List[str]) -> Dict[str, Any]:
+    def generate_answer(self, question_title: str, question_content: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Answer a question from document chunks, packing as many as fit the context budget.
+        
+        Args:
+            question_title: Question title
+            question_content: Question details
+            chunks: Chunks ordered best first; each needs `content` and `document_name`
+                (and `document_id` to be reported as a source)
+        """
         try:
-            combined_content = "\n\n---\n\n".join(document_contents[:3])  # Limit to 3 docs
+            packed = self.context_packer.pack(
+                chunks,
+                format_chunk=lambda i, chunk: f"Document: {chunk['document_name']}\n{chunk['content']}\n\n---\n\n"
+            )
             
             prompt = f"""
             Based on the provided documents, answer the following question:
@@ -113,14 +116,14 @@ class OpenAIService:
             Details: {question_content}
             
             Relevant Documents:
-            {combined_content[:6000]}  # Limit to avoid token limits
+            {packed["text"]}
             
             Provide a comprehensive answer based only on the information in the documents.
             Include specific references to the documents when possible.
             If the documents don't contain enough information, clearly state what's missing.
             """
             
-            response = self.client.chat.completions.create(
+            response = self.gateway.chat(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are an expert analyst helping with due diligence questions. Provide accurate, well-reasoned answers based strictly on the provided documents."},
@@ -133,9 +136,12 @@ class OpenAIService:
             return {
                 "suggested_answer": response.choices[0].message.content,
                 "confidence": 0.8,  # Could be enhanced with more sophisticated confidence scoring
-                "sources": [f"Document {i+1}" for i in range(len(document_contents))]
+                "sources": list(dict.fromkeys(c["document_id"] for c in packed["chunks"] if c.get("document_id"))),
+                "context_stats": packed["stats"]
             }
             
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return {
                 "suggested_answer": f"Error generating answer: {str(e)}",
@@ -146,16 +152,17 @@ class OpenAIService:
     def extract_tags(self, document_content: str, document_name: str) -> List[str]:
         try:
             content_text = self._extract_text_from_base64(document_content)
+            packed = self.context_packer.pack_text(content_text, budget=600)
             
             prompt = f"""
             Extract 3-7 relevant tags for this document "{document_name}":
             
-            {content_text[:2000]}
+            {packed["text"]}
             
             Return only a JSON array of lowercase tags, like: ["financial", "contract", "legal"]
             """
             
-            response = self.client.chat.completions.create(
+            response = self.gateway.chat(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "Extract relevant tags for business documents. Return only valid JSON array."},
@@ -168,6 +175,8 @@ class OpenAIService:
             tags = json.loads(response.choices[0].message.content)
             return tags if isinstance(tags, list) else []
             
+        except (LLMUnavailableError, LLMRequestError):
+            raise
         except Exception as e:
             return ["document"]
     
@@ -0,0 +1,67 @@
+"""
+Lazily constructed, shared service instances.
+
+Importing the API only wires up the routes; the services behind them (the Chroma
+vector store, the LangChain agent, the document summarizer) are built the first
+time a request or job needs them. Every router and job gets the same instance, so
+the vector store is opened once per process instead of once per service.
+"""
+import threading
+from typing import Any, Callable, Dict
+
+_instances: Dict[str, Any] = {}
+# Reentrant because building one service can build the ones it depends on
+_lock = threading.RLock()
+
+
+def _get(name: str, factory: Callable[[], Any]) -> Any:
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = factory()
+                _instances[name] = instance
+    return instance
+
+
+def get_document_processor():
+    def build():
+        from services.document_processor import DocumentProcessor
+        return DocumentProcessor()
+    return _get("document_processor", build)
+
+
+def get_openai_service():
+    def build():
+        from services.openai_service import OpenAIService
+        return OpenAIService()
+    return _get("openai_service", build)
+
+
+def get_rag_service():
+    def build():
+        from services.agentic_rag import AgenticRAGService
+        return AgenticRAGService(doc_processor=get_document_processor())
+    return _get("rag_service", build)
+
+
+def get_document_summarizer():
+    def build():
+        from services.summarizer import DocumentSummarizer
+        return DocumentSummarizer(get_openai_service())
+    return _get("document_summarizer", build)
+
+
+def get_qa_automation_service():
+    def build():
+        from services.qa_automation import QAAutomationService
+        return QAAutomationService(doc_processor=get_document_processor(), rag_service=get_rag_service())
+    return _get("qa_automation_service", build)
+
+
+def get_batch_answering_engine():
+    def build():
+        from services.batch_answering import BatchAnsweringEngine
+        return BatchAnsweringEngine(get_qa_automation_service())
+    return _get("batch_answering_engine", build)
@@ -1,86 +1,111 @@
 """
 Q&A Automation service for automatically answering questions when documents are processed
 """
-import openai
 import json
 import logging
 from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from models import models
-from services.document_processor import DocumentProcessor
-from services.agentic_rag import AgenticRAGService
+from services.providers import get_document_processor, get_rag_service
+from services.llm_gateway import llm_gateway
+from services.question_embeddings import QuestionEmbeddingStore, score_questions_against_chunks
 import crud
 from datetime import datetime
 import os
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 class QAAutomationService:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.doc_processor = DocumentProcessor()
-        self.rag_service = AgenticRAGService()
+    def __init__(self, doc_processor=None, rag_service=None):
+        self.gateway = llm_gateway
+        self.doc_processor = doc_processor or get_document_processor()
+        self.rag_service = rag_service or get_rag_service()
+        self.question_embeddings = QuestionEmbeddingStore(self.doc_processor.embeddings)
+        # Cosine similarity a pending question must reach against one of a new document's chunks
+        self.auto_answer_threshold = float(os.getenv("AUTO_ANSWER_SIMILARITY_THRESHOLD", "0.8"))
         
-    def process_new_document(self, db: Session, document_id: str):
-        """Process a newly uploaded document and auto-answer related questions"""
+    def process_new_document(self, db: Session, document_id: str, progress_callback=None) -> int:
+        """
+        Process a newly uploaded document and auto-answer related questions.
+        
+        Instead of one vector search per pending question, the new document's chunk
+        embeddings are scored against every pending question's stored embedding in a
+        single matrix product; only questions scoring above the threshold go on to
+        answer generation.
+        """
+        answered = 0
         try:
             # Get all pending questions
-            pending_questions = crud.get_questions(db, status="pending")
+            pending_questions = crud.get_questions(db, status="pending", limit=None)
             
             if not pending_questions:
                 logger.info("No pending questions to process")
-                return
+                return 0
+            
+            chunks, chunk_vectors = self.doc_processor.get_chunk_embeddings(document_id)
+            if not chunks:
+                logger.info(f"No indexed chunks for document {document_id}")
+                return 0
             
-            # Process each question against the new document
-            for question in pending_questions:
-                self.try_answer_question(db, question, document_id)
+            question_matrix = self.question_embeddings.get_matrix(db, pending_questions)
+            best_scores, top_chunks = score_questions_against_chunks(
+                question_matrix, np.asarray(chunk_vectors, dtype=np.float32)
+            )
+            
+            candidates = [
+                (pending_questions[i], [chunks[j] for j in top_chunks[i]])
+                for i in np.argsort(-best_scores)
+                if best_scores[i] >= self.auto_answer_threshold
+            ]
+            logger.info(
+                f"Document {document_id} matched {len(candidates)} of {len(pending_questions)} pending questions "
+                f"(threshold {self.auto_answer_threshold})"
+            )
+            
+            # Answers are generated one by one but recorded together in one transaction at the end;
+            # if the job dies first, the questions are still pending and the retried job answers them
+            answers = []
+            for i, (question, matched_chunks) in enumerate(candidates, 1):
+                answer_text = self.generate_document_answer(question, document_id, matched_chunks)
+                if answer_text:
+                    answers.append({
+                        "question_id": question.id,
+                        "answer": answer_text,
+                        "user_id": None,  # System-generated answer
+                        "related_documents": [document_id]
+                    })
+                if progress_callback:
+                    progress_callback(i, len(candidates))
+            
+            answered = len(crud.answer_questions(db, answers))
+            logger.info(f"Auto-answered {answered} questions using document {document_id}")
                 
         except Exception as e:
             logger.error(f"Error in process_new_document: {e}")
+        return answered
     
-    def try_answer_question(self, db: Session, question: models.Question, document_id: str):
-        """Try to answer a question using the newly processed document"""
+    def generate_document_answer(self, question: models.Question, document_id: str,
+                                 matched_chunks: List[Dict[str, Any]]) -> Optional[str]:
+        """Answer text for a question the new document scored as relevant for, or None if it can't be answered."""
         try:
-            # Search for relevant content in the new document
-            relevant_docs = self.doc_processor.search_similar_documents(
-                query=question.content,
-                k=3,
-                score_threshold=0.3
-            )
-            
-            # Check if any relevant docs are from the new document
-            new_doc_chunks = [doc for doc in relevant_docs if doc.get("document_id") == document_id]
-            
-            if not new_doc_chunks:
-                logger.info(f"New document {document_id} not relevant for question {question.id}")
-                return
-            
             # Use agentic RAG to generate answer
-            rag_response = self.rag_service.answer_question(
-                question=question.content,
-                context=f"Focus on information related to document ID: {document_id}"
+            rag_response = self.rag_service.answer(
+                question.content,
+                context=f"Focus on information related to document ID: {document_id}",
+                source="tracker"
             )
             
-            if not rag_response.get("response") or "I don't have information" in rag_response.get("response", ""):
+            if not rag_response.get("success") or "I don't have information" in rag_response.get("answer", ""):
                 logger.info(f"No relevant content found for question {question.id}")
-                return
+                return None
             
             # Generate a concise answer with sources
-            answer_text = self.generate_concise_answer(question.content, rag_response["response"], new_doc_chunks)
-            
-            # Auto-answer the question
-            crud.answer_question(
-                db=db,
-                question_id=question.id,
-                answer=answer_text,
-                user_id=None,  # System-generated answer
-                related_documents=[document_id]
-            )
-            
-            logger.info(f"Auto-answered question {question.id} using document {document_id}")
+            return self.generate_concise_answer(question.content, rag_response["answer"], matched_chunks)
             
         except Exception as e:
             logger.error(f"Error answering question {question.id}: {e}")
+            return None
     
     def generate_concise_answer(self, question: str, rag_response: str, sources: List[Dict]) -> str:
         """Generate a concise answer with source citations"""
@@ -109,7 +134,7 @@ Requirements:
 
 Answer:"""
 
-            response = self.client.chat.completions.create(
+            response = self.gateway.chat(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=200,
@@ -129,47 +154,10 @@ Answer:"""
             # Fallback to RAG response
             return rag_response[:300] + "..." if len(rag_response) > 300 else rag_response
     
-    def batch_process_questions(self, db: Session, question_ids: List[str]) -> Dict[str, Any]:
-        """Process multiple questions at once against all available documents"""
-        results = {
-            "answered": [],
-            "no_answer": [],
-            "errors": []
-        }
-        
-        try:
-            for question_id in question_ids:
-                question = crud.get_question(db, question_id)
-                if not question:
-                    results["errors"].append(f"Question {question_id} not found")
-                    continue
-                
-                if question.status != "pending":
-                    results["errors"].append(f"Question {question_id} is not pending")
-                    continue
-                
-                # Try to answer using all available documents
-                answer_result = self.try_answer_with_all_docs(db, question)
-                
-                if answer_result["answered"]:
-                    results["answered"].append({
-                        "question_id": question_id,
-                        "answer": answer_result["answer"],
-                        "sources": answer_result["sources"]
-                    })
-                else:
-                    results["no_answer"].append(question_id)
-        
-        except Exception as e:
-            logger.error(f"Error in batch processing: {e}")
-            results["errors"].append(str(e))
-        
-        return results
-    
     def try_answer_with_all_docs(self, db: Session, question: models.Question) -> Dict[str, Any]:
         """Try to answer a question using all available processed documents"""
         try:
-            # First check if there are relevant documents
+            # First check if there are relevant documents; no generation call when there are none
             relevant_docs = self.doc_processor.search_similar_documents(
                 query=question.content,
                 k=5,
@@ -180,17 +168,24 @@ Answer:"""
                 logger.info(f"No relevant documents found for question {question.id}")
                 return {"answered": False}
             
-            relevant_doc_ids = list(set([doc.get("document_id") for doc in relevant_docs if doc.get("document_id")]))
+            relevant_doc_ids = list(dict.fromkeys(doc["document_id"] for doc in relevant_docs if doc.get("document_id")))
             
-            # Use agentic RAG to answer the question
-            rag_response = self.rag_service.answer_question(question.content)
+            # Answer from exactly these hits, so the cited documents are the ones the answer rests on
+            packed = self.rag_service.context_packer.pack(relevant_docs)
+            rag_response = self.rag_service.answer(
+                question.content,
+                mode="fast",
+                context=f"Based on the following document excerpts:\n\n{packed['text']}",
+                source="tracker",
+                search=False
+            )
             
-            if not rag_response.get("response") or "I don't have information" in rag_response.get("response", ""):
+            if not rag_response.get("success") or "I don't have information" in rag_response.get("answer", ""):
                 logger.info(f"RAG could not answer question {question.id}")
                 return {"answered": False}
             
             # Generate a shorter, more direct answer
-            answer_text = rag_response["response"]
+            answer_text = rag_response["answer"]
             
             # Update question in database
             updated_question = crud.answer_question(
@@ -215,6 +210,3 @@ Answer:"""
         except Exception as e:
             logger.error(f"Error answering question {question.id}: {e}")
             return {"answered": False, "error": str(e)}
-
-# Global instance
-qa_automation_service = QAAutomationService()
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+Near-duplicate question detection with MinHash/LSH over word shingles, optionally
+backed by embedding similarity for paraphrases that share few words.
+"""
+import re
+import zlib
+from typing import List, Dict, Any, Set, Tuple
+
+import numpy as np
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Word n-gram shingles of the normalized text."""
+    words = re.sub(r"[^a-z0-9\s]", " ", text.lower()).split()
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHashLSH:
+    """
+    MinHash signatures with banded locality-sensitive hashing.
+    
+    With the defaults (64 permutations in 16 bands of 4 rows) pairs above roughly 0.5
+    Jaccard similarity are very likely to share a bucket; candidates are then checked
+    against the exact shingle Jaccard.
+    """
+    
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = {}
+    
+    def signature(self, shingle_set: Set[str]) -> np.ndarray:
+        if not shingle_set:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingle_set], dtype=np.uint64)
+        # Universal hashing (a * x + b) mod p, one row per permutation
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1)
+    
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def insert(self, key: str, signature: np.ndarray):
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(key)
+    
+    def query(self, signature: np.ndarray) -> Set[str]:
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, []))
+        return candidates
+
+
+class QuestionDeduplicator:
+    """
+    Assigns each incoming question to an existing canonical question, an earlier
+    question in the same upload, or itself.
+    
+    Args:
+        jaccard_threshold: Minimum shingle Jaccard for a near-duplicate
+        embeddings: Optional LangChain embeddings object; when given, questions without a
+            lexical match are also compared by cosine similarity
+        embedding_threshold: Minimum cosine similarity for an embedding match
+    """
+    
+    def __init__(self, jaccard_threshold: float = 0.7, embeddings=None, embedding_threshold: float = 0.95):
+        self.jaccard_threshold = jaccard_threshold
+        self.embeddings = embeddings
+        self.embedding_threshold = embedding_threshold
+    
+    def assign(self, new_questions: List[str], existing: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Match new question texts against existing (id, content) canonical questions.
+        
+        Returns one entry per new question, in order, with `duplicate_of` set to an
+        existing question ID, `duplicate_of_index` set to an earlier new question, or
+        neither when the question is canonical, plus the matching `similarity` and `method`.
+        """
+        lsh = MinHashLSH()
+        shingle_sets: Dict[str, Set[str]] = {}
+        for question_id, content in existing:
+            shingle_sets[question_id] = shingles(content)
+            lsh.insert(question_id, lsh.signature(shingle_sets[question_id]))
+        
+        assignments = []
+        for index, text in enumerate(new_questions):
+            own = shingles(text)
+            best_key, best_score = None, 0.0
+            for candidate in lsh.query(lsh.signature(own)):
+                score = jaccard(own, shingle_sets[candidate])
+                if score > best_score:
+                    best_key, best_score = candidate, score
+            
+            assignment = {"duplicate_of": None, "duplicate_of_index": None, "similarity": None, "method": None}
+            if best_key is not None and best_score >= self.jaccard_threshold:
+                assignment.update(similarity=round(best_score, 3), method="minhash")
+                self._link(assignment, best_key)
+            else:
+                # Canonical so far: later questions in this upload may link to it
+                key = f"new:{index}"
+                shingle_sets[key] = own
+                lsh.insert(key, lsh.signature(own))
+            assignments.append(assignment)
+        
+        if self.embeddings is not None:
+            self._assign_by_embedding(new_questions, existing, assignments)
+        return assignments
+    
+    @staticmethod
+    def _link(assignment: Dict[str, Any], key: str):
+        if key.startswith("new:"):
+            assignment["duplicate_of_index"] = int(key[4:])
+        else:
+            assignment["duplicate_of"] = key
+    
+    def _assign_by_embedding(self, new_questions: List[str], existing: List[Tuple[str, str]],
+                             assignments: List[Dict[str, Any]]):
+        unmatched = [i for i, a in enumerate(assignments) if a["method"] is None]
+        if not unmatched:
+            return
+        
+        texts = [content for _, content in existing] + [new_questions[i] for i in unmatched]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        keys = [question_id for question_id, _ in existing] + [f"new:{i}" for i in unmatched]
+        
+        for position, index in enumerate(unmatched):
+            row = len(existing) + position
+            # Only compare against existing questions and earlier new questions
+            scores = vectors[:row] @ vectors[row]
+            if scores.size == 0:
+                continue
+            best = int(np.argmax(scores))
+            if scores[best] >= self.embedding_threshold and assignments[index]["method"] is None:
+                target = keys[best]
+                if target.startswith("new:") and assignments[int(target[4:])]["method"] is not None:
+                    continue  # The earlier question is itself a duplicate; skip chained links
+                assignments[index].update(similarity=round(float(scores[best]), 3), method="embedding")
+                self._link(assignments[index], target)
+
+
+def build_clusters(rows: List[Tuple[str, str, str, str]]) -> List[Dict[str, Any]]:
+    """Group (duplicate_id, duplicate_title, canonical_id, canonical_title) rows by canonical question."""
+    clusters: Dict[str, Dict[str, Any]] = {}
+    for duplicate_id, duplicate_title, canonical_id, canonical_title in rows:
+        cluster = clusters.setdefault(canonical_id, {
+            "canonical_id": canonical_id,
+            "canonical_title": canonical_title,
+            "duplicates": []
+        })
+        cluster["duplicates"].append({"id": duplicate_id, "title": duplicate_title})
+    return list(clusters.values())
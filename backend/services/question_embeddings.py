@@ -0,0 +1,85 @@
+"""
+Stored question embeddings and batched question-to-chunk similarity scoring.
+"""
+import hashlib
+from typing import List, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import models
+import crud
+
+
+def vector_to_bytes(vector) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def bytes_to_vector(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def question_text(question: models.Question) -> str:
+    return question.content
+
+
+class QuestionEmbeddingStore:
+    """Keeps one embedding per question in the database, computing missing or stale ones in a single batch."""
+    
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", "unknown")
+    
+    def get_matrix(self, db: Session, questions: List[models.Question]) -> np.ndarray:
+        """Return a (len(questions), dims) float32 matrix aligned with `questions`."""
+        if not questions:
+            return np.zeros((0, 0), dtype=np.float32)
+        
+        stored = {row.question_id: row for row in crud.get_question_embeddings(db, [q.id for q in questions])}
+        vectors = {}
+        missing = []
+        for question in questions:
+            content_hash = hashlib.sha256(question_text(question).encode("utf-8")).hexdigest()
+            row = stored.get(question.id)
+            if row is not None and row.model == self.model and row.content_hash == content_hash:
+                vectors[question.id] = bytes_to_vector(row.embedding)
+            else:
+                missing.append((question, content_hash))
+        
+        if missing:
+            # One embedding request for every question that has no current vector
+            new_vectors = self.embeddings.embed_documents([question_text(q) for q, _ in missing])
+            crud.save_question_embeddings(db, [
+                {
+                    "question_id": question.id,
+                    "model": self.model,
+                    "content_hash": content_hash,
+                    "dimensions": len(vector),
+                    "embedding": vector_to_bytes(vector)
+                }
+                for (question, content_hash), vector in zip(missing, new_vectors)
+            ])
+            for (question, _), vector in zip(missing, new_vectors):
+                vectors[question.id] = np.asarray(vector, dtype=np.float32)
+        
+        return np.vstack([vectors[q.id] for q in questions])
+
+
+def score_questions_against_chunks(question_matrix: np.ndarray, chunk_matrix: np.ndarray,
+                                   top_n: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cosine-score every question against every chunk in one matrix product.
+    
+    Returns each question's best score and the indices of its top_n chunks, best first.
+    """
+    scores = normalize_rows(question_matrix) @ normalize_rows(chunk_matrix).T
+    top_n = min(top_n, scores.shape[1])
+    top_chunks = np.argsort(-scores, axis=1)[:, :top_n]
+    best_scores = scores[np.arange(scores.shape[0]), top_chunks[:, 0]]
+    return best_scores, top_chunks
@@ -1,21 +1,28 @@
 """
 Question processing service for parsing uploaded files and text input
 """
-import openpyxl
-import pypdf
-from docx import Document as DocxDocument
 import re
 import uuid
 from typing import List, Dict, Any, Tuple
 from sqlalchemy.orm import Session
 from models.schemas import QuestionCreate
-from crud import create_question
+from crud import create_question, create_questions_bulk, get_canonical_question_texts
+from services.question_dedup import QuestionDeduplicator
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
 class QuestionProcessor:
     def __init__(self):
+        self.deduplicator = QuestionDeduplicator(
+            jaccard_threshold=float(os.getenv("QUESTION_DEDUP_JACCARD", "0.7")),
+            embeddings=self._dedup_embeddings(),
+            embedding_threshold=float(os.getenv("QUESTION_DEDUP_COSINE", "0.95"))
+        )
+        # Rows per multi-row INSERT when saving an upload
+        self.insert_batch_size = int(os.getenv("QUESTION_INSERT_BATCH", "500"))
         self.question_patterns = [
             r'^(\d+[\.\)])\s*(.+)$',  # 1. Question or 1) Question
             r'^[•\-\*]\s*(.+)$',      # • Question or - Question or * Question
@@ -23,6 +30,14 @@ class QuestionProcessor:
             r'^Question\s*\d*:?\s*(.+)$',  # Question: or Question 1:
         ]
     
+    @staticmethod
+    def _dedup_embeddings():
+        """Embedding similarity is opt-in (QUESTION_DEDUP_EMBEDDINGS=true) since it costs an API call per upload."""
+        if os.getenv("QUESTION_DEDUP_EMBEDDINGS", "false").lower() != "true":
+            return None
+        from services.llm_gateway import llm_gateway
+        return llm_gateway.embeddings(model="text-embedding-ada-002")
+    
     def extract_questions_from_text(self, text: str) -> List[str]:
         """Extract individual questions from text input"""
         lines = text.strip().split('\n')
@@ -167,39 +182,85 @@ class QuestionProcessor:
         return questions
     
     def create_questions_from_upload(self, db: Session, questions: List[str], user_id: str, source_file: str = None) -> List[Dict[str, Any]]:
-        """Create question records in database from extracted questions"""
-        created_questions = []
+        """
+        Create question records in database from extracted questions, linking near-duplicates to a
+        canonical question. All rows are inserted in one transaction; if that fails, questions are
+        created one at a time so a single bad row doesn't lose the whole upload.
+        """
+        # Match each incoming question against the uploader's canonical questions and earlier ones in this upload
+        assignments = self.deduplicator.assign(questions, get_canonical_question_texts(db, user_id))
         
-        for i, question_text in enumerate(questions):
+        entries = []
+        for question_text, assignment in zip(questions, assignments):
             # Generate title from first part of question
             title = question_text[:50] + "..." if len(question_text) > 50 else question_text
             
             # Categorize the question
             categories = self.categorize_question(question_text)
             
-            question_data = QuestionCreate(
-                title=title,
-                content=question_text,
-                priority="medium",  # Default priority
-                tags=categories + ([f"source:{source_file}"] if source_file else [])
-            )
-            
+            entries.append({
+                "title": title,
+                "content": question_text,
+                "priority": "medium",  # Default priority
+                "tags": categories + ([f"source:{source_file}"] if source_file else []),
+                "duplicate_of_id": assignment["duplicate_of"],
+                "duplicate_of_index": assignment["duplicate_of_index"]
+            })
+        
+        start = time.perf_counter()
+        try:
+            rows = create_questions_bulk(db, entries, user_id, batch_size=self.insert_batch_size)
+        except Exception as e:
+            logger.error(f"Bulk insert of {len(entries)} questions failed, inserting one at a time: {e}")
+            rows = self._create_questions_one_by_one(db, entries, user_id)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Inserted {len(rows)} questions in {elapsed:.3f}s ({len(rows) / max(elapsed, 1e-9):.0f} rows/s)")
+        
+        created_questions = [
+            {
+                "id": row["id"],
+                "title": row["title"],
+                "content": row["content"],
+                "status": row["status"],
+                "priority": row["priority"],
+                "tags": row["tags"],
+                "asked_at": row["asked_at"].isoformat(),
+                "answer": row["answer"],
+                "answered_at": row["answered_at"],
+                "duplicate_of": row["duplicate_of_id"],
+                "duplicate_similarity": assignment["similarity"] if row["duplicate_of_id"] else None
+            }
+            for row, assignment in zip(rows, assignments) if row
+        ]
+        
+        duplicates = sum(1 for q in created_questions if q["duplicate_of"])
+        if duplicates:
+            logger.info(f"Linked {duplicates} of {len(created_questions)} uploaded questions to existing canonical questions")
+        
+        return created_questions
+    
+    def _create_questions_one_by_one(self, db: Session, entries: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+        """Fallback path: one commit per question; failed rows come back as None so positions still line up."""
+        rows = []
+        for i, entry in enumerate(entries):
+            duplicate_of = entry["duplicate_of_id"]
+            if entry["duplicate_of_index"] is not None:
+                # Links to an earlier question in this upload; None if that one failed to insert
+                earlier = rows[entry["duplicate_of_index"]]
+                duplicate_of = earlier["id"] if earlier else None
             try:
-                db_question = create_question(db, question_data, user_id)
-                created_questions.append({
-                    "id": db_question.id,
-                    "title": db_question.title,
-                    "content": db_question.content,
-                    "status": db_question.status,
-                    "priority": db_question.priority,
-                    "tags": db_question.tags,
-                    "asked_at": db_question.asked_at.isoformat()
-                })
+                question_data = QuestionCreate(title=entry["title"], content=entry["content"],
+                                               priority=entry["priority"], tags=entry["tags"])
+                db_question = create_question(db, question_data, user_id, duplicate_of_id=duplicate_of)
+                rows.append({column: getattr(db_question, column) for column in (
+                    "id", "title", "content", "status", "priority", "tags", "asked_at",
+                    "answer", "answered_at", "duplicate_of_id"
+                )})
             except Exception as e:
+                db.rollback()
                 logger.error(f"Error creating question {i+1}: {e}")
-                continue
-        
-        return created_questions
+                rows.append(None)
+        return rows
 
 # Global instance
 question_processor = QuestionProcessor()
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Token-bucket rate limiting shared between threads.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`.
+    
+    Callers block in acquire() until enough tokens are available, so every thread
+    sharing a bucket is held to the same overall rate.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def per_minute(cls, amount: float, burst: Optional[float] = None) -> "TokenBucket":
+        return cls(rate=amount / 60.0, capacity=burst if burst is not None else max(amount / 60.0, 1.0))
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+    
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+    
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until `tokens` are available; returns False if `timeout` expires first."""
+        # Requests larger than the bucket can never fit, so cap them at a full bucket
+        tokens = min(tokens, self.capacity)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+# Shared across all batch-answering workers in this process
+answer_rate_limiter = TokenBucket.per_minute(
+    float(os.getenv("BATCH_ANSWERS_PER_MINUTE", "60")),
+    burst=float(os.getenv("BATCH_ANSWERS_BURST", "4"))
+)
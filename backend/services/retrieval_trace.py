@@ -0,0 +1,115 @@
+"""
+Retrieval trace recorded while the agent searches the vector store, so callers can
+reuse the chunks the agent actually saw instead of searching a second time.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional
+
+_current_trace: ContextVar[Optional["RetrievalTrace"]] = ContextVar("retrieval_trace", default=None)
+
+
+class RetrievalTrace:
+    """Ordered record of the searches run for one answer and the chunks they returned."""
+    
+    def __init__(self):
+        self.searches: List[Dict[str, Any]] = []
+    
+    def record(self, query: str, k: int, results: List[Dict[str, Any]]):
+        """Record one search pass and its hits, keeping the rank each hit came back at."""
+        self.searches.append({
+            "query": query,
+            "k": k,
+            "hits": [
+                {
+                    "rank": rank,
+                    "chunk_id": doc.get("chunk_id"),
+                    "document_id": doc.get("document_id"),
+                    "document_name": doc.get("document_name"),
+                    "chunk_index": doc.get("chunk_index"),
+                    "start_position": doc.get("start_position", 0),
+                    "end_position": doc.get("end_position", 0),
+                    "similarity_score": doc.get("similarity_score", 0.0),
+                    "content": doc.get("content", "")
+                }
+                for rank, doc in enumerate(results, 1)
+            ]
+        })
+    
+    @property
+    def used_retrieval(self) -> bool:
+        return len(self.searches) > 0
+    
+    def hits(self, min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """Unique chunks across all searches, best score first."""
+        best: Dict[str, Dict[str, Any]] = {}
+        for search in self.searches:
+            for hit in search["hits"]:
+                if hit["similarity_score"] < min_score:
+                    continue
+                key = hit["chunk_id"] or f"{hit['document_id']}:{hit['chunk_index']}"
+                if key not in best or hit["similarity_score"] > best[key]["similarity_score"]:
+                    best[key] = {**hit, "query": search["query"]}
+        return sorted(best.values(), key=lambda h: h["similarity_score"], reverse=True)
+    
+    def document_ids(self, min_score: float = 0.0, limit: Optional[int] = None) -> List[str]:
+        """Distinct document IDs ordered by their best-scoring chunk."""
+        doc_ids = []
+        for hit in self.hits(min_score):
+            if hit["document_id"] and hit["document_id"] not in doc_ids:
+                doc_ids.append(hit["document_id"])
+        return doc_ids[:limit] if limit is not None else doc_ids
+    
+    def document_names(self) -> List[str]:
+        names = []
+        for hit in self.hits():
+            if hit["document_name"] and hit["document_name"] not in names:
+                names.append(hit["document_name"])
+        return names
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "searches": [
+                {
+                    "query": search["query"],
+                    "k": search["k"],
+                    "hits": [
+                        {key: value for key, value in hit.items() if key != "content"}
+                        for hit in search["hits"]
+                    ]
+                }
+                for search in self.searches
+            ],
+            "hits": self.hits()
+        }
+
+
+@contextmanager
+def collect_retrieval_trace():
+    """Make a fresh trace current for the duration of one agent run, joining an enclosing one if present."""
+    trace = _current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = RetrievalTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_search(query: str, k: int, results: List[Dict[str, Any]]):
+    """Record a search into the current trace, if one is being collected."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(query, k, results)
+
+
+def trace_document_ids(retrieval_trace: Dict[str, Any], min_score: float = 0.0, limit: Optional[int] = None) -> List[str]:
+    """Distinct document IDs from a serialized trace, ordered by their best-scoring chunk."""
+    doc_ids = []
+    for hit in retrieval_trace.get("hits", []):
+        if hit["similarity_score"] >= min_score and hit["document_id"] and hit["document_id"] not in doc_ids:
+            doc_ids.append(hit["document_id"])
+    return doc_ids[:limit] if limit is not None else doc_ids
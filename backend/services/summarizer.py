@@ -0,0 +1,172 @@
+"""
+Map-reduce summarization of long documents over their stored chunks.
+
+Chunks are grouped, each group is summarized concurrently through the LLM gateway
+(map), and the partial summaries are combined into the document analysis (reduce),
+in several rounds when they don't fit one prompt. Every partial summary is cached by
+the hash of its inputs, so re-analysing an edited document only recomputes the
+groups whose chunks changed.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy.orm import Session
+
+from models import models
+from services.context_packer import count_tokens
+from services.llm_gateway import llm_gateway
+import crud
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompts change so cached summaries from old prompts aren't reused
+SUMMARY_PROMPT_VERSION = "1"
+
+MAP_PROMPT = """Summarize this excerpt from the document "{name}" for a due diligence reviewer.
+Keep concrete facts: parties, amounts, dates, obligations, risks and anything unusual. Use at most 150 words.
+
+Excerpt:
+{text}"""
+
+REDUCE_PROMPT = """Combine these partial summaries of consecutive parts of the document "{name}" into one summary
+that keeps the most important facts, figures and risks. Use at most 300 words.
+
+Partial summaries:
+{text}"""
+
+ANALYSIS_PROMPT = """
+Analyze the document "{name}" from the summaries of its parts below and provide:
+1. A concise summary (2-3 sentences)
+2. Key points (3-5 bullet points)
+3. Suggested tags (3-5 relevant tags)
+
+Summaries of the document's parts, in order:
+{text}
+"""
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DocumentSummarizer:
+    def __init__(self, openai_service, gateway=llm_gateway, model: str = "gpt-4o-mini"):
+        self.openai_service = openai_service
+        self.gateway = gateway
+        self.model = model
+        self.max_workers = int(os.getenv("SUMMARY_WORKERS", "4"))
+        # Groups end at content-defined boundaries (about every SUMMARY_GROUP_CHUNKS chunks) or at
+        # SUMMARY_GROUP_TOKENS, so an edit only moves the boundaries of the groups around it
+        self.group_chunks = int(os.getenv("SUMMARY_GROUP_CHUNKS", "6"))
+        self.group_tokens = int(os.getenv("SUMMARY_GROUP_TOKENS", "3000"))
+        self.reduce_tokens = int(os.getenv("SUMMARY_REDUCE_TOKENS", "6000"))
+    
+    def group_chunks_by_content(self, chunks: List[str]) -> List[List[str]]:
+        """Consecutive chunks split where a chunk's hash hits the boundary condition or the group gets too large."""
+        groups, current, tokens = [], [], 0
+        for content in chunks:
+            chunk_tokens = count_tokens(content, self.model)
+            if current and tokens + chunk_tokens > self.group_tokens:
+                groups.append(current)
+                current, tokens = [], 0
+            current.append(content)
+            tokens += chunk_tokens
+            if int(_hash(content)[:8], 16) % self.group_chunks == 0:
+                groups.append(current)
+                current, tokens = [], 0
+        if current:
+            groups.append(current)
+        return groups
+    
+    def analyze(self, db: Session, document: models.Document) -> Optional[Dict[str, Any]]:
+        """
+        Analyze a document from its stored chunks.
+        
+        Returns:
+            Dictionary with summary, key_points, suggested_tags and `summary_stats`, or None
+            when the document has no stored chunks (not processed yet)
+        """
+        chunks = [row.content for row in crud.get_document_chunk_rows(db, document.id)]
+        if not chunks:
+            return None
+        
+        stats = {"chunks": len(chunks), "groups": 0, "cached": 0, "computed": 0, "reduce_rounds": 0}
+        groups = self.group_chunks_by_content(chunks)
+        stats["groups"] = len(groups)
+        partials = self._summarize_all(db, document.name, "map", MAP_PROMPT, ["\n\n".join(g) for g in groups], stats)
+        
+        # Reduce in rounds until the partial summaries fit one analysis prompt
+        while len(partials) > 1 and count_tokens("\n\n".join(partials), self.model) > self.reduce_tokens:
+            stats["reduce_rounds"] += 1
+            batches = self._batches(partials)
+            partials = self._summarize_all(db, document.name, "reduce", REDUCE_PROMPT, ["\n\n".join(b) for b in batches], stats)
+        
+        response = self.gateway.chat(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "You are an expert document analyzer for due diligence processes. Provide structured analysis of business documents."},
+                {"role": "user", "content": ANALYSIS_PROMPT.format(name=document.name, text="\n\n".join(partials))}
+            ],
+            max_tokens=500,
+            temperature=0.3,
+            caller="summarize"
+        )
+        analysis = self.openai_service._parse_analysis_response(response.choices[0].message.content)
+        analysis["summary_stats"] = stats
+        logger.info(f"Summarized {document.name}: {stats}")
+        return analysis
+    
+    def _batches(self, partials: List[str]) -> List[List[str]]:
+        """Consecutive partial summaries packed into batches that each fit a reduce prompt."""
+        batches, current, tokens = [], [], 0
+        for partial in partials:
+            partial_tokens = count_tokens(partial, self.model)
+            if current and tokens + partial_tokens > self.reduce_tokens:
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(partial)
+            tokens += partial_tokens
+        if current:
+            batches.append(current)
+        # Always make progress, even if every summary is individually large
+        if len(batches) == len(partials) and len(partials) > 1:
+            batches = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        return batches
+    
+    def _summarize_all(self, db: Session, name: str, stage: str, prompt: str,
+                       texts: List[str], stats: Dict[str, int]) -> List[str]:
+        """Summarize each text, reusing cached summaries and computing the rest concurrently."""
+        hashes = [_hash(self.model, SUMMARY_PROMPT_VERSION, stage, text) for text in texts]
+        cached = crud.get_cached_summaries(db, list(set(hashes)))
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        stats["cached"] += len(texts) - len(missing)
+        stats["computed"] += len(missing)
+        
+        if missing:
+            def summarize(text: str) -> str:
+                response = self.gateway.chat(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt.format(name=name, text=text)}],
+                    max_tokens=400,
+                    temperature=0.2,
+                    caller="summarize"
+                )
+                return response.choices[0].message.content.strip()
+            
+            # The gateway paces these against the model's rate limits and the caller's quota
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                computed = dict(zip(missing, executor.map(summarize, missing.values())))
+            crud.save_cached_summaries(db, [
+                {"content_hash": h, "model": self.model, "stage": stage, "summary": summary}
+                for h, summary in computed.items()
+            ])
+            cached.update(computed)
+        
+        return [cached[h] for h in hashes]
@@ -0,0 +1,102 @@
+"""
+TTL cache of authenticated users, keyed by the token subject (the user's email).
+
+`auth.get_current_user` runs on every authenticated request, and the frontend makes
+many of them per page load. A cache hit attaches a detached copy of the user to the
+request session with `Session.merge(load=False)`, which issues no query. Entries are
+dropped when a User row is updated or deleted through the ORM, after the transaction
+commits, and expire after USER_CACHE_TTL_SECONDS in any case.
+
+Invalidation only reaches the process that made the change. Other API workers and
+worker.py processes keep authenticating a deleted or demoted user with the old row
+until their entry expires, so the TTL is the cross-process staleness window and is
+kept short.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models import models
+
+# Columns copied into the cached snapshot; the password hash is left unloaded
+CACHED_COLUMNS = ("id", "email", "name", "role", "created_at")
+
+
+class UserCache:
+    def __init__(self, ttl_seconds: float = 10.0, max_entries: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, email: str) -> Optional[models.User]:
+        """A detached snapshot of the user, or None if not cached or expired."""
+        if self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[email]
+                return None
+            self._entries.move_to_end(email)
+            return user
+    
+    def put(self, user: models.User):
+        if self.ttl_seconds <= 0:
+            return
+        snapshot = models.User(**{column: getattr(user, column) for column in CACHED_COLUMNS})
+        make_transient_to_detached(snapshot)
+        with self._lock:
+            self._entries[user.email] = (time.monotonic() + self.ttl_seconds, snapshot)
+            self._entries.move_to_end(user.email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, email: str):
+        with self._lock:
+            self._entries.pop(email, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Global instance
+user_cache = UserCache(
+    ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "10")),
+    max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "1000"))
+)
+
+_PENDING_KEY = "user_cache_invalidate"
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _user_changed(mapper, connection, target):
+    # Both the old and the new email, in case the change renamed the user
+    emails = {target.email, *inspect(target).attrs.email.history.deleted}
+    for email in emails:
+        user_cache.invalidate(email)
+    # Dropped again after commit, in case a concurrent request re-cached the old row meanwhile
+    session = inspect(target).session
+    if session is not None:
+        session.info.setdefault(_PENDING_KEY, set()).update(emails)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for email in session.info.pop(_PENDING_KEY, ()):
+        user_cache.invalidate(email)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
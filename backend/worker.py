@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Run background job workers in their own process: python worker.py [--workers N]"""
+import argparse
+import logging
+import signal
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import engine
+from models import models
+from migrations import run_migrations
+from services.job_queue import JobWorker
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NextGenVDR background job worker")
+    parser.add_argument("--workers", type=int, default=1, help="Worker threads in this process")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between polls when idle")
+    args = parser.parse_args()
+    
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    
+    workers = [JobWorker(poll_interval=args.poll_interval) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    stop.wait()
+    
+    # Jobs interrupted here keep their lease until it expires, then another worker resumes them
+    for worker in workers:
+        worker.stop(timeout=30)